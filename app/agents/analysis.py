@@ -1,7 +1,7 @@
 from crewai import Agent
 from app.core.llm import get_llm
 from app.tools.analysis_tools import descriptive_statistics
-from app.tools.statistics_tools import chi_square_test, cronbach_alpha
+from app.tools.statistics_tools import chi_square_test, cronbach_alpha, association_matrix, group_comparison, logistic_regression, multi_select_analysis
 from app.tools.visualization_tools import countplot, barplot, piechart
 import pandas as pd
 import os
@@ -50,6 +50,10 @@ analysis_agent = Agent(
         descriptive_statistics,
         chi_square_test,
         cronbach_alpha,
+        association_matrix,
+        group_comparison,
+        logistic_regression,
+        multi_select_analysis,
         countplot,
         barplot,
         piechart,
@@ -2,7 +2,7 @@ from crewai import Agent
 from app.core.llm import get_llm
 from app.agents.prompts import ORCHESTRATOR_PROMPT
 from app.tools.analysis_tools import descriptive_statistics
-from app.tools.statistics_tools import chi_square_test, cronbach_alpha
+from app.tools.statistics_tools import chi_square_test, cronbach_alpha, association_matrix, group_comparison, logistic_regression, multi_select_analysis
 from app.tools.visualization_tools import countplot, barplot, piechart
 from app.tools.literature_tools import search_pubmed, search_arxiv
 
@@ -27,7 +27,8 @@ orchestrator_agent = Agent(
         "5. Your output must be ONLY structured JSON."
     ),
     tools=[
-        descriptive_statistics, chi_square_test, cronbach_alpha, 
+        descriptive_statistics, chi_square_test, cronbach_alpha, association_matrix, group_comparison,
+        logistic_regression, multi_select_analysis,
         countplot, barplot, piechart,
         search_pubmed, search_arxiv
     ],
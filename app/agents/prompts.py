@@ -106,10 +106,17 @@ Return STRICT JSON in the following format ONLY:
 
   "analysis_plan": [
     {
-      "tool": "descriptive_statistics" | "chi_square_test" | "cronbach_alpha" | "countplot" | "barplot" | "piechart",
+      "tool": "descriptive_statistics" | "chi_square_test" | "cronbach_alpha" | "association_matrix" | "group_comparison" | "logistic_regression" | "multi_select_analysis" | "countplot" | "barplot" | "piechart",
       "reason": string,
       "visualizations_requested": true | false,
       "column": string | null,
+      "hue": string | null,   # plots only: comparison column; chi_square_test takes its second variable from "predictors"
+      "items": [string] | null,   # cronbach_alpha only: the scale's item columns
+      "outcomes": [string] | null,   # group_comparison: numeric columns to compare; logistic_regression: the binary outcome
+      "predictors": [string] | null,   # logistic_regression only: explanatory columns
+      "groups": [string] | null,   # group_comparison: columns defining the groups; multi_select_analysis: columns to crosstab options against
+      "approximate": true | false | null,   # descriptive_statistics and plots: fast sketch/sample estimates
+      "multi_select": true | false | null,   # countplot only: "column" is a multi-select question, count each option
       "interpret": true | false   # <-- New field: whether to ask LLM to interpret the results
     }
   ],
@@ -132,7 +139,13 @@ ANALYSIS TOOL SELECTION RULES:
 - Always include "descriptive_statistics" if analysis is requested
 - Include "chi_square_test" only if relationships between categorical variables are implied
 - Include "cronbach_alpha" only if scale reliability or questionnaires are mentioned
+- Include "association_matrix" if the user wants to screen many categorical variables for relationships at once
+- Include "group_comparison" if the user compares a numeric variable (age, score, income) across groups (gender, region); use it instead of chi_square_test when the outcome is numeric
+- Include "logistic_regression" if the user wants predictors, risk factors or odds ratios for a yes/no outcome
+- Include "multi_select_analysis" if a question allows several answers per respondent ("select all that apply", answers like "Bank; Cash"); put that column in "column"
+- Set "multi_select": true on a countplot only if the user says the plotted question allows several answers per respondent; otherwise null
 - Include "countplot", "barplot", "piechart" only if the user explicitly requests a visualization
+- Set "approximate": true on descriptive_statistics and plot steps only if the user asks for a quick or approximate look; false if they insist on exact figures; otherwise null (only very large files processed in chunks then default to approximate)
 - Set "interpret": true if the user asks to explain or interpret any result in plain language
 
 CLARIFICATION RULES:
@@ -1,6 +1,9 @@
 import os
+import asyncio
 from fastapi import APIRouter, HTTPException
 from fastapi.responses import FileResponse
+from app.services.lifecycle_service import mark_referenced
+from app.services.export_service import resolve_export
 
 router = APIRouter(tags=["Downloads"])
 
@@ -32,8 +35,13 @@ async def download_file(file_path: str):
         raise HTTPException(status_code=403, detail="Access denied")
 
     if not os.path.exists(safe_path):
-        raise HTTPException(status_code=404, detail="File not found")
+        # Analysis exports are generated on first download from the stored results
+        built = await asyncio.to_thread(resolve_export, safe_path)
+        if built is None:
+            raise HTTPException(status_code=404, detail="File not found")
+        safe_path = built
 
+    mark_referenced([safe_path])
     return FileResponse(
         path=safe_path,
         filename=os.path.basename(safe_path),
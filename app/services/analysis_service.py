@@ -1,16 +1,49 @@
+import asyncio
 import logging
 import os
 import re
-import pandas as pd
 from uuid import uuid4
-from app.services.file_service import save_and_load_dataset
-from app.tools.analysis_tools import descriptive_statistics
-from app.tools.statistics_tools import chi_square_test, cronbach_alpha
-from app.tools.visualization_tools import countplot, barplot, piechart
+from app.services.file_service import (
+    MAX_FILE_SIZE_MB,
+    MAX_CHUNKED_FILE_SIZE_MB,
+    load_saved_dataset,
+    parse_metrics,
+    record_parse_path,
+    save_upload,
+    sniff_format,
+)
+from app.services.chunked_analysis import ChunkedAggregator, estimate_rows, iter_chunks, read_header
+from app.services.incremental_stats import accumulate, tracked_datasets
+from app.services.lifecycle_service import in_use, mark_referenced
+from app.services.dataset_store import dataset_registry, dataset_store, write_sidecar
+from app.services.plan_scheduler import execute_plan, run_cpu
+from app.services.interpretation_service import interpret_sections
+from app.services.export_service import export_paths, results_path, save_results
+from app.services.tool_cache import call_tool, tool_cache
+from app.tools.analysis_tools import describe_sketch, descriptive_statistics, use_approximate
+from app.tools.statistics_tools import (
+    association_matrix,
+    chi_square_test,
+    chi_square_from_table,
+    cronbach_alpha,
+    group_comparison,
+    logistic_regression,
+    multi_select_analysis,
+    scale_items,
+)
+from app.tools.visualization_tools import (
+    countplot,
+    barplot,
+    piechart,
+    countplot_from_counts,
+    piechart_from_counts,
+)
 from app.agents.analysis import analysis_agent
 from app.utils.column_matcher import (
     extract_candidate_phrases,
     resolve_column,
+    resolve_plan_columns,
+    resolution_cache,
 )
 
 logger = logging.getLogger(__name__)
@@ -19,15 +52,26 @@ TOOL_REGISTRY = {
     "descriptive_statistics": descriptive_statistics,
     "chi_square_test": chi_square_test,
     "cronbach_alpha": cronbach_alpha,
+    "association_matrix": association_matrix,
+    "group_comparison": group_comparison,
+    "logistic_regression": logistic_regression,
+    "multi_select_analysis": multi_select_analysis,
     "countplot": countplot,
     "barplot": barplot,
     "piechart": piechart,
 }
 
 VISUALIZATION_TOOLS = {"countplot", "barplot", "piechart"}
-EXPORT_DIR = "outputs/exports"
+# Column roles each tool needs bound before it can run
+COLUMN_ROLES = {
+    "countplot": ["x", "hue"],
+    "barplot": ["x", "hue"],
+    "piechart": ["x"],
+    "chi_square_test": ["outcome", "predictor"],
+}
+# Rows read to pick default scale items when a large file's plan names none
+SCALE_SAMPLE_ROWS = 1000
 PLOT_DIR = "outputs/plots"
-os.makedirs(EXPORT_DIR, exist_ok=True)
 os.makedirs(PLOT_DIR, exist_ok=True)
 
 def heavy_clean_column(col_name):
@@ -41,40 +85,158 @@ def heavy_clean_column(col_name):
     cleaned = re.sub(r'\s+', ' ', str(col_name))
     return cleaned.strip()
 
-def interpret_with_llm(text: str) -> str:
-    """Uses the LLM to provide a narrative explanation of statistical data."""
-    llm = analysis_agent.llm
-    prompt = f"Interpret the following statistical output in simple language:\n\n{text}"
+def _role_phrases(step):
+    """Column phrases the plan gave for each role of a step (None when not named)."""
+    first = lambda names: names[0] if isinstance(names, list) and names else None
+    return {
+        "x": step.get("column"),
+        "hue": step.get("hue"),
+        "outcome": first(step.get("outcomes")) or step.get("column"),
+        "predictor": first(step.get("predictors")) or first(step.get("groups")) or step.get("hue"),
+    }
+
+async def _bind_plan_columns(steps, user_message, available_cols):
+    """
+    Resolve the columns of every step that needs them: the plan's column
+    phrases are matched locally, and anything left goes into one batched
+    LLM call. Returns one binding dict (or None) per step, aligned with `steps`.
+    """
+    needs = [i for i, step in enumerate(steps) if step.get("tool") in COLUMN_ROLES]
+    bindings = [None] * len(steps)
+    if not needs:
+        return bindings
+
+    batch = [
+        {
+            "tool": steps[i]["tool"],
+            "roles": COLUMN_ROLES[steps[i]["tool"]],
+            "reason": steps[i].get("reason"),
+            "phrases": _role_phrases(steps[i]),
+        }
+        for i in needs
+    ]
+    for i, binding in zip(needs, await resolve_plan_columns(batch, user_message, available_cols)):
+        bindings[i] = binding
+    logger.info(f"Batched column bindings: {bindings}")
+    return bindings
+
+async def _resolve_plot_columns(tool_name, user_message, available_cols, binding=None):
+    """Resolve the x (and optional hue) column for a visualization step."""
+    if binding and binding.get("x"):
+        return binding["x"], binding.get("hue")
+
+    p1, p2 = await extract_candidate_phrases(user_message, available_cols)
+    col1 = await resolve_column(p1, available_cols)
+    col2 = await resolve_column(p2, available_cols) if p2 else None
+    
+    if not col1:
+        col1 = await resolve_column(user_message, available_cols)
+
+    if not col1:
+        raise ValueError(f"Could not resolve columns for {tool_name}")
+    return col1, col2
+
+async def _resolve_pair_columns(user_message, available_cols, binding=None):
+    """Resolve the two categorical columns for a chi-square step."""
+    if binding and binding.get("outcome") and binding.get("predictor"):
+        return binding["outcome"], binding["predictor"]
+
+    p1, p2 = await extract_candidate_phrases(user_message, available_cols)
+    c1 = await resolve_column(p1, available_cols)
+    c2 = await resolve_column(p2, available_cols)
+    
+    if not c1 or not c2:
+        prompt = (
+            f"Identify TWO categorical columns from: {available_cols} "
+            f"based on the request: '{user_message}'. "
+            "Return ONLY the column names separated by a comma."
+        )
+        raw_res = await asyncio.to_thread(analysis_agent.llm.call, prompt)
+        res_text = getattr(raw_res, "content", str(raw_res)).strip()
+        
+        cols = [heavy_clean_column(x) for x in res_text.split(",")]
+        c1 = cols[0] if len(cols) > 0 else c1
+        c2 = cols[1] if len(cols) > 1 else c2
+
+    if not c1 or not c2: 
+        raise ValueError(f"Chi-square needs 2 variables. Resolved: {c1} and {c2}")
+    return c1, c2
+
+async def _resolve_named_columns(names, cols):
+    """Map column names from the plan onto dataset columns; None when none resolve."""
+    if not names:
+        return None
+    resolved = await asyncio.gather(*(resolve_column(name, cols) for name in names))
+    return list(dict.fromkeys(col for col in resolved if col)) or None
+
+
+async def _collect_outcomes(steps, outcomes, results, export_plots):
+    """
+    Merge step outcomes into `results` / `export_plots` in plan order, then
+    interpret every step that asked for it in one batched stage. Returns the
+    "### ..." sections for the response content.
+    """
+    sections = []
+    for step, outcome in zip(steps, outcomes):
+        tool_name = step["tool"]
+        if isinstance(outcome, BaseException):
+            logger.error(f"Error in {tool_name}: {outcome}")
+            results[tool_name] = f"Error: {str(outcome) or type(outcome).__name__}"
+            continue
+        output, heading = outcome
+        results[tool_name] = output
+        if heading:
+            sections.append((heading, tool_name, output))
+        if isinstance(output, dict) and "file" in output:
+            export_plots.append(output["file"])
+
+    texts = await interpret_sections(sections)
+    for (heading, tool_name, output), text in zip(sections, texts):
+        results[tool_name] = {"result": output, "interpretation": text}
+    return [f"### {heading}\n{text}" for (heading, _, _), text in zip(sections, texts)]
+
+async def _build_response(results, interpretations, export_plots):
+    """
+    Save the raw results and assemble the response. Only the raw results are
+    written here; /download builds each format on demand. A failed save drops
+    the export links but never fails the analysis itself.
+    """
     try:
-        response = llm.call(prompt)
+        result_id = await asyncio.to_thread(save_results, results)
     except Exception as e:
-        logger.error(f"LLM Interpretation failed: {e}")
-        return "Statistical output generated, but interpretation failed."
-    
-    return getattr(response, "content", str(response))
-
-def export_results_to_excel(results: dict) -> str:
-    """Saves analysis results to an Excel file."""
-    file_path = os.path.join(EXPORT_DIR, f"analysis_results_{uuid4().hex}.xlsx")
-    sheets_written = 0
-
-    with pd.ExcelWriter(file_path, engine="openpyxl") as writer:
-        for tool, content in results.items():
-            if isinstance(content, dict) and "file" in content and "result" not in content:
-                continue
-            data = content["result"] if isinstance(content, dict) and "result" in content else content
-            try:
-                df_out = pd.DataFrame(data) if isinstance(data, (list, dict)) and len(data) > 0 else pd.DataFrame({"Output": [str(data)]})
-                df_out.to_excel(writer, sheet_name=tool[:31], index=False)
-                sheets_written += 1
-            except Exception as e:
-                logger.warning(f"Skipping Excel sheet for {tool}: {e}")
-        if sheets_written == 0:
-            pd.DataFrame({"Message": ["No tabular data generated."]}).to_excel(writer, sheet_name="Summary")
-    return file_path
-
-async def run_analysis(dataset, analysis_plan=None, user_message=None, **kwargs):
-    path, df = await save_and_load_dataset(dataset)
+        logger.error(f"Saving analysis results failed: {e}")
+        result_id = None
+    formats = export_paths(result_id) if result_id else {}
+    response = {
+        "content": "\n\n".join(interpretations) if interpretations else "Analysis complete.",
+        "visuals": {f"Chart {i+1}": path for i, path in enumerate(export_plots)},
+        "exports": {
+            "excel": formats.get("excel"),
+            "plots": export_plots,
+        },
+        "export_formats": formats,
+    }
+    mark_referenced([results_path(result_id) if result_id else None, *export_plots])
+    return response
+
+
+async def run_analysis(dataset, analysis_plan=None, user_message=None, debug=False, upload=None, **kwargs):
+    """
+    Run an analysis plan on an uploaded dataset. `upload` is the (path,
+    digest) of an earlier `save_upload` of `dataset`; without it the upload
+    is saved here.
+    """
+    path, digest = upload or await save_upload(dataset, max_mb=MAX_CHUNKED_FILE_SIZE_MB)
+    if os.path.getsize(path) > MAX_FILE_SIZE_MB * 1024 * 1024:
+        return await run_chunked_analysis(path, analysis_plan, user_message, debug=debug, digest=digest)
+    # The lifecycle sweep must not delete the upload or its sidecar mid-analysis
+    with in_use([path]):
+        return await _run_in_memory_analysis(path, digest, dataset.filename, analysis_plan, user_message, debug)
+
+
+async def _run_in_memory_analysis(path, digest, filename, analysis_plan, user_message, debug):
+    df = await load_saved_dataset(path, digest, filename)
+    memory_report = df.attrs.get("memory_report")
     
     # --- STEP 1: HEAVY CLEAN HEADERS ---
     # Aligns DataFrame columns with LLM extracted phrases
@@ -82,105 +244,290 @@ async def run_analysis(dataset, analysis_plan=None, user_message=None, **kwargs)
     available_cols = list(df.columns)
     logger.info(f"AIRA Cleaned Headers: {available_cols}")
 
+    # Path-based tools read this columnar copy instead of re-parsing the upload
+    await asyncio.to_thread(write_sidecar, path, df)
+    # Tools receive this handle and share the in-memory frame; valid while `df` lives
+    handle = dataset_registry.register(df, digest)
+
     results = {}
     export_plots = []
-    interpretations = []
 
     if not analysis_plan:
         return {"content": "No analysis plan provided.", "exports": {}}
 
-    for step in analysis_plan:
+    async def run_step(index, step):
+        """
+        Resolve and run one plan step. Returns (output, heading), where the
+        heading is set only for steps whose output should be interpreted.
+        """
         tool_name = step.get("tool")
-        interpret = step.get("interpret", False)
-        if tool_name not in TOOL_REGISTRY: continue
         tool = TOOL_REGISTRY[tool_name]
+        heading = None
 
-        try:
-            # --- 1. DESCRIPTIVE STATISTICS ---
-            if tool_name == "descriptive_statistics":
-                output = tool.run(path)
-                if interpret:
-                    text = interpret_with_llm(output)
-                    interpretations.append(f"### Descriptive Analysis\n{text}")
-                    results[tool_name] = {"result": output, "interpretation": text}
-                else:
-                    results[tool_name] = output
-
-            # --- 2. VISUALIZATIONS ---
-            elif tool_name in VISUALIZATION_TOOLS:
-                p1, p2 = await extract_candidate_phrases(user_message, available_cols)
-                col1 = await resolve_column(p1, available_cols)
-                col2 = await resolve_column(p2, available_cols) if p2 else None
-                
-                if not col1:
-                    col1 = await resolve_column(user_message, available_cols)
-
-                if not col1:
-                    raise ValueError(f"Could not resolve columns for {tool_name}")
-                
-                # CACHE BUSTING: Generate a unique filename for every plot
-                unique_filename = os.path.join(PLOT_DIR, f"{tool_name}_{uuid4().hex[:8]}.png")
-                
-                records = df.to_dict(orient="records")
-                if tool_name in {"countplot", "barplot"}:
-                    logger.info(f"Plotting {tool_name}: x='{col1}', hue='{col2}'")
-                    output = tool.run(records, x=col1, hue=col2, filename=unique_filename)
-                else:
-                    output = tool.run(records, column=col1, filename=unique_filename)
-                
-                results[tool_name] = output
-                if isinstance(output, dict) and "file" in output: 
-                    export_plots.append(output["file"])
-
-            # --- 3. CHI-SQUARE TESTS ---
-            elif tool_name == "chi_square_test":
-                p1, p2 = await extract_candidate_phrases(user_message, available_cols)
-                c1 = await resolve_column(p1, available_cols)
-                c2 = await resolve_column(p2, available_cols)
-                
-                if not c1 or not c2:
-                    prompt = (
-                        f"Identify TWO categorical columns from: {available_cols} "
-                        f"based on the request: '{user_message}'. "
-                        "Return ONLY the column names separated by a comma."
-                    )
-                    raw_res = analysis_agent.llm.call(prompt)
-                    res_text = getattr(raw_res, "content", str(raw_res)).strip()
-                    
-                    cols = [heavy_clean_column(x) for x in res_text.split(",")]
-                    c1 = cols[0] if len(cols) > 0 else c1
-                    c2 = cols[1] if len(cols) > 1 else c2
-
-                if not c1 or not c2: 
-                    raise ValueError(f"Chi-square needs 2 variables. Resolved: {c1} and {c2}")
-                
-                output = tool.run(df.to_dict(orient="records"), outcome=c1, predictors=[c2])
-                if interpret:
-                    text = interpret_with_llm(output)
-                    interpretations.append(f"### Chi-Square Analysis ({c1} vs {c2})\n{text}")
-                    results[tool_name] = {"result": output, "interpretation": text}
-                else: 
-                    results[tool_name] = output
-
-            # --- 4. CRONBACH ALPHA ---
-            elif tool_name == "cronbach_alpha":
-                output = tool.run(df.to_dict(orient="records"))
-                if interpret:
-                    text = interpret_with_llm(output)
-                    interpretations.append(f"### Reliability Analysis\n{text}")
-                    results[tool_name] = {"result": output, "interpretation": text}
-                else:
-                    results[tool_name] = output
+        # --- 1. DESCRIPTIVE STATISTICS ---
+        if tool_name == "descriptive_statistics":
+            output = await run_cpu(call_tool, tool_name, tool, handle, approximate=step.get("approximate"))
+            heading = "Descriptive Analysis"
+
+        # --- 2. VISUALIZATIONS ---
+        elif tool_name in VISUALIZATION_TOOLS:
+            col1, col2 = await _resolve_plot_columns(
+                tool_name, user_message, available_cols, bindings[index]
+            )
+            
+            # CACHE BUSTING: Generate a unique filename for every plot
+            unique_filename = os.path.join(PLOT_DIR, f"{tool_name}_{uuid4().hex[:8]}.png")
+            
+            if tool_name == "countplot":
+                logger.info(f"Plotting {tool_name}: x='{col1}', hue='{col2}'")
+                output = await run_cpu(
+                    call_tool, tool_name, tool, handle, x=col1, hue=col2, filename=unique_filename,
+                    approximate=step.get("approximate"), multi_select=bool(step.get("multi_select")),
+                )
+            elif tool_name == "barplot":
+                logger.info(f"Plotting {tool_name}: x='{col1}', hue='{col2}'")
+                output = await run_cpu(
+                    call_tool, tool_name, tool, handle, x=col1, hue=col2, filename=unique_filename,
+                    approximate=step.get("approximate"),
+                )
+            else:
+                output = await run_cpu(
+                    call_tool, tool_name, tool, handle, column=col1, filename=unique_filename,
+                    approximate=step.get("approximate"),
+                )
 
+        # --- 3. CHI-SQUARE TESTS ---
+        elif tool_name == "chi_square_test":
+            c1, c2 = await _resolve_pair_columns(user_message, available_cols, bindings[index])
+            output = await run_cpu(call_tool, tool_name, tool, handle, outcome=c1, predictors=[c2])
+            heading = f"Chi-Square Analysis ({c1} vs {c2})"
+
+        # --- 4. CRONBACH ALPHA ---
+        elif tool_name == "cronbach_alpha":
+            items = await _resolve_named_columns(step.get("items"), available_cols)
+            output = await run_cpu(call_tool, tool_name, tool, handle, items=items)
+            heading = "Reliability Analysis"
+
+        # --- 5. ASSOCIATION SCREENING ---
+        elif tool_name == "association_matrix":
+            output = await run_cpu(call_tool, tool_name, tool, handle)
+            heading = "Association Screening"
+
+        # --- 6. GROUP COMPARISONS ---
+        elif tool_name == "group_comparison":
+            outcomes, groups = await asyncio.gather(
+                _resolve_named_columns(step.get("outcomes"), available_cols),
+                _resolve_named_columns(step.get("groups"), available_cols),
+            )
+            output = await run_cpu(call_tool, tool_name, tool, handle, outcomes=outcomes, groups=groups)
+            heading = "Group Comparisons"
+
+        # --- 7. LOGISTIC REGRESSION ---
+        elif tool_name == "logistic_regression":
+            outcomes, predictors = await asyncio.gather(
+                _resolve_named_columns(step.get("outcomes"), available_cols),
+                _resolve_named_columns(step.get("predictors"), available_cols),
+            )
+            if outcomes:
+                outcome = outcomes[0]
+            else:
+                outcome, predictor = await _resolve_pair_columns(user_message, available_cols, bindings[index])
+                predictors = predictors or [predictor]
+            output = await run_cpu(call_tool, tool_name, tool, handle, outcome=outcome, predictors=predictors)
+            heading = f"Logistic Regression ({outcome})"
+
+        # --- 8. MULTI-SELECT QUESTIONS ---
+        elif tool_name == "multi_select_analysis":
+            columns, by = await asyncio.gather(
+                _resolve_named_columns([step["column"]] if step.get("column") else None, available_cols),
+                _resolve_named_columns(step.get("groups"), available_cols),
+            )
+            output = await run_cpu(call_tool, tool_name, tool, handle, columns=columns, by=by)
+            heading = "Multi-Select Questions"
+
+        return output, (heading if step.get("interpret", False) else None)
+
+    # Independent steps run concurrently; outcomes come back in plan order
+    steps = [step for step in analysis_plan if step.get("tool") in TOOL_REGISTRY]
+    # One LLM call binds every step's columns; unbound steps resolve individually
+    bindings = await _bind_plan_columns(steps, user_message, available_cols)
+    outcomes = await execute_plan(steps, run_step)
+
+    interpretations = await _collect_outcomes(steps, outcomes, results, export_plots)
+
+    response = await _build_response(results, interpretations, export_plots)
+    if debug:
+        response["debug"] = {
+            "memory": memory_report,
+            "dataset_cache": dataset_store.stats(),
+            "tool_cache": tool_cache.stats(),
+            "parse_paths": parse_metrics(),
+            "column_cache": resolution_cache.stats(),
+        }
+    return response
+
+def _sample_scale_items(path, sniffed):
+    """Default reliability items for a large file, judged from its first rows."""
+    sample = next(iter_chunks(path, sniffed, chunksize=SCALE_SAMPLE_ROWS), None)
+    if sample is None:
+        return []
+    sample.columns = [heavy_clean_column(col) for col in sample.columns]
+    return scale_items(sample)
+
+
+async def run_chunked_analysis(path, analysis_plan=None, user_message=None, debug=False, digest=None):
+    """
+    Out-of-core variant of `run_analysis` for uploads above MAX_FILE_SIZE_MB.
+
+    Columns are resolved from the header alone, then a single streaming pass
+    accumulates the value counts, crosstabs and item moments that the planned
+    descriptive, chi-square, reliability, countplot and piechart steps need.
+    Peak memory is bounded by the chunk size rather than the file size.
+
+    Totals are kept per upload: re-posting a file reuses them, and a file
+    that extends an earlier upload only has its appended rows aggregated.
+    Descriptive steps switch to column sketches when asked to, or when the
+    file is estimated to exceed APPROX_ROW_THRESHOLD rows.
+    """
+    # A scan can outlast the sweep interval; keep the upload on disk until it ends
+    with in_use([path]):
+        return await _run_chunked_analysis(path, analysis_plan, user_message, debug, digest)
+
+
+async def _run_chunked_analysis(path, analysis_plan, user_message, debug, digest):
+    if not analysis_plan:
+        return {"content": "No analysis plan provided.", "exports": {}}
+
+    sniffed = await asyncio.to_thread(sniff_format, path)
+    record_parse_path(sniffed, prefix="chunked:")
+    try:
+        raw_header = await asyncio.to_thread(read_header, path, sniffed)
+    except ValueError as e:
+        return {"content": str(e), "exports": {}}
+    available_cols = [heavy_clean_column(col) for col in raw_header]
+    logger.info(f"AIRA Cleaned Headers (chunked): {available_cols}")
+
+    aggregator = ChunkedAggregator()
+    planned = []
+    results = {}
+    export_plots = []
+
+    # --- PASS 1: resolve columns and register the aggregates each step needs ---
+    async def resolve_step(index, step):
+        tool_name = step["tool"]
+        if tool_name == "descriptive_statistics":
+            return None, None
+        if tool_name in {"countplot", "piechart"}:
+            col1, col2 = await _resolve_plot_columns(
+                tool_name, user_message, available_cols, bindings[index]
+            )
+            if tool_name != "countplot" or col2 == col1:
+                col2 = None
+            return col1, col2
+        if tool_name == "chi_square_test":
+            return await _resolve_pair_columns(user_message, available_cols, bindings[index])
+        if tool_name == "cronbach_alpha":
+            items = await _resolve_named_columns(step.get("items"), available_cols)
+            if not items:
+                items = await asyncio.to_thread(_sample_scale_items, path, sniffed)
+            if len(items) < 2:
+                raise ValueError("Cronbach's alpha needs at least two items")
+            return tuple(items), None
+        raise ValueError(f"{tool_name} is not available for datasets over {MAX_FILE_SIZE_MB} MB")
+
+    steps = [step for step in analysis_plan if step.get("tool") in TOOL_REGISTRY]
+    bindings = await _bind_plan_columns(steps, user_message, available_cols)
+    resolved = await execute_plan(steps, resolve_step)
+
+    for step, outcome in zip(steps, resolved):
+        tool_name = step["tool"]
+        if isinstance(outcome, BaseException):
+            logger.error(f"Error in {tool_name}: {outcome}")
+            results[tool_name] = f"Error: {str(outcome) or type(outcome).__name__}"
+            continue
+        col1, col2 = outcome
+        approximate = False
+        if tool_name == "descriptive_statistics":
+            if step.get("approximate") is None:
+                n_rows = await asyncio.to_thread(estimate_rows, path, sniffed)
+            else:
+                n_rows = 0
+            approximate = use_approximate(n_rows, step.get("approximate"))
+            if approximate:
+                aggregator.track_sketches(available_cols)
+            else:
+                for col in available_cols:
+                    aggregator.track_counts(col)
+        elif tool_name == "cronbach_alpha":
+            aggregator.track_items(list(col1))
+        elif col2:
+            aggregator.track_crosstab(col1, col2)
+        else:
+            aggregator.track_counts(col1)
+        planned.append({
+            "tool": tool_name,
+            "interpret": step.get("interpret", False),
+            "cols": (col1, col2),
+            "approximate": approximate,
+        })
+
+    # --- PASS 2: one streaming scan over the file, or only its appended rows ---
+    scan = {"mode": "skipped"}
+    if planned:
+        try:
+            if digest:
+                aggregator, scan = await asyncio.to_thread(
+                    accumulate, path, digest, sniffed, aggregator, heavy_clean_column
+                )
+            else:
+                await asyncio.to_thread(aggregator.consume, path, sniffed, heavy_clean_column)
         except Exception as e:
-            logger.error(f"Error in {tool_name}: {e}")
-            results[tool_name] = f"Error: {str(e)}"
+            logger.error(f"Chunked scan failed for {path}: {e}")
+            return {"content": f"Failed to read dataset in chunked mode: {e}", "exports": {}}
 
-    return {
-        "content": "\n\n".join(interpretations) if interpretations else "Analysis complete.",
-        "visuals": {f"Chart {i+1}": path for i, path in enumerate(export_plots)},
-        "exports": {
-            "excel": export_results_to_excel(results),
-            "plots": export_plots,
-        },
-    }
\ No newline at end of file
+    # --- PASS 3: finalize each step from the accumulated totals ---
+    async def finalize_step(index, step):
+        tool_name = step["tool"]
+        col1, col2 = step["cols"]
+        heading = None
+        if tool_name == "descriptive_statistics" and step["approximate"]:
+            output = await run_cpu(describe_sketch, aggregator.sketch)
+            heading = "Descriptive Analysis"
+        elif tool_name == "descriptive_statistics":
+            output = aggregator.descriptive_summary()
+            heading = "Descriptive Analysis"
+        elif tool_name == "chi_square_test":
+            output = chi_square_from_table(aggregator.crosstab(col1, col2), col1, col2)
+            heading = f"Chi-Square Analysis ({col1} vs {col2})"
+        elif tool_name == "cronbach_alpha":
+            output = await run_cpu(aggregator.reliability, list(col1))
+            heading = "Reliability Analysis"
+        else:
+            unique_filename = os.path.join(PLOT_DIR, f"{tool_name}_{uuid4().hex[:8]}.png")
+            if tool_name == "piechart":
+                output = await run_cpu(
+                    piechart_from_counts, aggregator.value_counts(col1), col1, unique_filename
+                )
+            else:
+                counts = aggregator.crosstab(col1, col2) if col2 else aggregator.value_counts(col1)
+                output = await run_cpu(countplot_from_counts, counts, col1, col2, unique_filename)
+
+        return output, (heading if step["interpret"] else None)
+
+    outcomes = await execute_plan(planned, finalize_step)
+
+    interpretations = await _collect_outcomes(planned, outcomes, results, export_plots)
+
+    response = await _build_response(results, interpretations, export_plots)
+    if debug:
+        response["debug"] = {
+            "chunked": {
+                "rows": aggregator.rows,
+                "high_cardinality": sorted(aggregator.high_cardinality),
+                "scan": scan,
+                "tracked_datasets": tracked_datasets(),
+            },
+            "parse_paths": parse_metrics(),
+            "column_cache": resolution_cache.stats(),
+        }
+    return response
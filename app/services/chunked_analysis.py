@@ -0,0 +1,396 @@
+import os
+import logging
+from typing import Callable, Iterator
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from app.tools.analysis_tools import MAX_LEVELS, _column_kind
+from app.tools.statistics_tools import _label_scores, _normalize_label, reliability_from_cov
+from app.utils.sketches import FrameSketch
+
+
+# Rows per chunk; peak memory is roughly one chunk of the requested columns
+CHUNK_ROWS = 50_000
+# Columns with more distinct values than this stop tracking exact counts
+MAX_TRACKED_CATEGORIES = 1000
+MAX_CROSSTAB_CELLS = 100_000
+# Distinct labels allowed per text item before its reliability moments are dropped
+MAX_ITEM_LEVELS = 50
+# Bytes read from the start of a CSV to estimate its average row length
+ROW_ESTIMATE_BYTES = 1024 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+def read_header(path: str, sniffed: dict) -> list[str]:
+    """Return the raw header row of an upload without reading any data rows."""
+    if sniffed["format"] == "csv":
+        header = pd.read_csv(
+            path,
+            encoding=sniffed["encoding"],
+            encoding_errors=sniffed["encoding_errors"],
+            sep=sniffed["delimiter"],
+            nrows=0,
+        )
+        return [str(col) for col in header.columns]
+    if sniffed["format"] == "xlsx":
+        from openpyxl import load_workbook
+
+        wb = load_workbook(path, read_only=True)
+        try:
+            row = next(wb.active.iter_rows(max_row=1, values_only=True), ())
+        finally:
+            wb.close()
+        return [str(col) for col in row]
+    raise ValueError("Chunked mode supports CSV and .xlsx files only")
+
+
+def estimate_csv_rows(head: bytes, size: int) -> int:
+    """Data rows of a `size`-byte CSV from the average line length of its first bytes `head`."""
+    if len(head) == size:
+        records = head.count(b"\n") + (1 if head and not head.endswith(b"\n") else 0)
+        return max(records - 1, 0)
+    lines = head.count(b"\n")
+    if not lines:
+        return 0
+    return max(int(size * lines / len(head)) - 1, 0)
+
+
+def estimate_rows(path: str, sniffed: dict) -> int:
+    """
+    Rough data-row count without a scan: file size over the average line
+    length of the first ROW_ESTIMATE_BYTES for CSV, the sheet dimension for xlsx.
+    """
+    if sniffed["format"] == "csv":
+        with open(path, "rb") as f:
+            head = f.read(ROW_ESTIMATE_BYTES)
+        return estimate_csv_rows(head, os.path.getsize(path))
+    if sniffed["format"] == "xlsx":
+        from openpyxl import load_workbook
+
+        wb = load_workbook(path, read_only=True)
+        try:
+            return max((wb.active.max_row or 1) - 1, 0)
+        finally:
+            wb.close()
+    raise ValueError("Chunked mode supports CSV and .xlsx files only")
+
+
+def iter_chunks(
+    path: str,
+    sniffed: dict,
+    usecols: list[str] | None = None,
+    chunksize: int = CHUNK_ROWS,
+    offset: int = 0,
+    header: list[str] | None = None,
+) -> Iterator[pd.DataFrame]:
+    """
+    Stream an upload as DataFrames of at most `chunksize` rows, restricted to
+    the raw header names in `usecols` (all columns when None).
+
+    For CSV, a non-zero `offset` starts reading at that byte, which must be
+    the start of a data row; `header` then supplies the column names.
+    """
+    if sniffed["format"] == "csv" and offset:
+        with open(path, "rb") as f:
+            f.seek(offset)
+            try:
+                yield from pd.read_csv(
+                    f,
+                    encoding=sniffed["encoding"],
+                    encoding_errors=sniffed["encoding_errors"],
+                    sep=sniffed["delimiter"],
+                    header=None,
+                    names=header,
+                    usecols=usecols,
+                    chunksize=chunksize,
+                )
+            except pd.errors.EmptyDataError:
+                return
+        return
+
+    if sniffed["format"] == "csv":
+        yield from pd.read_csv(
+            path,
+            encoding=sniffed["encoding"],
+            encoding_errors=sniffed["encoding_errors"],
+            sep=sniffed["delimiter"],
+            usecols=usecols,
+            chunksize=chunksize,
+        )
+        return
+
+    if sniffed["format"] != "xlsx":
+        raise ValueError("Chunked mode supports CSV and .xlsx files only")
+
+    from openpyxl import load_workbook
+
+    wb = load_workbook(path, read_only=True)
+    try:
+        rows = wb.active.iter_rows(values_only=True)
+        header = [str(col) for col in next(rows, ())]
+        wanted = usecols if usecols is not None else header
+        idx = [header.index(col) for col in wanted]
+        batch = []
+        for row in rows:
+            batch.append([row[i] if i < len(row) else None for i in idx])
+            if len(batch) >= chunksize:
+                yield pd.DataFrame(batch, columns=wanted)
+                batch = []
+        if batch:
+            yield pd.DataFrame(batch, columns=wanted)
+    finally:
+        wb.close()
+
+
+class ItemMoments:
+    """
+    Sufficient statistics for Cronbach's alpha over one item set, taken over
+    complete rows only. Numeric items contribute their values; text items
+    contribute one indicator per distinct label, so labels can be scored
+    (Likert ranks, category codes) once every label has been seen and the
+    item covariance rebuilt from the indicator cross-products.
+    """
+
+    def __init__(self, items: list[str]):
+        self.items = list(items)
+        self.numeric: list[bool] | None = None
+        self.n = 0
+        self.excluded = 0
+        self.error: str | None = None
+        # (item position, normalized label or None for numeric items) -> feature
+        self._features: dict[tuple[int, str | None], int] = {}
+        self._levels = [0] * len(self.items)
+        self._sums = np.zeros(0)
+        self._gram = np.zeros((0, 0))
+
+    def _feature(self, j: int, label: str | None) -> int:
+        if (j, label) not in self._features:
+            self._features[(j, label)] = len(self._features)
+            self._levels[j] += 1
+        return self._features[(j, label)]
+
+    def update(self, chunk: pd.DataFrame) -> None:
+        if self.error:
+            return
+        if self.numeric is None:
+            self.numeric = [
+                pd.api.types.is_numeric_dtype(chunk[item]) and not pd.api.types.is_bool_dtype(chunk[item])
+                for item in self.items
+            ]
+        columns = [
+            pd.to_numeric(chunk[item], errors="coerce") if numeric else chunk[item]
+            for item, numeric in zip(self.items, self.numeric)
+        ]
+        complete = np.logical_and.reduce([col.notna().to_numpy() for col in columns])
+        m = int(complete.sum())
+        self.excluded += len(chunk) - m
+        if not m:
+            return
+
+        k = len(self.items)
+        features = np.empty((m, k), dtype="int64")
+        values = np.ones((m, k))
+        for j, (col, numeric) in enumerate(zip(columns, self.numeric)):
+            col = col[complete]
+            if numeric:
+                features[:, j] = self._feature(j, None)
+                values[:, j] = col.to_numpy(dtype="float64")
+                continue
+            codes, uniques = pd.factorize(col)
+            lookup = np.array([self._feature(j, _normalize_label(u)) for u in uniques], dtype="int64")
+            if self._levels[j] > MAX_ITEM_LEVELS:
+                self.error = f"Item '{self.items[j]}' has too many distinct answers for a reliability analysis"
+                return
+            features[:, j] = lookup[codes]
+
+        size = len(self._features)
+        z = sparse.csr_matrix(
+            (values.ravel(), (np.repeat(np.arange(m), k), features.ravel())),
+            shape=(m, size),
+        )
+        if size > len(self._sums):
+            grow = size - len(self._sums)
+            self._sums = np.pad(self._sums, (0, grow))
+            self._gram = np.pad(self._gram, ((0, grow), (0, grow)))
+        self._sums += np.asarray(z.sum(axis=0)).ravel()
+        self._gram += (z.T @ z).toarray()
+        self.n += m
+
+    def reliability(self) -> dict:
+        """`cronbach_alpha` output from the moments; no bootstrap interval."""
+        if self.error:
+            raise ValueError(self.error)
+        if self.n < 3:
+            raise ValueError("Not enough complete responses to estimate reliability")
+
+        labels = {item: [] for item, numeric in zip(self.items, self.numeric) if not numeric}
+        for (j, label), _ in sorted(self._features.items(), key=lambda entry: entry[1]):
+            if label is not None:
+                labels[self.items[j]].append(label)
+        label_scores = _label_scores(labels)
+
+        # Maps each feature onto its item's score
+        weights = np.zeros((len(self._features), len(self.items)))
+        scoring = []
+        for j, item in enumerate(self.items):
+            if self.numeric[j]:
+                weights[self._features[(j, None)], j] = 1.0
+                scoring.append("numeric")
+                continue
+            scores, how = label_scores[item]
+            for label, score in zip(labels[item], scores):
+                weights[self._features[(j, label)], j] = score
+            scoring.append(how)
+
+        means = weights.T @ self._sums / self.n
+        cross = weights.T @ self._gram @ weights
+        cov = (cross - self.n * np.outer(means, means)) / (self.n - 1)
+        return reliability_from_cov(cov, means, self.n, self.items, scoring, excluded=self.excluded)
+
+
+class ChunkedAggregator:
+    """
+    Accumulates value counts, contingency tables, reliability moments and
+    column sketches across chunks in a single pass over the file. Register
+    what is needed with `track_counts` / `track_crosstab` / `track_items` /
+    `track_sketches`, feed chunks to `update`, then read the totals. Totals
+    are plain sums and sketches merge, so feeding only the rows appended to
+    a file extends them.
+
+    Counts for a column are dropped (and the column flagged) once it exceeds
+    MAX_TRACKED_CATEGORIES distinct values, which keeps memory bounded for
+    free-text and ID columns.
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self._counts: dict[str, pd.Series] = {}
+        self._crosstabs: dict[tuple[str, str], pd.DataFrame] = {}
+        self.high_cardinality: set[str] = set()
+        self._moments: dict[tuple[str, ...], ItemMoments] = {}
+        self._sketch_columns: list[str] = []
+        self.sketch: FrameSketch | None = None
+
+    def track_counts(self, column: str) -> None:
+        self._counts.setdefault(column, pd.Series(dtype="int64"))
+
+    def track_crosstab(self, row: str, col: str) -> None:
+        self._crosstabs.setdefault((row, col), pd.DataFrame(dtype="int64"))
+
+    def track_items(self, items: list[str]) -> None:
+        self._moments.setdefault(tuple(items), ItemMoments(items))
+
+    def track_sketches(self, columns: list[str]) -> None:
+        if self.sketch is None:
+            self._sketch_columns = list(columns)
+            self.sketch = FrameSketch(_column_kind)
+
+    def columns(self) -> list[str]:
+        """Every column the registered aggregates need, in first-seen order."""
+        needed = list(self._counts)
+        for row, col in self._crosstabs:
+            needed += [row, col]
+        for items in self._moments:
+            needed += items
+        needed += self._sketch_columns
+        return list(dict.fromkeys(needed))
+
+    def covers(self, other: "ChunkedAggregator") -> bool:
+        """True when every aggregate registered on `other` is also tracked here."""
+        return (
+            other._counts.keys() <= self._counts.keys()
+            and other._crosstabs.keys() <= self._crosstabs.keys()
+            and other._moments.keys() <= self._moments.keys()
+            and set(other._sketch_columns) <= set(self._sketch_columns)
+        )
+
+    def update(self, chunk: pd.DataFrame) -> None:
+        self.rows += len(chunk)
+
+        for column, total in self._counts.items():
+            if column in self.high_cardinality:
+                continue
+            counts = chunk[column].value_counts(dropna=False)
+            total = total.add(counts, fill_value=0)
+            if len(total) > MAX_TRACKED_CATEGORIES:
+                self.high_cardinality.add(column)
+                total = pd.Series(dtype="int64")
+            self._counts[column] = total
+
+        for (row, col), total in self._crosstabs.items():
+            if row in self.high_cardinality or col in self.high_cardinality:
+                continue
+            subset = chunk[[row, col]].dropna()
+            if subset.empty:
+                continue
+            table = pd.crosstab(subset[row], subset[col])
+            total = total.add(table, fill_value=0)
+            if total.size > MAX_CROSSTAB_CELLS:
+                self.high_cardinality.update({row, col})
+                total = pd.DataFrame(dtype="int64")
+            self._crosstabs[(row, col)] = total
+
+        for moments in self._moments.values():
+            moments.update(chunk)
+
+        if self.sketch is not None:
+            self.sketch.update(chunk[self._sketch_columns])
+
+    def value_counts(self, column: str) -> pd.Series:
+        if column in self.high_cardinality:
+            raise ValueError(f"Column '{column}' has too many distinct values for chunked counts")
+        return self._counts[column].astype("int64").sort_values(ascending=False)
+
+    def crosstab(self, row: str, col: str) -> pd.DataFrame:
+        if row in self.high_cardinality or col in self.high_cardinality:
+            raise ValueError(f"Crosstab of '{row}' and '{col}' is too large for chunked mode")
+        return self._crosstabs[(row, col)].fillna(0).astype("int64")
+
+    def reliability(self, items: list[str]) -> dict:
+        return self._moments[tuple(items)].reliability()
+
+    def consume(
+        self,
+        path: str,
+        sniffed: dict,
+        clean: Callable[[str], str] = str,
+    ) -> None:
+        """
+        Stream `path` once and update every registered aggregate. `clean` maps
+        raw header names onto the cleaned names used when registering.
+        """
+        raw_header = read_header(path, sniffed)
+        raw_by_clean = {clean(raw): raw for raw in raw_header}
+        wanted = self.columns()
+        usecols = [raw_by_clean[col] for col in wanted]
+
+        for chunk in iter_chunks(path, sniffed, usecols=usecols):
+            chunk.columns = [clean(str(col)) for col in chunk.columns]
+            self.update(chunk)
+        logger.info("Chunked pass over %s: %d rows, %d columns", path, self.rows, len(wanted))
+
+    def descriptive_summary(self) -> dict:
+        """
+        Frequency tables in the same shape as `descriptive_statistics`,
+        built from the accumulated counts.
+        """
+        summary = {}
+        for column in self._counts:
+            if column in self.high_cardinality:
+                summary[column] = {"type": "categorical", "high_cardinality": True}
+                continue
+            vc = self.value_counts(column)
+            missing = int(vc[vc.index.isna()].sum())
+            vc = vc[vc.index.notna()]
+            top = vc.iloc[:MAX_LEVELS]
+            summary[column] = {
+                "type": "categorical",
+                "n_levels": int(len(vc)),
+                "missing": missing,
+                "counts": top.to_dict(),
+                "percentages": (top / self.rows * 100).round(2).to_dict(),
+            }
+            if len(vc) > MAX_LEVELS:
+                summary[column]["other_count"] = int(vc.iloc[MAX_LEVELS:].sum())
+        return summary
@@ -0,0 +1,203 @@
+import os
+import logging
+import threading
+import weakref
+from collections import OrderedDict
+from uuid import uuid4
+import pandas as pd
+
+
+MAX_CACHE_MB = 512
+HANDLE_PREFIX = "dataset://"
+
+logger = logging.getLogger(__name__)
+
+
+class DatasetStore:
+    """
+    In-process LRU of parsed DataFrames keyed by the sha256 of the uploaded bytes.
+
+    Entries are evicted least-recently-used first once the summed deep memory
+    usage of the cached frames exceeds `max_bytes`.
+    """
+
+    def __init__(self, max_bytes: int = MAX_CACHE_MB * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._frames: OrderedDict[str, tuple[pd.DataFrame, int]] = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, digest: str) -> pd.DataFrame | None:
+        """Return a shallow copy of the cached frame, or None on a miss."""
+        with self._lock:
+            entry = self._frames.get(digest)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._frames.move_to_end(digest)
+            self.hits += 1
+        # Callers rename columns in place; never hand out the cached object itself
+        return entry[0].copy(deep=False)
+
+    def put(self, digest: str, df: pd.DataFrame) -> None:
+        size = int(df.memory_usage(index=True, deep=True).sum())
+        if size > self.max_bytes:
+            logger.info("Dataset %s (%d bytes) exceeds cache budget, not cached", digest[:12], size)
+            return
+
+        with self._lock:
+            old = self._frames.pop(digest, None)
+            if old is not None:
+                self._total_bytes -= old[1]
+            self._frames[digest] = (df, size)
+            self._total_bytes += size
+
+            while self._total_bytes > self.max_bytes and self._frames:
+                evicted, (_, evicted_size) = self._frames.popitem(last=False)
+                self._total_bytes -= evicted_size
+                logger.debug("Evicted dataset %s from cache (%d bytes)", evicted[:12], evicted_size)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._frames),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+dataset_store = DatasetStore()
+
+
+class DatasetRegistry:
+    """
+    Maps opaque handles (`dataset://<sha256>:<token>`) to live DataFrames so
+    tools can be called with a handle string instead of a list of records.
+
+    Entries are weak references: a handle stays valid for as long as the
+    caller holds the frame, and disappears with it.
+    """
+
+    def __init__(self):
+        self._frames: weakref.WeakValueDictionary[str, pd.DataFrame] = weakref.WeakValueDictionary()
+
+    def register(self, df: pd.DataFrame, digest: str) -> str:
+        handle = f"{HANDLE_PREFIX}{digest}:{uuid4().hex[:8]}"
+        self._frames[handle] = df
+        return handle
+
+    def resolve(self, handle: str) -> pd.DataFrame:
+        df = self._frames.get(handle)
+        if df is None:
+            raise ValueError(f"Dataset handle '{handle}' is unknown or has expired")
+        return df
+
+
+dataset_registry = DatasetRegistry()
+
+
+def is_handle(data) -> bool:
+    return isinstance(data, str) and data.startswith(HANDLE_PREFIX)
+
+
+def handle_digest(handle: str) -> str:
+    """Content hash of the dataset behind a handle."""
+    return handle[len(HANDLE_PREFIX):].split(":", 1)[0]
+
+
+def sidecar_path(path: str) -> str:
+    """Columnar sidecar location for an upload: same stem, `.parquet` suffix."""
+    return os.path.splitext(path)[0] + ".parquet"
+
+
+def normalize_mixed_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Parquet needs one physical type per column. Survey exports often mix
+    numbers and text (e.g. 3, "N/A") in one column; store those as text.
+    Fresh parses apply the same step, so a frame read back from its sidecar
+    matches the one first analysed.
+    """
+    mixed = [
+        col for col in df.columns
+        if df[col].dtype == object and pd.api.types.infer_dtype(df[col], skipna=True).startswith("mixed")
+    ]
+    if not mixed:
+        return df
+    df = df.copy(deep=False)
+    for col in mixed:
+        df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    return df
+
+
+def write_sidecar(path: str, df: pd.DataFrame) -> str | None:
+    """
+    Persist a parsed, header-cleaned frame as Parquet next to its upload.
+    Returns the sidecar path, or None when the frame cannot be stored.
+    """
+    target = sidecar_path(path)
+    if os.path.exists(target):
+        return target
+
+    if df.columns.has_duplicates:
+        logger.info("Skipping sidecar for %s: duplicate column names", path)
+        return None
+
+    tmp_path = f"{target}.{uuid4().hex}.part"
+    try:
+        normalize_mixed_columns(df).to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, target)
+    except Exception as e:
+        logger.warning("Failed to write Parquet sidecar for %s: %s", path, e)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return None
+    return target
+
+
+def read_sidecar(path: str, columns: list[str] | None = None) -> pd.DataFrame | None:
+    """
+    Memory-map the Parquet sidecar for `path` and read only `columns`
+    (all columns when None). Returns None when no sidecar exists.
+    """
+    target = sidecar_path(path)
+    if not os.path.exists(target):
+        return None
+
+    try:
+        import pyarrow.parquet as pq
+
+        if columns is not None:
+            available = set(pq.read_schema(target).names)
+            columns = [col for col in dict.fromkeys(columns) if col in available]
+        table = pq.read_table(target, columns=columns, memory_map=True)
+        return table.to_pandas()
+    except Exception as e:
+        logger.warning("Failed to read Parquet sidecar %s: %s", target, e)
+        return None
+
+
+def load_dataframe(data, columns: list[str] | None = None) -> pd.DataFrame:
+    """
+    Shared loader for the analysis tools.
+
+    Accepts a dataset handle, a list of records, a single record dict, or an
+    upload path. Handles resolve to the registered in-memory frame without
+    copying. Paths are served from the Parquet sidecar when one exists,
+    reading only `columns`; otherwise the original CSV/Excel file is parsed.
+    """
+    if is_handle(data):
+        return dataset_registry.resolve(data)
+    if isinstance(data, str):
+        df = read_sidecar(data, columns)
+        if df is not None:
+            return df
+        if data.endswith(".csv"):
+            return pd.read_csv(data)
+        return pd.read_excel(data)
+    if isinstance(data, dict):
+        return pd.DataFrame([data])
+    return pd.DataFrame(data)
@@ -0,0 +1,194 @@
+import os
+import re
+import json
+import logging
+import threading
+from uuid import uuid4
+import numpy as np
+import pandas as pd
+
+
+RESULTS_DIR = "outputs/results"
+EXPORT_DIR = "outputs/exports"
+EXPORT_FORMATS = {"excel": "xlsx", "csv": "csv", "parquet": "parquet"}
+# Export paths handed to clients; the file itself is built on first download
+EXPORT_NAME = re.compile(r"^analysis_results_([0-9a-f]{32})\.(xlsx|csv|parquet)$")
+# Keys whose list of records is a result's main table
+TABLE_KEYS = ("pairs", "item_statistics", "comparisons", "coefficients", "options")
+
+os.makedirs(RESULTS_DIR, exist_ok=True)
+os.makedirs(EXPORT_DIR, exist_ok=True)
+
+logger = logging.getLogger(__name__)
+
+_build_lock = threading.Lock()
+
+
+def _json_key(key):
+    if isinstance(key, np.generic):
+        key = key.item()
+    if key is None or isinstance(key, (str, int, float, bool)):
+        return key
+    return str(key)
+
+
+def _json_safe(value):
+    """
+    Results in a form `json.dump` accepts: dict keys become strings (frequency
+    tables of date columns are keyed by Timestamps) and numpy scalars become
+    Python scalars. Anything else left over is stringified by `default=str`.
+    """
+    if isinstance(value, dict):
+        return {_json_key(k): _json_safe(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple, set)):
+        return [_json_safe(v) for v in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def save_results(results: dict) -> str:
+    """Persist raw analysis results as JSON and return their result id."""
+    result_id = uuid4().hex
+    path = os.path.join(RESULTS_DIR, f"{result_id}.json")
+    tmp_path = f"{path}.part"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(_json_safe(results), f, default=str)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return result_id
+
+
+def results_path(result_id: str) -> str:
+    return os.path.join(RESULTS_DIR, f"{result_id}.json")
+
+
+def export_paths(result_id: str) -> dict:
+    """Download paths for every export format of a result, keyed by format name."""
+    return {
+        name: os.path.join(EXPORT_DIR, f"analysis_results_{result_id}.{ext}")
+        for name, ext in EXPORT_FORMATS.items()
+    }
+
+
+def _tables(results: dict):
+    """
+    Yield (sheet name, DataFrame) per tool, skipping plot-only outputs.
+    Same tabular layout the Excel export has always used.
+    """
+    for tool, content in results.items():
+        if isinstance(content, dict) and "file" in content and "result" not in content:
+            continue
+        data = content["result"] if isinstance(content, dict) and "result" in content else content
+        # Results built around a per-row table export that table
+        for key in TABLE_KEYS:
+            if isinstance(data, dict) and isinstance(data.get(key), list):
+                data = data[key]
+                break
+        try:
+            if isinstance(data, (list, dict)) and len(data) > 0:
+                yield tool[:31], pd.DataFrame(data)
+            else:
+                yield tool[:31], pd.DataFrame({"Output": [str(data)]})
+        except Exception as e:
+            logger.warning("Skipping export table for %s: %s", tool, e)
+
+
+def _cell(value):
+    """openpyxl cells take scalars only; nested values are written as text."""
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if pd.api.types.is_scalar(value):
+        return None if pd.isna(value) else str(value)
+    return str(value)
+
+
+def _write_xlsx(results: dict, target: str) -> None:
+    """Streaming write_only workbook: rows go straight to disk, no cell objects kept."""
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    sheets = 0
+    for name, df in _tables(results):
+        ws = wb.create_sheet(title=name)
+        ws.append([_cell(col) for col in df.columns])
+        for row in df.itertuples(index=False, name=None):
+            ws.append([_cell(v) for v in row])
+        sheets += 1
+    if sheets == 0:
+        ws = wb.create_sheet(title="Summary")
+        ws.append(["Message"])
+        ws.append(["No tabular data generated."])
+    wb.save(target)
+
+
+def _long_form(results: dict) -> pd.DataFrame:
+    """All tables stacked as (section, row, column, value) text for CSV/Parquet."""
+    frames = []
+    for name, df in _tables(results):
+        n_rows, n_cols = df.shape
+        frames.append(pd.DataFrame({
+            "section": name,
+            "row": np.repeat(df.index.astype(str).to_numpy(), n_cols),
+            "column": np.tile(df.columns.astype(str).to_numpy(), n_rows),
+            "value": df.astype(str).to_numpy().ravel(),
+        }))
+    if not frames:
+        return pd.DataFrame(columns=["section", "row", "column", "value"])
+    return pd.concat(frames, ignore_index=True)
+
+
+def build_export(result_id: str, fmt: str) -> str | None:
+    """
+    Return the export file for a stored result, generating it on first use.
+    Generated files are kept and reused for later downloads. Returns None
+    when the result is unknown.
+    """
+    target = export_paths(result_id)[fmt]
+    if os.path.exists(target):
+        return target
+
+    source = results_path(result_id)
+    if not os.path.exists(source):
+        return None
+
+    with _build_lock:
+        if os.path.exists(target):
+            return target
+        with open(source, encoding="utf-8") as f:
+            results = json.load(f)
+
+        ext = EXPORT_FORMATS[fmt]
+        tmp_path = os.path.join(EXPORT_DIR, f".{result_id}.{uuid4().hex}.{ext}")
+        try:
+            if fmt == "excel":
+                _write_xlsx(results, tmp_path)
+            elif fmt == "csv":
+                _long_form(results).to_csv(tmp_path, index=False)
+            else:
+                _long_form(results).to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, target)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    logger.info("Built %s export for result %s", fmt, result_id)
+    return target
+
+
+def resolve_export(path: str) -> str | None:
+    """
+    Map a requested download path onto a lazily built export. Returns the
+    file path when `path` names an export of a stored result, else None.
+    """
+    if os.path.dirname(path) != os.path.normpath(EXPORT_DIR):
+        return None
+    match = EXPORT_NAME.match(os.path.basename(path))
+    if not match:
+        return None
+    result_id, ext = match.groups()
+    fmt = next(name for name, e in EXPORT_FORMATS.items() if e == ext)
+    return build_export(result_id, fmt)
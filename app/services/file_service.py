@@ -1,25 +1,67 @@
+import io
 import os
-import shutil
+import csv
+import codecs
+import asyncio
+import hashlib
 import logging
 import pandas as pd
 from fastapi import UploadFile, HTTPException
 from uuid import uuid4
-from io import BytesIO
+from typing import BinaryIO
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from app.services.dataset_store import dataset_store, normalize_mixed_columns, read_sidecar, sidecar_path
+from app.services.lifecycle_service import mark_referenced, touch
+from app.services.chunked_analysis import ROW_ESTIMATE_BYTES, estimate_csv_rows
 
 
 UPLOAD_DIR = "temp_uploads"
 MAX_FILE_SIZE_MB = 50
+# Uploads above MAX_FILE_SIZE_MB (up to this cap) are analysed in chunked mode
+MAX_CHUNKED_FILE_SIZE_MB = 4096
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+PARSE_WORKERS = min(2, os.cpu_count() or 1)
+# Text columns with at most this share of distinct values become `category`
+CATEGORY_MAX_RATIO = 0.5
+SNIFF_SAMPLE_BYTES = 64 * 1024
+SNIFF_LINES = 50
+ZIP_MAGIC = b"PK\x03\x04"
+OLE2_MAGIC = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"
+PROBE_CACHE_SIZE = 256
+# Decode-error handler for text sniffed as UTF-8: bytes that are not valid
+# UTF-8 (a cp1252 "é" past the sample) are read as latin-1 instead of failing
+LATIN1_FALLBACK = "latin1-fallback"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
 logger = logging.getLogger(__name__)
 
+_parse_pool: ProcessPoolExecutor | None = None
+_parse_paths: Counter = Counter()
+_probe_cache: OrderedDict[str, dict] = OrderedDict()
 
-async def get_dataset_metadata(dataset: UploadFile) -> dict | None:
+
+def _latin1_fallback(error: UnicodeDecodeError) -> tuple[str, int]:
+    return error.object[error.start:error.end].decode("latin1"), error.end
+
+
+# Registered at import, so parse-pool workers that unpickle `_load_in_worker` get it too
+codecs.register_error(LATIN1_FALLBACK, _latin1_fallback)
+
+
+async def get_dataset_metadata(dataset: UploadFile, upload: tuple[str, str] | None = None) -> dict | None:
     """
     Returns basic metadata of an uploaded dataset without fully processing it.
 
+    Only the header row is parsed. Rows are estimated from the average line
+    length of the first megabyte (CSV) or read from the sheet dimension
+    (Excel). Without `upload`, the probe reads the request's upload stream
+    directly, so nothing is hashed or written to disk; with it, the saved
+    file is probed and the result cached by content hash.
+
     Args:
-        dataset: UploadFile or similar object with `.read()` and `.filename`
+        dataset: UploadFile or similar object with `.file` and `.filename`
+        upload: (path, digest) from an earlier `save_upload` of `dataset`
 
     Returns:
         dict: {
@@ -32,93 +74,344 @@ async def get_dataset_metadata(dataset: UploadFile) -> dict | None:
     if not dataset:
         return None
 
-   
-    content = await dataset.read()
-    dataset.file.seek(0)  
+    if upload is None:
+        try:
+            probe = await asyncio.to_thread(probe_dataset, dataset.file)
+        except Exception as e:
+            logger.warning("Failed to read dataset for metadata: %s", e)
+            return None
+        return {"filename": dataset.filename, **probe}
+    path, digest = upload
+
+    probe = _probe_cache.get(digest)
+    if probe is None:
+        try:
+            probe = await asyncio.to_thread(probe_dataset, path)
+        except Exception as e:
+            logger.warning("Failed to read dataset for metadata: %s", e)
+            return None
+        _probe_cache[digest] = probe
+        while len(_probe_cache) > PROBE_CACHE_SIZE:
+            _probe_cache.popitem(last=False)
+    else:
+        _probe_cache.move_to_end(digest)
+
+    return {"filename": dataset.filename, **probe}
+
 
-   
+def probe_dataset(source: str | BinaryIO) -> dict:
+    """
+    Header-only schema probe of a saved upload path or an open binary file:
+    column names and an estimated row count, no DataFrame. A file object is
+    rewound afterwards so it can still be saved.
+    """
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            return _probe_file(f)
+    source.seek(0)
     try:
-        if dataset.filename.lower().endswith(".csv"):
-            df = pd.read_csv(BytesIO(content))
-        else:
-            df = pd.read_excel(BytesIO(content))
-    except Exception as e:
-        logger.warning("Failed to read dataset for metadata: %s", e)
-        return None
+        return _probe_file(source)
+    finally:
+        source.seek(0)
+
+
+def _probe_file(f: BinaryIO) -> dict:
+    head = f.read(ROW_ESTIMATE_BYTES)
+    sniffed = _sniff_sample(head[:SNIFF_SAMPLE_BYTES])
+
+    if sniffed["format"] == "csv":
+        size = f.seek(0, os.SEEK_END)
+        header = pd.read_csv(
+            io.BytesIO(head),
+            encoding=sniffed["encoding"],
+            encoding_errors=sniffed["encoding_errors"],
+            sep=sniffed["delimiter"],
+            nrows=0,
+        )
+        columns = [str(col) for col in header.columns]
+        num_rows = estimate_csv_rows(head, size)
+    elif sniffed["format"] == "xlsx":
+        from openpyxl import load_workbook
+
+        f.seek(0)
+        wb = load_workbook(f, read_only=True)
+        try:
+            ws = wb.active
+            columns = [str(col) for col in next(ws.iter_rows(max_row=1, values_only=True), ())]
+            # max_row comes from the sheet's <dimension> tag when the writer set one
+            max_row = ws.max_row
+            if max_row is None:
+                max_row = sum(1 for _ in ws.iter_rows(values_only=True))
+            num_rows = max(max_row - 1, 0)
+        finally:
+            wb.close()
+    else:
+        import xlrd
+
+        f.seek(0)
+        wb = xlrd.open_workbook(file_contents=f.read(), on_demand=True)
+        try:
+            sheet = wb.sheet_by_index(0)
+            columns = [str(col) for col in sheet.row_values(0)] if sheet.nrows else []
+            num_rows = max(sheet.nrows - 1, 0)
+        finally:
+            wb.release_resources()
 
     return {
-        "filename": dataset.filename,
-        "num_rows": len(df),
-        "num_columns": len(df.columns),
-        "columns": list(df.columns)
+        "num_rows": num_rows,
+        "num_columns": len(columns),
+        "columns": columns,
     }
 
 
-async def save_and_load_dataset(file: UploadFile) -> tuple[str, pd.DataFrame]:
+async def save_upload(file: UploadFile, max_mb: int = MAX_FILE_SIZE_MB) -> tuple[str, str]:
     """
-    Save uploaded file to temp folder and load as DataFrame.
-    Supports CSV and Excel (.xls, .xlsx). Handles encoding and engine fallbacks.
+    Stream an upload into the content-addressed store under UPLOAD_DIR.
+
+    Chunks are read asynchronously, hashed, and written from a worker thread,
+    so the event loop never blocks on disk I/O. The size cap is enforced on
+    the bytes actually received: the upload is cut off as soon as it exceeds
+    `max_mb`. The file is stored as `<sha256>.<ext>`; re-uploading
+    identical content reuses the existing file.
+
+    Returns:
+        (path, sha256 hex digest)
     """
-    if getattr(file, "size", None) and file.size > MAX_FILE_SIZE_MB * 1024 * 1024:
+    max_bytes = max_mb * 1024 * 1024
+    if getattr(file, "size", None) and file.size > max_bytes:
         raise HTTPException(status_code=413, detail="File too large")
 
     ext = (file.filename or "").split(".")[-1].lower()
-    path = os.path.join(UPLOAD_DIR, f"{uuid4()}.{ext or 'dat'}")
+    tmp_path = os.path.join(UPLOAD_DIR, f".{uuid4().hex}.part")
+    hasher = hashlib.sha256()
+    received = 0
 
-    with open(path, "wb") as f:
-        shutil.copyfileobj(file.file, f)
+    f = await asyncio.to_thread(open, tmp_path, "wb")
+    try:
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            received += len(chunk)
+            if received > max_bytes:
+                raise HTTPException(status_code=413, detail="File too large")
+            hasher.update(chunk)
+            await asyncio.to_thread(f.write, chunk)
+    except BaseException:
+        f.close()
+        os.remove(tmp_path)
+        raise
+    await asyncio.to_thread(f.close)
+
+    digest = hasher.hexdigest()
+    path = os.path.join(UPLOAD_DIR, f"{digest}.{ext or 'dat'}")
+    if os.path.exists(path):
+        os.remove(tmp_path)
+        touch(path)
+        touch(sidecar_path(path))
+    else:
+        os.replace(tmp_path, path)
+    # Protects the upload between saving and the analysis pinning it with `in_use`
+    mark_referenced([path])
+
+    return path, digest
+
+
+def sniff_format(path: str) -> dict:
+    """
+    Decide how to parse an upload from its first bytes, ignoring the extension.
 
+    ZIP containers are read as .xlsx (openpyxl), OLE2 compound files as .xls
+    (xlrd), and anything else as delimited text. For text, the encoding and
+    delimiter are detected from a small sample so the file is parsed once;
+    non-UTF-8 bytes beyond the sample decode as latin-1 (`encoding_errors`).
+    """
+    with open(path, "rb") as f:
+        return _sniff_sample(f.read(SNIFF_SAMPLE_BYTES))
+
+
+def _sniff_sample(sample: bytes) -> dict:
+    if sample.startswith(ZIP_MAGIC):
+        return {"format": "xlsx", "engine": "openpyxl"}
+    if sample.startswith(OLE2_MAGIC):
+        return {"format": "xls", "engine": "xlrd"}
+
+    if sample.startswith(codecs.BOM_UTF8):
+        encoding = "utf-8-sig"
+    elif sample.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        encoding = "utf-16"
+    else:
+        if b"\x00" in sample:
+            raise ValueError("File is neither CSV text nor an Excel workbook")
+        try:
+            sample.decode("utf-8")
+            encoding = "utf-8"
+        except UnicodeDecodeError as e:
+            # A multi-byte character cut off by the sample boundary is still UTF-8
+            encoding = "utf-8" if e.start >= len(sample) - 3 else "latin1"
+
+    # The sniffer only needs a few complete lines, not the whole sample
+    text = "\n".join(sample.decode(encoding, errors="ignore").splitlines()[:SNIFF_LINES])
     try:
-        
-        df = None
-        if ext == "csv":
-            try:
-                df = pd.read_csv(path)
-            except (UnicodeDecodeError, ValueError):
-                df = pd.read_csv(path, encoding="latin1")
-        elif ext in {"xls", "xlsx"}:
-            last_exc = None
-            for engine in (None, "openpyxl", "xlrd"):
-                try:
-                    df = pd.read_excel(path, engine=engine)
-                    break
-                except Exception as e:
-                    last_exc = e
-                    continue
-            if df is None:
-                msg = f"Failed to parse Excel file: {last_exc}"
-                raise Exception(msg)
-        else:
-            # unknown extension: try CSV then Excel
-            try:
-                df = pd.read_csv(path)
-            except Exception as e_csv:
-                last_exc = None
-                for engine in (None, "openpyxl", "xlrd"):
-                    try:
-                        df = pd.read_excel(path, engine=engine)
-                        break
-                    except Exception as e_xl:
-                        last_exc = e_xl
-                        continue
-                else:
-                    msg = f"Could not parse file as CSV ({e_csv}) or Excel ({last_exc})"
-                    raise Exception(msg)
+        delimiter = csv.Sniffer().sniff(text, delimiters=",;\t|").delimiter
+    except csv.Error:
+        delimiter = ","
+
+    return {
+        "format": "csv",
+        "encoding": encoding,
+        "encoding_errors": LATIN1_FALLBACK if encoding == "utf-8" else "strict",
+        "delimiter": delimiter,
+    }
+
+
+def _parse_dataset(path: str, sniffed: dict) -> pd.DataFrame:
+    """
+    Parse a saved upload exactly once, using the result of `sniff_format`.
+    Runs inside the parse pool, so it must stay a picklable module-level function.
+    """
+    if sniffed["format"] == "csv":
+        return pd.read_csv(
+            path,
+            encoding=sniffed["encoding"],
+            encoding_errors=sniffed["encoding_errors"],
+            sep=sniffed["delimiter"],
+        )
+    return pd.read_excel(path, engine=sniffed["engine"])
+
+
+def record_parse_path(sniffed: dict, prefix: str = "") -> None:
+    _parse_paths[prefix + ":".join(str(v) for v in sniffed.values())] += 1
+
+
+def parse_metrics() -> dict:
+    """Counts of the parse paths chosen by `sniff_format` in this process."""
+    return dict(_parse_paths)
+
+
+def optimize_dtypes(df: pd.DataFrame) -> tuple[pd.DataFrame, dict]:
+    """
+    Shrink a freshly parsed frame without changing any values.
+
+    - low-cardinality text columns -> `category`
+    - remaining text columns -> Arrow-backed `string[pyarrow]`
+    - integers -> smallest integer type that holds them
+    - floats -> float32 only when the round trip is exact
+
+    Returns the optimized frame and a before/after memory report.
+    """
+    before = df.memory_usage(index=True, deep=True)
+    conversions = {}
+    n_rows = len(df)
+
+    for col in df.columns:
+        s = df[col]
+        old_dtype = str(s.dtype)
+        if pd.api.types.is_object_dtype(s) or pd.api.types.is_string_dtype(s):
+            if pd.api.types.infer_dtype(s, skipna=True) != "string":
+                continue
+            n_unique = s.nunique(dropna=True)
+            if n_rows and n_unique / n_rows <= CATEGORY_MAX_RATIO:
+                df[col] = s.astype("category")
+            elif pd.api.types.is_object_dtype(s):
+                df[col] = s.astype("string[pyarrow]")
+        elif pd.api.types.is_integer_dtype(s) and not isinstance(s.dtype, pd.api.extensions.ExtensionDtype):
+            df[col] = pd.to_numeric(s, downcast="integer")
+        elif pd.api.types.is_float_dtype(s) and s.dtype != "float32":
+            narrowed = s.astype("float32")
+            if (narrowed.astype(s.dtype) == s)[s.notna()].all():
+                df[col] = narrowed
+        if str(df[col].dtype) != old_dtype:
+            conversions[col] = f"{old_dtype} -> {df[col].dtype}"
+
+    before_bytes = int(before.sum())
+    after_bytes = int(df.memory_usage(index=True, deep=True).sum())
+    report = {
+        "before_bytes": before_bytes,
+        "after_bytes": after_bytes,
+        "saved_pct": round((1 - after_bytes / before_bytes) * 100, 2) if before_bytes else 0.0,
+        "conversions": conversions,
+    }
+    return df, report
+
+
+def _load_in_worker(path: str, sniffed: dict) -> pd.DataFrame:
+    """Parse and dtype-optimize an upload inside the parse pool."""
+    df = _parse_dataset(path, sniffed)
+    if df.empty:
+        return df
+    df.columns = [str(col) for col in df.columns]
+    df = normalize_mixed_columns(df)
+    df, report = optimize_dtypes(df)
+    df.attrs["memory_report"] = report
+    return df
+
+
+def _get_parse_pool() -> ProcessPoolExecutor:
+    global _parse_pool
+    if _parse_pool is None:
+        _parse_pool = ProcessPoolExecutor(max_workers=PARSE_WORKERS)
+    return _parse_pool
+
+
+def shutdown_parse_pool() -> None:
+    global _parse_pool
+    if _parse_pool is not None:
+        _parse_pool.shutdown(wait=False, cancel_futures=True)
+        _parse_pool = None
+
+
+async def save_and_load_dataset(file: UploadFile) -> tuple[str, pd.DataFrame]:
+    """
+    Save uploaded file to temp folder and load as DataFrame.
+    Supports CSV and Excel (.xls, .xlsx); the parser, encoding and delimiter
+    are chosen up front by `sniff_format`.
+    """
+    path, digest = await save_upload(file)
+    return path, await load_saved_dataset(path, digest, file.filename)
+
+
+async def load_saved_dataset(path: str, digest: str, filename: str | None = None) -> pd.DataFrame:
+    """
+    Load an upload already written by `save_upload`.
+
+    Parsed frames are cached by content hash, so re-posting the same file
+    skips parsing entirely. Parsing itself runs in a bounded process pool
+    to keep pandas/openpyxl off the event loop.
+    """
+    cached = dataset_store.get(digest)
+    if cached is not None:
+        logger.info("Dataset cache hit for %s (%s)", filename, digest[:12])
+        return cached
+
+    # A previous request already parsed and header-cleaned this upload
+    df = await asyncio.to_thread(read_sidecar, path)
+    if df is not None:
+        logger.info("Loaded %s from Parquet sidecar", filename)
+        dataset_store.put(digest, df)
+        return df.copy(deep=False)
+
+    try:
+        sniffed = await asyncio.to_thread(sniff_format, path)
+        record_parse_path(sniffed)
+        logger.info("Parsing %s as %s", filename, sniffed)
+        loop = asyncio.get_running_loop()
+        df = await loop.run_in_executor(_get_parse_pool(), _load_in_worker, path, sniffed)
     except Exception as e:
-        try:
-            os.remove(path)
-        except Exception:
-            logger.debug("Failed to remove file after parse failure: %s", path, exc_info=True)
-        logger.exception("Failed to parse uploaded dataset %s: %s", file.filename, e)
+        # The content-addressed file may be shared with another in-flight
+        # request; the lifecycle sweeper removes it once unreferenced
+        logger.exception("Failed to parse uploaded dataset %s: %s", filename, e)
         raise HTTPException(status_code=400, detail=f"Invalid dataset format: {str(e)}")
 
     if df.empty:
-        logger.warning("Uploaded dataset parsed but is empty: %s", file.filename)
+        logger.warning("Uploaded dataset parsed but is empty: %s", filename)
         raise HTTPException(status_code=400, detail="Dataset is empty")
 
-    df.columns = [str(col) for col in df.columns]
+    report = df.attrs.get("memory_report", {})
+    logger.info(
+        "Loaded %s: %s -> %s bytes after dtype optimization",
+        filename, report.get("before_bytes"), report.get("after_bytes"),
+    )
+    dataset_store.put(digest, df)
 
-    return path, df
+    return df.copy(deep=False)
 
 
 def export_results_to_excel(results: dict, excel_path: str = "analysis_results.xlsx") -> str:
@@ -0,0 +1,258 @@
+import json
+import asyncio
+import logging
+from app.core.llm import get_llm
+
+logger = logging.getLogger(__name__)
+llm = get_llm()
+
+# Categories listed per column in the compact descriptive table
+TOP_CATEGORIES = 5
+# Significant pairs listed from an association screen or group comparison
+TOP_PAIRS = 15
+# Items listed from a reliability analysis, weakest item-total correlation first
+TOP_ITEMS = 15
+# Upper bound for any single compacted section sent to the LLM
+MAX_SECTION_CHARS = 4000
+FAILED_INTERPRETATION = "Statistical output generated, but interpretation failed."
+
+
+def _fmt(value) -> str:
+    if value is None:
+        return "-"
+    if isinstance(value, float):
+        return f"{value:.4g}"
+    return str(value)
+
+
+def _table(headers: list[str], rows: list[list]) -> str:
+    lines = [
+        "| " + " | ".join(headers) + " |",
+        "|" + "---|" * len(headers),
+    ]
+    lines += ["| " + " | ".join(_fmt(v) for v in row) + " |" for row in rows]
+    return "\n".join(lines)
+
+
+def _compact_descriptive(output: dict) -> str:
+    """One row per column instead of the full frequency dicts."""
+    categorical, numeric, other = [], [], []
+    for col, info in output.items():
+        if not isinstance(info, dict):
+            continue
+        kind = info.get("type")
+        if kind == "numeric":
+            numeric.append([
+                col, info.get("count"), info.get("missing"), info.get("mean"),
+                info.get("sd"), info.get("median"), info.get("min"), info.get("max"),
+            ])
+        elif kind == "categorical" and not info.get("high_cardinality"):
+            pct = info.get("percentages", {})
+            top = ", ".join(f"{label} ({p}%)" for label, p in list(pct.items())[:TOP_CATEGORIES])
+            categorical.append([col, info.get("n_levels"), info.get("missing"), top])
+        else:
+            other.append(f"- {col}: {kind}" + (" (too many distinct values to summarise)" if info.get("high_cardinality") else ""))
+
+    parts = []
+    if categorical:
+        parts.append(_table(["Column", "Levels", "Missing", "Top categories"], categorical))
+    if numeric:
+        parts.append(_table(["Column", "N", "Missing", "Mean", "SD", "Median", "Min", "Max"], numeric))
+    parts += other
+    return "\n\n".join(parts)
+
+
+def _compact_generic(output) -> str:
+    """Scalar fields as a Statistic/Value table; nested values as truncated JSON."""
+    if not isinstance(output, dict):
+        return str(output)
+    scalars = [[key, value] for key, value in output.items() if not isinstance(value, (dict, list))]
+    nested = {key: value for key, value in output.items() if isinstance(value, (dict, list))}
+    parts = []
+    if scalars:
+        parts.append(_table(["Statistic", "Value"], scalars))
+    # Expected frequencies are bookkeeping, not something to narrate
+    nested.pop("expected_frequencies", None)
+    if nested:
+        parts.append(json.dumps(nested, default=str))
+    return "\n\n".join(parts)
+
+
+def _compact_association(output: dict) -> str:
+    """Counts plus the strongest significant pairs; the full list stays in the export."""
+    significant = [pair for pair in output.get("pairs", []) if pair.get("significant")]
+    lines = [
+        f"{output.get('columns_tested')} columns, {output.get('n_pairs')} pairs tested, "
+        f"{output.get('n_significant')} significant ({output.get('correction')})."
+    ]
+    if significant:
+        rows = [
+            [p["var_1"], p["var_2"], p["chi_square"], p["degrees_of_freedom"], p["p_adjusted"], p["cramers_v"]]
+            for p in significant[:TOP_PAIRS]
+        ]
+        lines.append(_table(["Variable 1", "Variable 2", "Chi-square", "df", "Adjusted p", "Cramer's V"], rows))
+    return "\n\n".join(lines)
+
+
+def _compact_reliability(output: dict) -> str:
+    """Scale-level statistics plus the weakest items, which are what a reader acts on."""
+    scale = {key: value for key, value in output.items() if key != "item_statistics"}
+    parts = [_compact_generic(scale)]
+    items = sorted(
+        output.get("item_statistics", []),
+        key=lambda item: -1 if item.get("item_total_correlation") is None else item["item_total_correlation"],
+    )
+    if items:
+        rows = [
+            [item["item"], item["scoring"], item["item_total_correlation"], item["alpha_if_deleted"]]
+            for item in items[:TOP_ITEMS]
+        ]
+        parts.append(_table(["Item", "Scoring", "Item-total r", "Alpha if deleted"], rows))
+    return "\n\n".join(parts)
+
+
+def _compact_group_comparison(output: dict) -> str:
+    """Counts plus the clearest group differences; group means stay in the export."""
+    significant = [c for c in output.get("comparisons", []) if c.get("significant")]
+    lines = [
+        f"{output.get('n_comparisons')} comparisons, {output.get('n_significant')} significant "
+        f"({output.get('correction')})."
+    ]
+    if significant:
+        rows = []
+        for c in significant[:TOP_PAIRS]:
+            effect = ", ".join(f"{name} {_fmt(value)}" for name, value in c["effect_size"].items())
+            means = "; ".join(f"{g['level']}: {_fmt(g['mean'])}" for g in c["groups"][:TOP_CATEGORIES])
+            rows.append([c["outcome"], c["group"], c["test"], c["statistic"], c["p_adjusted"], effect, means])
+        lines.append(_table(["Outcome", "Groups", "Test", "Statistic", "Adjusted p", "Effect size", "Group means"], rows))
+    return "\n\n".join(lines)
+
+
+def _compact_logistic(output: dict) -> str:
+    """Model fit plus the odds-ratio table; the intercept is left out."""
+    fit = output.get("fit", {})
+    parts = [
+        f"Outcome: {output.get('outcome')} = {output.get('event')} (vs {output.get('reference_outcome')}), "
+        f"n = {output.get('n')}. Reference levels: "
+        + ", ".join(f"{col} = {level}" for col, level in output.get("reference_levels", {}).items()),
+        _table(["Statistic", "Value"], [[key, value] for key, value in fit.items()]),
+    ]
+    rows = [
+        [c["term"], c["odds_ratio"], f"{_fmt(c['ci_95'][0])} to {_fmt(c['ci_95'][1])}", c["p_value"]]
+        for c in output.get("coefficients", [])
+        if c.get("predictor")
+    ]
+    if rows:
+        parts.append(_table(["Term", "Odds ratio", "95% CI", "p"], rows[:TOP_ITEMS * 2]))
+    return "\n\n".join(parts)
+
+
+def _compact_multi_select(output: dict) -> str:
+    """Option shares per column plus the significant option-by-group differences."""
+    parts = []
+    for col in output.get("columns", []):
+        options = [o for o in output.get("options", []) if o["column"] == col["column"]]
+        parts.append(
+            f"{col['column']}: {col['respondents']} respondents, {col['n_options']} options, "
+            f"{_fmt(col['mean_selections'])} picked on average. "
+            + ", ".join(f"{o['option']} ({o['percent_of_respondents']}%)" for o in options[:TOP_ITEMS])
+        )
+    significant = [row for row in output.get("crosstabs", []) if row.get("significant")]
+    if output.get("n_tests"):
+        parts.append(f"{output['n_tests']} option-by-group tests, {output['n_significant']} significant ({output.get('correction')}).")
+    if significant:
+        rows = [
+            [r["column"], r["option"], r["by"], r["chi_square"], r["p_adjusted"], r["cramers_v"]]
+            for r in significant[:TOP_PAIRS]
+        ]
+        parts.append(_table(["Column", "Option", "By", "Chi-square", "Adjusted p", "Cramer's V"], rows))
+    return "\n\n".join(parts)
+
+
+COMPACTORS = {
+    "descriptive_statistics": _compact_descriptive,
+    "association_matrix": _compact_association,
+    "cronbach_alpha": _compact_reliability,
+    "group_comparison": _compact_group_comparison,
+    "logistic_regression": _compact_logistic,
+    "multi_select_analysis": _compact_multi_select,
+}
+
+
+def compact_output(tool_name: str, output) -> str:
+    """Render a tool result as a short summary table for interpretation."""
+    try:
+        text = COMPACTORS.get(tool_name, _compact_generic)(output)
+    except Exception as e:
+        logger.warning("Compacting %s output failed: %s", tool_name, e)
+        text = str(output)
+    if len(text) > MAX_SECTION_CHARS:
+        text = text[:MAX_SECTION_CHARS] + "\n... (truncated)"
+    return text
+
+
+def _content(response) -> str:
+    return getattr(response, "content", str(response)).strip()
+
+
+async def _interpret_one(heading: str, summary: str) -> str:
+    prompt = f"Interpret the following statistical output ({heading}) in simple language:\n\n{summary}"
+    try:
+        return _content(await llm.ainvoke(prompt))
+    except Exception as e:
+        logger.error("LLM interpretation failed for %s: %s", heading, e)
+        return FAILED_INTERPRETATION
+
+
+async def _interpret_batch(sections: list[tuple[str, str]]) -> dict[int, str]:
+    """One call for all sections; returns whatever section ids came back."""
+    blocks = "\n\n".join(
+        f"## Section {i + 1}: {heading}\n{summary}" for i, (heading, summary) in enumerate(sections)
+    )
+    prompt = f"""
+    Interpret each of the following statistical outputs in simple language.
+    Treat every section independently and do not repeat the tables.
+
+    {blocks}
+
+    Return ONLY a JSON object mapping section numbers to interpretations:
+    {{"1": "interpretation of section 1", "2": "..."}}
+    """
+    try:
+        content = _content(await llm.ainvoke(prompt))
+        if "```json" in content:
+            content = content.split("```json")[1].split("```")[0].strip()
+        elif "```" in content:
+            content = content.split("```")[1].split("```")[0].strip()
+        parsed = json.loads(content)
+    except Exception as e:
+        logger.error("Batched LLM interpretation failed: %s", e)
+        return {}
+
+    texts = {}
+    for key, text in parsed.items():
+        if str(key).isdigit() and isinstance(text, str) and text.strip():
+            texts[int(key) - 1] = text.strip()
+    return texts
+
+
+async def interpret_sections(sections: list[tuple[str, str, object]]) -> list[str]:
+    """
+    Interpret `(heading, tool_name, output)` sections, returning one text per
+    section in the same order.
+
+    Outputs are compacted into summary tables and sent in a single batched
+    call; any section missing from the batched reply is retried on its own,
+    concurrently with the others.
+    """
+    if not sections:
+        return []
+
+    compact = [(heading, compact_output(tool_name, output)) for heading, tool_name, output in sections]
+    texts = await _interpret_batch(compact) if len(compact) > 1 else {}
+
+    missing = [i for i in range(len(compact)) if i not in texts]
+    if missing:
+        retried = await asyncio.gather(*(_interpret_one(*compact[i]) for i in missing))
+        texts.update(zip(missing, retried))
+    return [texts[i] for i in range(len(compact))]
@@ -0,0 +1,180 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from typing import Iterable
+
+
+# Per-directory time-to-live, measured from a file's last use
+MANAGED_DIRS = {
+    "temp_uploads": 24 * 3600,
+    "outputs/plots": 24 * 3600,
+    "outputs/exports": 24 * 3600,
+    "outputs/results": 24 * 3600,
+    "cache/tool_results": 24 * 3600,
+}
+# Size budget for generated outputs and caches
+MAX_TOTAL_MB = 1024
+# Extra room for uploads; size it to the instance's disk (UPLOAD_BUDGET_MB env var).
+# Uploads being analysed are never evicted, so one may exceed it while in use
+UPLOAD_BUDGET_MB = int(os.getenv("UPLOAD_BUDGET_MB", "1024"))
+# Files linked from a response this recently are never deleted
+REFERENCE_TTL_SECONDS = 3600
+SWEEP_INTERVAL_SECONDS = 600
+
+logger = logging.getLogger(__name__)
+
+_references: dict[str, float] = {}
+_in_use: Counter = Counter()
+_in_use_lock = threading.Lock()
+_task: asyncio.Task | None = None
+
+
+def mark_referenced(paths: Iterable[str]) -> None:
+    """Record that `paths` were just handed to a client (response link, download)."""
+    now = time.time()
+    for path in paths:
+        if path:
+            _references[os.path.normpath(path)] = now
+
+
+@contextmanager
+def in_use(paths: Iterable[str]):
+    """Keep `paths` (and files sharing their stem) from being swept while the block runs."""
+    paths = [os.path.normpath(path) for path in paths if path]
+    with _in_use_lock:
+        _in_use.update(paths)
+    try:
+        yield
+    finally:
+        with _in_use_lock:
+            _in_use.subtract(paths)
+            for path in paths:
+                if _in_use[path] <= 0:
+                    del _in_use[path]
+
+
+def budget_bytes() -> int:
+    """Combined disk budget of MANAGED_DIRS: MAX_TOTAL_MB plus UPLOAD_BUDGET_MB."""
+    return (MAX_TOTAL_MB + UPLOAD_BUDGET_MB) * 1024 * 1024
+
+
+def touch(path: str) -> None:
+    """Bump a reused file's mtime so TTL and LRU count from its latest use."""
+    try:
+        os.utime(path)
+    except OSError:
+        logger.debug("Failed to touch %s", path, exc_info=True)
+
+
+def _scan(directory: str) -> dict[str, list[os.DirEntry]]:
+    """
+    Group a directory's files by stem, so an upload and its Parquet sidecar
+    (same content hash, different suffix) live and die together.
+    """
+    groups: dict[str, list[os.DirEntry]] = {}
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                if entry.is_file(follow_symlinks=False):
+                    stem = entry.name.split(".")[0] or entry.name
+                    groups.setdefault(stem, []).append(entry)
+    except FileNotFoundError:
+        pass
+    return groups
+
+
+def sweep(now: float | None = None) -> dict:
+    """
+    One lifecycle pass over MANAGED_DIRS.
+
+    1. Delete file groups whose last use is older than their directory's TTL.
+    2. If the remaining total still exceeds `budget_bytes()`, delete the
+       least recently used groups until it fits.
+
+    Groups containing a file referenced within REFERENCE_TTL_SECONDS, or one
+    held by `in_use` (an upload being analysed), are kept in both steps.
+    """
+    now = now or time.time()
+    for path, ts in list(_references.items()):
+        if now - ts > REFERENCE_TTL_SECONDS:
+            _references.pop(path, None)
+
+    candidates = []
+    total_bytes = 0
+    stats = {"deleted_files": 0, "freed_bytes": 0, "kept_referenced": 0, "kept_in_use": 0}
+    with _in_use_lock:
+        busy = set(_in_use)
+
+    def remove(entries):
+        for entry in entries:
+            try:
+                os.remove(entry.path)
+                stats["deleted_files"] += 1
+            except FileNotFoundError:
+                pass
+            except OSError:
+                logger.warning("Failed to delete %s", entry.path, exc_info=True)
+
+    for directory, ttl in MANAGED_DIRS.items():
+        for stem, entries in _scan(directory).items():
+            stat = [entry.stat() for entry in entries]
+            size = sum(st.st_size for st in stat)
+            last_used = max(st.st_mtime for st in stat)
+            if any(os.path.normpath(e.path) in busy for e in entries):
+                stats["kept_in_use"] += 1
+                total_bytes += size
+                continue
+            if any(os.path.normpath(e.path) in _references for e in entries):
+                stats["kept_referenced"] += 1
+                total_bytes += size
+                continue
+            if now - last_used > ttl:
+                remove(entries)
+                stats["freed_bytes"] += size
+                continue
+            total_bytes += size
+            candidates.append((last_used, size, entries))
+
+    budget = budget_bytes()
+    if total_bytes > budget:
+        for last_used, size, entries in sorted(candidates, key=lambda c: c[0]):
+            if total_bytes <= budget:
+                break
+            remove(entries)
+            stats["freed_bytes"] += size
+            total_bytes -= size
+
+    stats["total_bytes"] = total_bytes
+    if stats["deleted_files"]:
+        logger.info("Lifecycle sweep: %s", stats)
+    return stats
+
+
+async def _run_forever() -> None:
+    while True:
+        try:
+            await asyncio.to_thread(sweep)
+        except Exception:
+            logger.exception("Lifecycle sweep failed")
+        await asyncio.sleep(SWEEP_INTERVAL_SECONDS)
+
+
+def start() -> None:
+    global _task
+    if _task is None:
+        _task = asyncio.create_task(_run_forever())
+
+
+async def stop() -> None:
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
@@ -2,7 +2,8 @@ import json
 import logging
 from crewai import Task
 from app.agents.orchestrator import orchestrator_agent
-from app.services.analysis_service import run_analysis
+from app.services.analysis_service import run_analysis, heavy_clean_column
+from app.services.file_service import get_dataset_metadata
 from app.services.literature_service import run_literature_review
 from app.services.discussion_service import run_discussion_service
 from app.services.chat_service import run_chat_service  
@@ -15,6 +16,7 @@ async def run_pipeline(
     mode: str | None = None,
     word_count: int = 500,
     tone: str = "formal",
+    debug: bool = False,
     **kwargs 
 ):
     """
@@ -26,6 +28,16 @@ async def run_pipeline(
 
     # --- Step 1: Orchestration & Planning ---
     if user_message:
+        # Header-only probe of the upload stream so the planner sees real column
+        # names; the upload is only saved if the plan runs an analysis
+        dataset_context = ""
+        metadata = await get_dataset_metadata(dataset) if dataset else None
+        if metadata:
+            columns = [heavy_clean_column(col) for col in metadata["columns"]]
+            dataset_context = (
+                f"6. Dataset schema: {metadata['num_rows']} rows, columns: {columns}"
+            )
+
         # The Orchestrator now decides if the intent is "chat" or "research"
         task = Task(
             description=f"""
@@ -40,6 +52,14 @@ CRITICAL INSTRUCTIONS:
 3. NEVER add a 'hue' unless the user explicitly uses comparison keywords like 'by', 'vs', 'relationship'.
 4. Do NOT invent column names.
 5. System context: A dataset HAS already been provided. Do NOT ask for it.
+{dataset_context}
+7. For "cronbach_alpha", list the scale's item columns in "items" when the user names a scale; otherwise set it to null.
+8. For "group_comparison" (numeric variables compared across groups, e.g. "does age differ by gender"), put the numeric columns in "outcomes" and the grouping columns in "groups"; otherwise set both to null.
+9. For "logistic_regression" (predictors or odds ratios of a yes/no outcome), put the outcome column alone in "outcomes" and the explanatory columns in "predictors"; otherwise set "predictors" to null.
+10. For "multi_select_analysis" (questions where respondents could pick several answers, e.g. "Bank; Cash"), put that column in "column" and any columns to break it down by in "groups".
+11. Set "multi_select" to true on a countplot only when the user says the plotted question allows several answers per respondent; otherwise null.
+12. Set "approximate" to true for descriptive statistics or plots only when the user asks for a quick or approximate result, false when they ask for exact figures, and null otherwise.
+13. For plots, put the plotted column in "column" and a comparison column in "hue" (null unless rule 3 allows one). For "chi_square_test", put the two variables in "column" and "predictors".
 
 Return STRICT JSON:
 {{
@@ -55,7 +75,15 @@ Return STRICT JSON:
     {{
       "tool": string,
       "reason": string,
-      "interpret": boolean | null
+      "interpret": boolean | null,
+      "column": string | null,
+      "hue": string | null,
+      "items": [string] | null,
+      "outcomes": [string] | null,
+      "groups": [string] | null,
+      "predictors": [string] | null,
+      "approximate": boolean | null,
+      "multi_select": boolean | null
     }}
   ],
   "discussion_plan": {{
@@ -125,6 +153,7 @@ Return STRICT JSON:
             dataset=dataset,
             analysis_plan=plan.get("analysis_plan", []),
             user_message=user_message,
+            debug=debug,
         )
 
     # --- Step 4: Discussion Stage ---
@@ -175,12 +204,16 @@ Return STRICT JSON:
         }
 
     if mode == "analysis":
-        return {
+        response = {
             "type": "analysis",
             "content": analysis.get("content") if isinstance(analysis, dict) else str(analysis),
             "visuals": visuals,
             "exports": exports,
+            "export_formats": analysis.get("export_formats", {}) if isinstance(analysis, dict) else {},
         }
+        if debug and isinstance(analysis, dict) and "debug" in analysis:
+            response["debug"] = analysis["debug"]
+        return response
 
     # Full pipeline
     full_text = []
@@ -193,6 +226,7 @@ Return STRICT JSON:
         "content": "\n\n---\n\n".join(full_text),
         "visuals": visuals,
         "exports": exports,
+        "export_formats": analysis.get("export_formats", {}) if isinstance(analysis, dict) else {},
         "literature": literature,
         "analysis": analysis,
         "discussion": discussion_block, 
@@ -0,0 +1,89 @@
+import os
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Awaitable, Callable
+
+
+# Threads rather than processes: tools share the registered in-memory frame
+# through its handle, and numpy/pandas/matplotlib release the GIL for the
+# heavy parts. Bounded so a large plan cannot oversubscribe the host.
+CPU_WORKERS = min(4, os.cpu_count() or 1)
+
+logger = logging.getLogger(__name__)
+
+_cpu_pool: ThreadPoolExecutor | None = None
+
+
+def _get_cpu_pool() -> ThreadPoolExecutor:
+    global _cpu_pool
+    if _cpu_pool is None:
+        _cpu_pool = ThreadPoolExecutor(max_workers=CPU_WORKERS, thread_name_prefix="aira-step")
+    return _cpu_pool
+
+
+def shutdown_cpu_pool() -> None:
+    global _cpu_pool
+    if _cpu_pool is not None:
+        _cpu_pool.shutdown(wait=False, cancel_futures=True)
+        _cpu_pool = None
+
+
+async def run_cpu(fn: Callable, *args, **kwargs) -> Any:
+    """Run a CPU-bound call (tool, render) on the bounded worker pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_cpu_pool(), partial(fn, *args, **kwargs))
+
+
+def build_dependency_graph(plan: list[dict]) -> dict[int, set[int]]:
+    """
+    Map each step index to the indices it must wait for.
+
+    Steps are independent unless they declare `depends_on`, given as earlier
+    step indices or tool names (a tool name waits for every earlier step
+    using that tool). Forward and self references are ignored, so the graph
+    is always acyclic.
+    """
+    graph: dict[int, set[int]] = {}
+    for index, step in enumerate(plan):
+        deps = step.get("depends_on") or []
+        if isinstance(deps, (str, int)):
+            deps = [deps]
+        wanted = set()
+        for dep in deps:
+            if isinstance(dep, int) and 0 <= dep < index:
+                wanted.add(dep)
+            elif isinstance(dep, str):
+                wanted.update(i for i in range(index) if plan[i].get("tool") == dep)
+        graph[index] = wanted
+    return graph
+
+
+async def execute_plan(
+    plan: list[dict],
+    run_step: Callable[[int, dict], Awaitable[Any]],
+) -> list[Any]:
+    """
+    Run `run_step(index, step)` for every step, starting each one as soon as
+    its dependencies have finished. Returns one entry per step in plan order:
+    the step's return value, or the exception it raised (a cancelled step
+    yields its CancelledError, a BaseException). A failed step does not
+    cancel others, including those that depend on it.
+    """
+    graph = build_dependency_graph(plan)
+    tasks: dict[int, asyncio.Task] = {}
+
+    async def _run(index: int, step: dict):
+        if graph[index]:
+            await asyncio.gather(*(tasks[i] for i in graph[index]), return_exceptions=True)
+        return await run_step(index, step)
+
+    for index, step in enumerate(plan):
+        tasks[index] = asyncio.create_task(_run(index, step))
+
+    outcomes = await asyncio.gather(*tasks.values(), return_exceptions=True)
+    for index, outcome in enumerate(outcomes):
+        if isinstance(outcome, BaseException):
+            logger.error("Plan step %d (%s) failed: %s", index, plan[index].get("tool"), outcome)
+    return outcomes
@@ -0,0 +1,193 @@
+import os
+import json
+import pickle
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable
+from uuid import uuid4
+from app.services.dataset_store import handle_digest, is_handle
+from app.services.lifecycle_service import touch
+
+
+# In-memory budget for cached tool results, measured as pickled size
+MAX_TOOL_CACHE_MB = 64
+# On-disk tier; set to None to keep results in memory only. Swept by the
+# lifecycle manager like the other cache directories
+TOOL_CACHE_DIR = "cache/tool_results"
+# Bump when a tool's output format changes so old disk entries stop matching
+TOOL_CACHE_VERSION = 1
+# Arguments that name an output location rather than change the result
+IGNORED_ARGS = {"filename"}
+
+logger = logging.getLogger(__name__)
+
+
+def make_key(digest: str, tool_name: str, kwargs: dict) -> str:
+    """Key for (dataset content hash, tool, normalized arguments)."""
+    args = {k: v for k, v in kwargs.items() if k not in IGNORED_ARGS and v is not None}
+    payload = json.dumps(
+        [TOOL_CACHE_VERSION, digest, tool_name, args],
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ToolResultCache:
+    """
+    Memoized tool outputs: a size-bounded LRU in memory in front of an
+    optional directory of pickles.
+
+    Entries are evicted least-recently-used first once their summed pickled
+    size exceeds `max_bytes`. Disk hits are promoted back into memory.
+    """
+
+    def __init__(self, max_bytes: int = MAX_TOOL_CACHE_MB * 1024 * 1024, disk_dir: str | None = TOOL_CACHE_DIR):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self._entries: OrderedDict[str, tuple[bytes, int]] = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = {"memory": 0, "disk": 0}
+        self.misses = 0
+        self.evictions = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.pkl")
+
+    def _remember(self, key: str, blob: bytes) -> None:
+        size = len(blob)
+        if size > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._total_bytes -= old[1]
+        self._entries[key] = (blob, size)
+        self._total_bytes += size
+        while self._total_bytes > self.max_bytes and self._entries:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self._total_bytes -= evicted_size
+            self.evictions += 1
+
+    def get(self, key: str, valid: Callable[[object], bool] | None = None):
+        """
+        Return a fresh copy of the cached output, or None on a miss. Entries
+        rejected by `valid` are dropped and counted as misses.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None:
+            value = pickle.loads(entry[0])
+            if valid is None or valid(value):
+                with self._lock:
+                    if key in self._entries:
+                        self._entries.move_to_end(key)
+                    self.hits["memory"] += 1
+                return value
+            self.invalidate(key)
+
+        if self.disk_dir:
+            path = self._disk_path(key)
+            try:
+                with open(path, "rb") as f:
+                    blob = f.read()
+                value = pickle.loads(blob)
+            except FileNotFoundError:
+                value = None
+            except Exception as e:
+                logger.warning("Dropping unreadable tool cache entry %s: %s", path, e)
+                value = None
+            if value is not None and valid is not None and not valid(value):
+                self.invalidate(key)
+                value = None
+            if value is not None:
+                touch(path)
+                with self._lock:
+                    self._remember(key, blob)
+                    self.hits["disk"] += 1
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, value) -> None:
+        try:
+            blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            logger.debug("Tool output for %s is not cacheable: %s", key[:12], e)
+            return
+
+        with self._lock:
+            self._remember(key, blob)
+
+        if self.disk_dir:
+            path = self._disk_path(key)
+            tmp_path = f"{path}.{uuid4().hex}.part"
+            try:
+                with open(tmp_path, "wb") as f:
+                    f.write(blob)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                logger.warning("Failed to write tool cache entry %s: %s", path, e)
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._total_bytes -= entry[1]
+        if self.disk_dir:
+            try:
+                os.remove(self._disk_path(key))
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = sum(self.hits.values())
+            total = hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "memory_hits": self.hits["memory"],
+                "disk_hits": self.hits["disk"],
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(hits / total, 4) if total else None,
+            }
+
+
+tool_cache = ToolResultCache()
+
+
+def _output_files_exist(output) -> bool:
+    path = output.get("file") if isinstance(output, dict) else None
+    return path is None or os.path.exists(path)
+
+
+def call_tool(tool_name: str, tool, data, **kwargs):
+    """
+    Run `tool` on `data`, memoized by the dataset's content hash when `data`
+    is a dataset handle. Outputs pointing at a file (plots) are only reused
+    while that file still exists.
+    """
+    if not is_handle(data):
+        return tool.run(data, **kwargs)
+
+    key = make_key(handle_digest(data), tool_name, kwargs)
+    cached = tool_cache.get(key, valid=_output_files_exist)
+    if cached is not None:
+        if isinstance(cached, dict) and cached.get("file"):
+            touch(cached["file"])
+        return cached
+
+    output = tool.run(data, **kwargs)
+    tool_cache.put(key, output)
+    return output
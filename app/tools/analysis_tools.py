@@ -1,25 +1,356 @@
+import threading
+from collections import OrderedDict
 from crewai.tools import tool
+import numpy as np
 import pandas as pd
+from scipy import sparse
+from app.services.dataset_store import handle_digest, is_handle, load_dataframe
+from app.utils.sketches import APPROX_ROW_THRESHOLD, FrameSketch
+
+
+# Numeric columns with at most this many distinct values (e.g. Likert 1-5) are
+# summarised as categories rather than as continuous variables
+DISCRETE_MAX_LEVELS = 15
+# Frequency tables keep the most common levels and fold the rest into "other"
+MAX_LEVELS = 50
+HISTOGRAM_BINS = 10
+QUANTILES = (0.25, 0.5, 0.75)
+
+
+def _column_kind(s: pd.Series) -> str:
+    if pd.api.types.is_bool_dtype(s):
+        return "categorical"
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return "datetime"
+    if pd.api.types.is_numeric_dtype(s):
+        return "categorical" if s.nunique(dropna=True) <= DISCRETE_MAX_LEVELS else "numeric"
+    return "categorical"
+
+
+def _frequency_table(s: pd.Series, n_rows: int) -> dict:
+    """Level counts via factorize + bincount, truncated to MAX_LEVELS."""
+    codes, uniques = pd.factorize(s, use_na_sentinel=True)
+    missing = int((codes == -1).sum())
+    counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+
+    order = np.argsort(-counts, kind="stable")
+    top = order[:MAX_LEVELS]
+    labels = np.asarray(uniques)[top]
+    top_counts = counts[top]
+    pct = np.round(top_counts / n_rows * 100, 2) if n_rows else np.zeros(len(top))
+
+    summary = {
+        "type": "categorical",
+        "n_levels": int(len(uniques)),
+        "missing": missing,
+        "counts": {label: int(c) for label, c in zip(labels.tolist(), top_counts)},
+        "percentages": {label: float(p) for label, p in zip(labels.tolist(), pct)},
+    }
+    other = int(counts[order[MAX_LEVELS:]].sum())
+    if other:
+        summary["other_count"] = other
+    return summary
+
+
+def _numeric_summaries(df: pd.DataFrame, columns: list[str]) -> dict:
+    """Count, mean, sd, quantiles and histogram for all numeric columns in one pass."""
+    if not columns:
+        return {}
+
+    block = df[columns].to_numpy(dtype="float64", na_value=np.nan)
+    valid = ~np.isnan(block)
+    count = valid.sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.nanmean(block, axis=0)
+        sd = np.nanstd(block, axis=0, ddof=1)
+        q = np.nanquantile(block, QUANTILES, axis=0)
+        lo = np.nanmin(block, axis=0)
+        hi = np.nanmax(block, axis=0)
+
+    summaries = {}
+    for j, col in enumerate(columns):
+        if count[j] == 0:
+            summaries[col] = {"type": "numeric", "count": 0, "missing": int(len(block))}
+            continue
+        hist, edges = np.histogram(block[valid[:, j], j], bins=HISTOGRAM_BINS, range=(lo[j], hi[j]))
+        summaries[col] = {
+            "type": "numeric",
+            "count": int(count[j]),
+            "missing": int(len(block) - count[j]),
+            "mean": round(float(mean[j]), 4),
+            "sd": round(float(sd[j]), 4) if count[j] > 1 else None,
+            "min": float(lo[j]),
+            "q25": round(float(q[0, j]), 4),
+            "median": round(float(q[1, j]), 4),
+            "q75": round(float(q[2, j]), 4),
+            "max": float(hi[j]),
+            "histogram": {
+                "bin_edges": [round(float(e), 4) for e in edges],
+                "counts": hist.tolist(),
+            },
+        }
+    return summaries
+
+
+def describe_frame(df: pd.DataFrame) -> dict:
+    """
+    Descriptive statistics engine: picks a treatment per column from its
+    dtype and cardinality, then summarises every column with bounded output.
+    """
+    n_rows = len(df)
+    kinds = {col: _column_kind(df[col]) for col in df.columns}
+    numeric = _numeric_summaries(df, [col for col, kind in kinds.items() if kind == "numeric"])
+
+    summary = {}
+    for col, kind in kinds.items():
+        if kind == "numeric":
+            summary[col] = numeric[col]
+        elif kind == "datetime":
+            s = df[col]
+            summary[col] = {
+                "type": "datetime",
+                "count": int(s.notna().sum()),
+                "missing": int(s.isna().sum()),
+                "min": str(s.min()),
+                "max": str(s.max()),
+            }
+        else:
+            summary[col] = _frequency_table(df[col], n_rows)
+    return summary
+
+
+def describe_sketch(sketch: FrameSketch) -> dict:
+    """
+    `describe_frame` output built from column sketches. Counts, missing
+    values, mean, sd, min and max are exact; every approximate figure is
+    listed under the column's `error_bounds`.
+    """
+    summary = {}
+    for col, s in sketch.columns.items():
+        bounds = {
+            "approximate": True,
+            "distinct_relative_error": round(s.distinct.relative_error, 4),
+        }
+        if s.kind == "numeric":
+            if not s.count:
+                summary[col] = {"type": "numeric", "count": 0, "missing": s.missing, "error_bounds": bounds}
+                continue
+            q = s.quantiles.quantiles(QUANTILES)
+            edges = np.linspace(s.min, s.max, HISTOGRAM_BINS + 1)
+            cdf = s.quantiles.cdf(edges)
+            cdf[0], cdf[-1] = 0.0, 1.0
+            bounds["quantile_rank_error"] = round(s.quantiles.rank_error, 4)
+            bounds["histogram_count_error"] = int(np.ceil(2 * s.quantiles.rank_error * s.count))
+            summary[col] = {
+                "type": "numeric",
+                "count": s.count,
+                "missing": s.missing,
+                "mean": round(s.mean, 4),
+                "sd": round(s.sd, 4) if s.sd is not None else None,
+                "min": float(s.min),
+                "q25": round(float(q[0]), 4),
+                "median": round(float(q[1]), 4),
+                "q75": round(float(q[2]), 4),
+                "max": float(s.max),
+                "n_distinct": s.distinct.estimate(),
+                "histogram": {
+                    "bin_edges": [round(float(e), 4) for e in edges],
+                    "counts": np.round(np.diff(cdf) * s.count).astype(int).tolist(),
+                },
+                "error_bounds": bounds,
+            }
+        elif s.kind == "datetime":
+            summary[col] = {
+                "type": "datetime",
+                "count": s.count,
+                "missing": s.missing,
+                "min": str(s.min),
+                "max": str(s.max),
+            }
+        else:
+            top = s.frequent.top(MAX_LEVELS)
+            n_rows = sketch.rows
+            bounds["count_undercount_max"] = int(s.frequent.error)
+            summary[col] = {
+                "type": "categorical",
+                "n_levels": s.distinct.estimate(),
+                "missing": s.missing,
+                "counts": {label: int(c) for label, c in top.items()},
+                "percentages": {label: round(c / n_rows * 100, 2) if n_rows else 0.0 for label, c in top.items()},
+                "error_bounds": bounds,
+            }
+            # Misra-Gries counts are lower bounds, so the remainder is only known
+            # to within `error` per listed level
+            other_max = s.count - int(top.sum())
+            if other_max:
+                other_min = max(other_max - int(s.frequent.error) * len(top), 0)
+                summary[col]["other_count_bounds"] = [other_min, other_max]
+    return summary
+
+
+def use_approximate(n_rows: int, approximate: bool | None) -> bool:
+    """
+    For the streamed (chunked) path: explicit requests win, otherwise
+    sketches switch on above APPROX_ROW_THRESHOLD rows. In memory the exact
+    path is faster, so the tools only approximate when asked.
+    """
+    return n_rows > APPROX_ROW_THRESHOLD if approximate is None else bool(approximate)
+
 
 @tool
-def descriptive_statistics(dataset_path: str) -> dict:
+def descriptive_statistics(dataset_path: str, approximate: bool | None = None) -> dict:
     """
-    Generate descriptive statistics for a dataset at the given file path.
-    Supports CSV and Excel files.
+    Generate descriptive statistics for a dataset at the given file path or
+    dataset handle. Categorical and discrete columns get frequency tables;
+    continuous numeric columns get count, mean, sd, quantiles and histogram bins.
+
+    approximate: summarise with mergeable sketches (HyperLogLog, KLL,
+    Misra-Gries) and report error bounds. Off unless requested.
     """
 
-    if dataset_path.endswith(".csv"):
-        df = pd.read_csv(dataset_path)
+    df = load_dataframe(dataset_path)
+    if approximate:
+        return describe_sketch(FrameSketch.from_frame(df, _column_kind))
+    return describe_frame(df)
+
+
+# Separators tried when a column is detected automatically. Commas and
+# slashes occur in ordinary single-choice labels ("Tertiary (BSc, HND)",
+# "Yes/No"), so they are only split in columns named as multi-select
+MULTI_SELECT_DELIMITERS = (";", "|")
+NAMED_MULTI_SELECT_DELIMITERS = (";", "|", ",", "/")
+# Share of answered rows that must contain the separator
+MULTI_SELECT_MIN_SHARE = 0.05
+# Automatic detection: share of picks that must be options recurring across
+# distinct answers (a consistent option vocabulary)
+MULTI_SELECT_MIN_RECURRING = 0.95
+# Indicator matrices kept per (dataset, column), least recently used evicted first
+MAX_CACHED_INDICATORS = 32
+
+
+class MultiSelect:
+    """
+    A delimiter-packed multi-select column expanded into a sparse boolean
+    indicator matrix: one row per dataset row, one column per option, options
+    ordered by how often they were picked. Unanswered rows are all-zero and
+    marked False in `answered`.
+    """
+
+    def __init__(self, column: str, delimiter: str, options: list[str], indicators: sparse.csr_matrix, answered: np.ndarray):
+        self.column = column
+        self.delimiter = delimiter
+        self.options = options
+        self.indicators = indicators
+        self.answered = answered
+
+    def counts(self) -> pd.Series:
+        return pd.Series(np.asarray(self.indicators.sum(axis=0)).ravel(), index=self.options, name=self.column)
+
+    def crosstab(self, by: pd.Series) -> tuple[pd.DataFrame, pd.Series]:
+        """
+        Option-by-level counts against another column, over rows where both
+        are answered, and the number of such rows per level.
+        """
+        codes, levels = pd.factorize(by, use_na_sentinel=True)
+        rows = np.flatnonzero(self.answered & (codes >= 0))
+        groups = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.int64), (np.arange(len(rows)), codes[rows])),
+            shape=(len(rows), len(levels)),
+        )
+        table = (self.indicators[rows].T.astype(np.int64) @ groups).toarray()
+        sizes = np.bincount(codes[rows], minlength=len(levels))
+        return pd.DataFrame(table, index=self.options, columns=levels), pd.Series(sizes, index=levels)
+
+
+def _split_options(labels: pd.Series, delimiter: str) -> pd.Series:
+    """Options of each distinct label, one per row, indexed by label position."""
+    parts = labels.str.split(delimiter, regex=False).explode().str.strip()
+    return parts[parts.notna() & (parts != "")]
+
+
+def expand_multi_select(s: pd.Series, named: bool = False, delimiter: str | None = None) -> MultiSelect | None:
+    """
+    Expand a delimiter-packed multi-select column, or return None when it
+    does not look like one. Work is done on the distinct answers only: each
+    one is split once, and rows pick up their answer's indicator row by
+    sparse row indexing.
+
+    Automatic detection (`named=False`) only splits on `;` or `|` and needs a
+    consistent option vocabulary. A column the user or plan names as
+    multi-select (`named=True`) may also use `,` or `/`; `delimiter` fixes
+    the separator.
+    """
+    if pd.api.types.is_numeric_dtype(s) or pd.api.types.is_datetime64_any_dtype(s):
+        return None
+    codes, uniques = pd.factorize(s, use_na_sentinel=True)
+    answered = codes >= 0
+    # Every answer distinct: an identifier or free text, not a choice list
+    if len(uniques) < 2 or (not named and len(uniques) == answered.sum()):
+        return None
+    labels = pd.Series(uniques).astype(str)
+    weights = np.bincount(codes[answered], minlength=len(uniques))
+
+    if delimiter:
+        candidates = (delimiter,)
     else:
-        df = pd.read_excel(dataset_path)
+        candidates = NAMED_MULTI_SELECT_DELIMITERS if named else MULTI_SELECT_DELIMITERS
+    for delimiter in candidates:
+        packed = labels.str.contains(delimiter, regex=False).to_numpy()
+        if not packed.any():
+            continue
+        parts = _split_options(labels, delimiter)
+        option_codes, options = pd.factorize(parts)
+        if not 2 <= len(options) <= MAX_LEVELS:
+            continue
+        if not named:
+            # Options must recur across answers; free text splits into ever-new pieces
+            if weights[packed].sum() < MULTI_SELECT_MIN_SHARE * answered.sum() or len(options) >= len(parts):
+                continue
+            answers_per_option = np.bincount(option_codes, minlength=len(options))
+            picks = weights[parts.index.to_numpy()]
+            recurring = picks[answers_per_option[option_codes] >= 2].sum()
+            if recurring < MULTI_SELECT_MIN_RECURRING * picks.sum():
+                continue
 
-    summary = {}
+        # Distinct answers x options, plus an empty last row for unanswered rows
+        by_label = sparse.csr_matrix(
+            (np.ones(len(parts), dtype=bool), (parts.index.to_numpy(), option_codes)),
+            shape=(len(uniques) + 1, len(options)),
+        )
+        by_label.sum_duplicates()
+        picked = np.asarray(by_label[:-1].multiply(weights[:, None]).sum(axis=0)).ravel()
+        order = np.argsort(-picked, kind="stable")
+        indicators = by_label[:, order][np.where(answered, codes, len(uniques))]
+        return MultiSelect(s.name, delimiter, [str(options[i]) for i in order], indicators.tocsr(), answered)
+    return None
 
-    for col in df.columns:
-        vc = df[col].value_counts(dropna=False)
-        summary[col] = {
-            "counts": vc.to_dict(),
-            "percentages": (vc / vc.sum() * 100).round(2).to_dict()
-        }
 
-    return summary
+_indicator_cache: OrderedDict[tuple, MultiSelect | None] = OrderedDict()
+_indicator_lock = threading.Lock()
+
+
+def multi_select_indicators(
+    data,
+    df: pd.DataFrame,
+    column: str,
+    named: bool = False,
+    delimiter: str | None = None,
+) -> MultiSelect | None:
+    """
+    `expand_multi_select` of `df[column]`, cached per dataset content hash
+    when `data` is a dataset handle, so plots and tests on the same upload
+    reuse one indicator matrix. Negative detections are cached too.
+    """
+    if not is_handle(data):
+        return expand_multi_select(df[column], named, delimiter)
+    key = (handle_digest(data), column, named, delimiter)
+    with _indicator_lock:
+        if key in _indicator_cache:
+            _indicator_cache.move_to_end(key)
+            return _indicator_cache[key]
+    expanded = expand_multi_select(df[column], named, delimiter)
+    with _indicator_lock:
+        _indicator_cache[key] = expanded
+        while len(_indicator_cache) > MAX_CACHED_INDICATORS:
+            _indicator_cache.popitem(last=False)
+    return expanded
@@ -1,9 +1,24 @@
 import pandas as pd
 import numpy as np
-from scipy.stats import chi2_contingency
+from scipy import sparse
+from scipy.stats import (
+    chi2, chi2_contingency, f as f_dist, false_discovery_control, fisher_exact, norm, t as t_dist,
+)
 from crewai.tools import tool
+from app.services.dataset_store import load_dataframe
+from app.tools.analysis_tools import _column_kind, multi_select_indicators
 
 
+# Pairwise tables with more cells than this are counted sparsely (non-zero cells only)
+DENSE_MAX_CELLS = 10_000
+FDR_ALPHA = 0.05
+# Below this expected cell count the asymptotic chi-square p-value is not trusted
+MIN_EXPECTED_COUNT = 5
+MONTE_CARLO_SAMPLES = 10_000
+MONTE_CARLO_SEED = 2024
+# Simulated tables generated per batch is capped at this many cells
+MONTE_CARLO_BATCH_CELLS = 2_000_000
+
 
 @tool
 def chi_square_test(
@@ -15,12 +30,14 @@ def chi_square_test(
     Perform a Chi-Square test of independence between two categorical variables.
 
     Parameters:
-    - data: list of records, dict, or CSV/Excel file path
+    - data: dataset handle, list of records, dict, or CSV/Excel file path
     - outcome: dependent categorical column name
     - predictors: list with ONE categorical column name
 
     Returns:
     - outcome, predictor
+    - test used: Pearson chi-square, or Fisher's exact test (2x2) / Monte
+      Carlo chi-square (larger tables) when an expected count is below 5
     - chi-square statistic
     - p-value
     - degrees of freedom
@@ -28,21 +45,11 @@ def chi_square_test(
     - significance flag
     """
 
-   
-    if isinstance(data, str):
-        if data.endswith(".csv"):
-            df = pd.read_csv(data)
-        else:
-            df = pd.read_excel(data)
-    elif isinstance(data, dict):
-        df = pd.DataFrame([data])
-    else:
-        df = pd.DataFrame(data)
-
     if not predictors or len(predictors) != 1:
         raise ValueError("Chi-square test requires exactly ONE predictor column")
 
     predictor = predictors[0]
+    df = load_dataframe(data, columns=[outcome, predictor])
 
    
     if outcome not in df.columns:
@@ -63,7 +70,14 @@ def chi_square_test(
         subset[predictor]
     )
 
-    
+    return chi_square_from_table(contingency_table, outcome, predictor)
+
+
+def chi_square_from_table(contingency_table: pd.DataFrame, outcome: str, predictor: str) -> dict:
+    """
+    Chi-square test of independence on an already-built contingency table
+    (outcome categories as rows, predictor categories as columns).
+    """
     if contingency_table.shape[0] < 2 or contingency_table.shape[1] < 2:
         return {
             "outcome": outcome,
@@ -72,50 +86,1025 @@ def chi_square_test(
         }
 
     
-    chi2, p, dof, expected = chi2_contingency(contingency_table)
+    stat, p, dof, expected = chi2_contingency(contingency_table)
+    low_expected = int((expected < MIN_EXPECTED_COUNT).sum())
 
-    
-    return {
+    result = {
         "outcome": outcome,
         "predictor": predictor,
-        "chi_square": round(float(chi2), 4),
-        "p_value": round(float(p), 4),
+        "test": "Pearson chi-square",
+        "chi_square": round(float(stat), 4),
         "degrees_of_freedom": int(dof),
+    }
+
+    # Sparse cells: replace the asymptotic p-value with an exact or simulated one
+    if low_expected:
+        result["asymptotic_p_value"] = round(float(p), 4)
+        result["low_expected_cells"] = low_expected
+        if contingency_table.shape == (2, 2):
+            odds_ratio, p = fisher_exact(contingency_table.to_numpy())
+            result["test"] = "Fisher's exact test"
+            result["odds_ratio"] = round(float(odds_ratio), 4)
+        else:
+            observed = contingency_table.to_numpy()
+            p = monte_carlo_p_value(observed, expected, _pearson_statistic(observed, expected))
+            result["test"] = "Monte Carlo chi-square"
+            result["monte_carlo_samples"] = MONTE_CARLO_SAMPLES
+            result["seed"] = MONTE_CARLO_SEED
+
+    result.update({
+        "p_value": round(float(p), 4),
         "significant": bool(p < 0.05),
         "expected_frequencies": expected.round(2).tolist()
-    }
+    })
+    return result
 
 
-@tool
-def cronbach_alpha(data: list[dict] | dict | str) -> dict:
+def _pearson_statistic(observed: np.ndarray, expected: np.ndarray) -> np.ndarray:
+    """Pearson X^2 of one table, or of a (samples, r, c) stack of tables."""
+    return ((observed - expected) ** 2 / expected).sum(axis=(-2, -1))
+
+
+def _random_tables(
+    row_totals: np.ndarray,
+    col_totals: np.ndarray,
+    size: int,
+    rng: np.random.Generator,
+) -> np.ndarray:
+    """
+    Draw `size` r x c tables uniformly from those with the given margins
+    (the permutation null of independence). Cells are filled one at a time
+    from hypergeometric draws vectorized across all tables, so the cost is
+    O(size * r * c) regardless of the number of observations.
+    """
+    r, c = len(row_totals), len(col_totals)
+    tables = np.zeros((size, r, c), dtype=np.int64)
+    remaining_cols = np.tile(col_totals.astype(np.int64), (size, 1))
+
+    for i in range(r - 1):
+        left_in_row = np.full(size, row_totals[i], dtype=np.int64)
+        pool = remaining_cols.sum(axis=1)
+        for j in range(c - 1):
+            good = remaining_cols[:, j]
+            pool = pool - good
+            draw = rng.hypergeometric(good, pool, left_in_row)
+            tables[:, i, j] = draw
+            left_in_row -= draw
+        tables[:, i, c - 1] = left_in_row
+        remaining_cols -= tables[:, i, :]
+    tables[:, r - 1, :] = remaining_cols
+    return tables
+
+
+def monte_carlo_p_value(
+    observed: np.ndarray,
+    expected: np.ndarray,
+    statistic: float,
+    n_samples: int = MONTE_CARLO_SAMPLES,
+    seed: int = MONTE_CARLO_SEED,
+) -> float:
     """
-    Calculate Cronbach's alpha for a set of item responses provided as list of records,
-    a dict, or a CSV/Excel path. Converts to DataFrame internally.
+    Simulated p-value for the Pearson statistic of an r x c table, as in
+    R's chisq.test(simulate.p.value = TRUE). Tables are generated in batches
+    under a fixed seed, so the same table always gets the same p-value.
     """
-    if isinstance(data, str):
-        if data.endswith(".csv"):
-            df = pd.read_csv(data)
+    rng = np.random.default_rng(seed)
+    row_totals = observed.sum(axis=1)
+    col_totals = observed.sum(axis=0)
+    batch = max(1, min(n_samples, MONTE_CARLO_BATCH_CELLS // observed.size))
+
+    # Tolerance so simulated tables equal to the observed one count as extreme
+    threshold = statistic * (1 - 1e-7)
+    extreme = 0
+    for start in range(0, n_samples, batch):
+        size = min(batch, n_samples - start)
+        tables = _random_tables(row_totals, col_totals, size, rng)
+        extreme += int((_pearson_statistic(tables, expected) >= threshold).sum())
+    return (extreme + 1) / (n_samples + 1)
+
+
+# Ordered response scales recognised when scoring text items, lowest level
+# first; labels sharing a tuple are synonyms for the same level
+LIKERT_SCALES = [
+    [("strongly disagree",), ("disagree",), ("somewhat disagree", "slightly disagree"),
+     ("neither agree nor disagree", "neutral", "undecided"), ("somewhat agree", "slightly agree"),
+     ("agree",), ("strongly agree",)],
+    [("never",), ("rarely", "seldom"), ("sometimes", "occasionally"), ("often", "usually"),
+     ("very often",), ("always",)],
+    [("very dissatisfied",), ("dissatisfied",), ("somewhat dissatisfied",), ("neutral",),
+     ("somewhat satisfied",), ("satisfied",), ("very satisfied",)],
+    [("very unlikely",), ("unlikely",), ("neutral",), ("likely",), ("very likely",)],
+    [("not at all important", "not important"), ("slightly important",), ("moderately important",),
+     ("important",), ("very important",), ("extremely important",)],
+    [("very poor",), ("poor",), ("fair", "average"), ("good",), ("very good",), ("excellent",)],
+    [("no",), ("yes",)],
+]
+_SCALE_LEVELS = [
+    {label: level for level, group in enumerate(scale) for label in group}
+    for scale in LIKERT_SCALES
+]
+# Default scale items are Likert-type: text on a known scale, or whole numbers
+# spanning a short range (1-5, 0-10), with this many distinct points
+MIN_SCALE_POINTS = 3
+MAX_SCALE_POINTS = 11
+BOOTSTRAP_SAMPLES = 1000
+BOOTSTRAP_SEED = 2024
+# Bootstrap resamples are weighted in batches of at most this many row weights
+BOOTSTRAP_BATCH_CELLS = 5_000_000
+
+
+def _normalize_label(value) -> str:
+    return " ".join(str(value).lower().replace("-", " ").split())
+
+
+def _label_scores(labels: dict[str, list[str]]) -> dict[str, tuple[np.ndarray, str]]:
+    """
+    Score the normalized labels of each text item, aligned with the input
+    lists: numbers are used as-is; labels from a known Likert scale are
+    ranked over the scale levels actually used by all items on that scale,
+    so every item shares one mapping with evenly spaced scores; anything
+    else falls back to sorted category codes.
+    """
+    scored, pending, used_levels = {}, {}, {}
+    for col, col_labels in labels.items():
+        as_numbers = pd.to_numeric(pd.Series(col_labels, dtype=object), errors="coerce").to_numpy(dtype="float64")
+        if len(col_labels) and not np.isnan(as_numbers).any():
+            scored[col] = (as_numbers, "numeric")
+            continue
+
+        scale = next((i for i, levels in enumerate(_SCALE_LEVELS) if set(col_labels) <= levels.keys()), None)
+        if scale is not None:
+            used_levels.setdefault(scale, set()).update(_SCALE_LEVELS[scale][label] for label in col_labels)
+        pending[col] = (col_labels, scale)
+
+    for col, (col_labels, scale) in pending.items():
+        if scale is not None:
+            rank = {level: r + 1 for r, level in enumerate(sorted(used_levels[scale]))}
+            scores = [rank[_SCALE_LEVELS[scale][label]] for label in col_labels]
+            scoring = "likert"
         else:
-            df = pd.read_excel(data)
-    elif isinstance(data, dict):
-        df = pd.DataFrame([data])
-    else:
-        df = pd.DataFrame(data)
+            order = {label: r for r, label in enumerate(sorted(set(col_labels)))}
+            scores = [order[label] for label in col_labels]
+            scoring = "category codes"
+        scored[col] = (np.asarray(scores, dtype="float64"), scoring)
+
+    return {col: scored[col] for col in labels}
+
+
+def _score_items(df: pd.DataFrame, columns: list[str]) -> dict[str, tuple[np.ndarray, str]]:
+    """
+    Numeric scores per item, NaN where missing, and how each was scored.
+    Each text item is factorized once and only its distinct labels are scored.
+    """
+    scored, text = {}, {}
+    for col in columns:
+        s = df[col]
+        if pd.api.types.is_numeric_dtype(s) and not pd.api.types.is_bool_dtype(s):
+            scored[col] = (s.to_numpy(dtype="float64", na_value=np.nan), "numeric")
+            continue
+        codes, uniques = pd.factorize(s, use_na_sentinel=True)
+        text[col] = (codes, [_normalize_label(u) for u in uniques])
+
+    label_scores = _label_scores({col: labels for col, (_, labels) in text.items()})
+    for col, (codes, _) in text.items():
+        scores, scoring = label_scores[col]
+        scored[col] = (np.append(scores, np.nan)[codes], scoring)
+
+    return {col: scored[col] for col in columns}
+
+
+def _is_likert_item(scores: np.ndarray, scoring: str) -> bool:
+    """
+    True for Likert-type items. Yes/no items (two points), continuous numbers
+    such as age, and unordered categories do not qualify.
+    """
+    if scoring not in {"numeric", "likert"}:
+        return False
+    points = np.unique(scores[~np.isnan(scores)])
+    if not MIN_SCALE_POINTS <= len(points) <= MAX_SCALE_POINTS:
+        return False
+    return scoring == "likert" or bool(
+        (points == np.round(points)).all() and points[-1] - points[0] < MAX_SCALE_POINTS
+    )
+
+
+def scale_items(df: pd.DataFrame) -> list[str]:
+    """Columns `cronbach_alpha` uses by default: the Likert-type ones."""
+    return [col for col, (scores, how) in _score_items(df, list(df.columns)).items() if _is_likert_item(scores, how)]
+
 
-    df = df.apply(lambda x: x.astype("category").cat.codes)
+def _alpha_from_cov(cov: np.ndarray) -> float:
+    k = cov.shape[0]
+    total_var = cov.sum()
+    return float((k / (k - 1)) * (1 - np.trace(cov) / total_var)) if total_var > 0 else float("nan")
 
-    k = df.shape[1]
-    variances = df.var(axis=0, ddof=1)
-    total_var = df.sum(axis=1).var(ddof=1)
 
-    raw_alpha = (k / (k - 1)) * (1 - variances.sum() / total_var)
+def _r(x):
+    return None if x is None or not np.isfinite(x) else round(float(x), 4)
 
-    corr = df.corr().values
+
+def reliability_from_cov(
+    cov: np.ndarray,
+    means: np.ndarray,
+    n: int,
+    columns: list[str],
+    scoring: list[str],
+    ci_95=(None, None),
+    bootstrap_samples: int = 0,
+    excluded: int = 0,
+) -> dict:
+    """
+    The `cronbach_alpha` result for k items, computed from their covariance
+    matrix and means alone. Shared by the in-memory tool and the chunked
+    path, which only keeps moment sums.
+    """
+    k = len(columns)
+    item_var = np.diag(cov)
+    total_var = cov.sum()
+    raw_alpha = _alpha_from_cov(cov)
+
+    sd = np.sqrt(item_var)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        corr = cov / np.outer(sd, sd)
     mean_corr = np.nanmean(corr[np.triu_indices(k, 1)])
     standardized_alpha = (k * mean_corr) / (1 + (k - 1) * mean_corr)
 
+    # Dropping item i removes its row and column from the covariance sums
+    cov_with_rest = cov.sum(axis=1) - item_var
+    rest_var = total_var - 2 * cov.sum(axis=1) + item_var
+    with np.errstate(divide="ignore", invalid="ignore"):
+        alpha_if_deleted = ((k - 1) / (k - 2)) * (1 - (np.trace(cov) - item_var) / rest_var) if k > 2 \
+            else np.full(k, np.nan)
+        item_total_r = cov_with_rest / np.sqrt(item_var * rest_var)
+
+    return {
+        "raw_alpha": _r(raw_alpha),
+        "standardized_alpha": _r(standardized_alpha),
+        "ci_95": [_r(ci_95[0]), _r(ci_95[1])],
+        "bootstrap_samples": bootstrap_samples,
+        "items": k,
+        "n": int(n),
+        "excluded_incomplete_rows": int(excluded),
+        "item_statistics": [
+            {
+                "item": col,
+                "scoring": scoring[j],
+                "mean": _r(means[j]),
+                "sd": _r(sd[j]),
+                "item_total_correlation": _r(item_total_r[j]),
+                "alpha_if_deleted": _r(alpha_if_deleted[j]),
+            }
+            for j, col in enumerate(columns)
+        ],
+    }
+
+
+def _bootstrap_alpha(X: np.ndarray, n_samples: int, seed: int) -> np.ndarray:
+    """
+    Alpha for `n_samples` bootstrap resamples of the rows of X without
+    materialising any resampled matrix: each resample is a row-count weight
+    vector, and item sums, item sums of squares and total-score moments come
+    from a few weight-matrix products per batch.
+    """
+    n, k = X.shape
+    rng = np.random.default_rng(seed)
+    total = X.sum(axis=1)
+    moments = np.column_stack([X, X ** 2, total, total ** 2])
+
+    batch = max(1, min(n_samples, BOOTSTRAP_BATCH_CELLS // n))
+    alphas = []
+    for start in range(0, n_samples, batch):
+        size = min(batch, n_samples - start)
+        picks = rng.integers(0, n, size=(size, n)) + (np.arange(size) * n)[:, None]
+        weights = np.bincount(picks.ravel(), minlength=size * n).reshape(size, n).astype("float64")
+        m = weights @ moments / n
+        mean, sq = m[:, :k], m[:, k:2 * k]
+        item_var_sum = (sq - mean ** 2).sum(axis=1)
+        total_var = m[:, 2 * k + 1] - m[:, 2 * k] ** 2
+        with np.errstate(divide="ignore", invalid="ignore"):
+            alphas.append((k / (k - 1)) * (1 - item_var_sum / total_var))
+    return np.concatenate(alphas)
+
+
+@tool
+def cronbach_alpha(
+    data: list[dict] | dict | str,
+    items: list[str] | None = None
+) -> dict:
+    """
+    Reliability analysis (Cronbach's alpha) for a set of scale items provided
+    as a dataset handle, list of records, a dict, or a CSV/Excel path.
+
+    Parameters:
+    - items: the scale's item columns (default: every Likert-type column, i.e.
+      Likert-labelled text or short whole-number ratings such as 1-5)
+
+    Returns:
+    - raw and standardized alpha with a bootstrap 95% confidence interval
+    - per item: alpha if item deleted and corrected item-total correlation
+    - how each item was scored (numeric, likert, category codes)
+    """
+    df = load_dataframe(data, columns=items)
+    if items is not None:
+        missing = [col for col in items if col not in df.columns]
+        if missing:
+            raise ValueError(f"Item columns not found in dataset: {missing}")
+        columns = list(dict.fromkeys(items))
+    else:
+        columns = list(df.columns)
+
+    scored = _score_items(df, columns)
+    if items is None:
+        columns = [col for col, (scores, how) in scored.items() if _is_likert_item(scores, how)]
+        if len(columns) < 2:
+            raise ValueError("Fewer than two Likert-type columns found; name the scale's items")
+    if len(columns) < 2:
+        raise ValueError("Cronbach's alpha needs at least two items")
+
+    X = np.column_stack([scored[col][0] for col in columns])
+    complete = ~np.isnan(X).any(axis=1)
+    X = X[complete]
+    n = len(X)
+    if n < 3:
+        raise ValueError("Not enough complete responses to estimate reliability")
+
+    boot = _bootstrap_alpha(X, BOOTSTRAP_SAMPLES, BOOTSTRAP_SEED)
+    boot = boot[np.isfinite(boot)]
+    ci = np.percentile(boot, [2.5, 97.5]) if len(boot) else (None, None)
+
+    return reliability_from_cov(
+        np.cov(X, rowvar=False, ddof=1),
+        X.mean(axis=0),
+        n,
+        columns,
+        [scored[col][1] for col in columns],
+        ci_95=ci,
+        bootstrap_samples=BOOTSTRAP_SAMPLES,
+        excluded=(~complete).sum(),
+    )
+
+
+def _pair_chi_square(
+    a: np.ndarray,
+    ka: int,
+    b: np.ndarray,
+    kb: int,
+    row_totals: np.ndarray | None = None,
+    col_totals: np.ndarray | None = None,
+) -> tuple:
+    """
+    Chi-square of two factorized columns (codes >= 0, no missing) without
+    materialising a crosstab. Uses chi2 = n * (sum(O^2 / (R * C)) - 1) over
+    the non-zero cells only, so the same formula serves the dense bincount
+    table and the sparse (unique cells) table. Marginal totals can be passed
+    in when they are already known.
+    """
+    n = len(a)
+    if row_totals is None:
+        row_totals = np.bincount(a, minlength=ka)
+    if col_totals is None:
+        col_totals = np.bincount(b, minlength=kb)
+    cell_dtype = np.int32 if ka * kb < np.iinfo(np.int32).max else np.int64
+    cell = a.astype(cell_dtype, copy=False) * cell_dtype(kb) + b
+
+    if ka * kb <= DENSE_MAX_CELLS:
+        observed = np.bincount(cell, minlength=ka * kb)
+        nz = np.flatnonzero(observed)
+        observed = observed[nz]
+    else:
+        nz, observed = np.unique(cell, return_counts=True)
+
+    rows, cols = nz // kb, nz % kb
+    r = int((row_totals > 0).sum())
+    c = int((col_totals > 0).sum())
+    if r < 2 or c < 2:
+        return n, None, 0, None
+
+    ratio = observed.astype(np.float64) ** 2 / (row_totals[rows] * col_totals[cols].astype(np.float64))
+    stat = max(float(n * (ratio.sum() - 1.0)), 0.0)
+    dof = (r - 1) * (c - 1)
+    cramers_v = float(np.sqrt(stat / (n * min(r - 1, c - 1))))
+    return n, stat, dof, cramers_v
+
+
+@tool
+def association_matrix(
+    data: list[dict] | dict | str,
+    columns: list[str] | None = None
+) -> dict:
+    """
+    Screen every pair of categorical columns for association in one pass.
+
+    Parameters:
+    - data: dataset handle, list of records, dict, or CSV/Excel file path
+    - columns: categorical columns to screen (default: all categorical columns)
+
+    Returns:
+    - pairs: one entry per column pair with chi-square, degrees of freedom,
+      p-value, Benjamini-Hochberg adjusted p-value and Cramér's V,
+      strongest associations first
+    - skipped: columns left out and why
+    """
+    df = load_dataframe(data, columns=columns)
+    if columns is None:
+        columns = [col for col in df.columns if _column_kind(df[col]) == "categorical"]
+    missing = [col for col in columns if col not in df.columns]
+    if missing:
+        raise ValueError(f"Columns not found in dataset: {missing}")
+
+    # Factorize each column exactly once; -1 marks missing values
+    codes, levels, skipped = {}, {}, {}
+    for col in dict.fromkeys(columns):
+        c, uniques = pd.factorize(df[col], use_na_sentinel=True)
+        present = int((c >= 0).sum())
+        if len(uniques) < 2:
+            skipped[col] = "fewer than two categories"
+        elif len(uniques) == present:
+            skipped[col] = "every value is unique (identifier)"
+        else:
+            codes[col], levels[col] = c.astype(np.int32), len(uniques)
+
+    kept = list(codes)
+    if len(kept) < 2:
+        raise ValueError("Association matrix needs at least two categorical columns with repeated values")
+
+    complete = {col: bool((codes[col] >= 0).all()) for col in kept}
+    # Complete columns have the same marginal totals in every pair
+    totals = {col: np.bincount(codes[col], minlength=levels[col]) for col in kept if complete[col]}
+    pairs, stats = [], []
+    for i, col_a in enumerate(kept):
+        for col_b in kept[i + 1:]:
+            a, b = codes[col_a], codes[col_b]
+            if complete[col_a] and complete[col_b]:
+                n, stat, dof, v = _pair_chi_square(
+                    a, levels[col_a], b, levels[col_b], totals[col_a], totals[col_b]
+                )
+            else:
+                mask = (a >= 0) & (b >= 0)
+                n, stat, dof, v = _pair_chi_square(a[mask], levels[col_a], b[mask], levels[col_b])
+            if stat is None:
+                continue
+            stats.append(stat)
+            pairs.append({
+                "var_1": col_a,
+                "var_2": col_b,
+                "n": int(n),
+                "chi_square": round(stat, 4),
+                "degrees_of_freedom": dof,
+                "cramers_v": round(v, 4),
+            })
+
+    if pairs:
+        p_values = chi2.sf(stats, [pair["degrees_of_freedom"] for pair in pairs])
+        adjusted = false_discovery_control(p_values, method="bh")
+        for pair, p, p_adj in zip(pairs, p_values, adjusted):
+            pair["p_value"] = round(float(p), 6)
+            pair["p_adjusted"] = round(float(p_adj), 6)
+            pair["significant"] = bool(p_adj < FDR_ALPHA)
+        pairs.sort(key=lambda pair: (not pair["significant"], -pair["cramers_v"]))
+
+    return {
+        "columns_tested": len(kept),
+        "n_pairs": len(pairs),
+        "n_significant": sum(pair["significant"] for pair in pairs),
+        "correction": f"Benjamini-Hochberg FDR at {FDR_ALPHA}",
+        "pairs": pairs,
+        "skipped": skipped,
+    }
+
+
+# Grouping columns with more levels than this are not compared
+MAX_COMPARISON_GROUPS = 20
+
+
+def _prepare_outcomes(Y: np.ndarray) -> tuple:
+    """
+    Everything the group statistics need from the outcome matrix alone:
+    validity mask, values centered on each column mean (keeps sums of
+    squares well conditioned), average ranks with missing values zeroed,
+    each column's tie term sum(t^3 - t), and the column means. Each column
+    is sorted once.
+    """
+    valid = ~np.isnan(Y)
+    offset = np.nanmean(Y, axis=0)
+    centered = np.where(valid, Y - offset, 0.0)
+    ranks = np.zeros_like(Y)
+    ties = np.empty(Y.shape[1])
+    for j in range(Y.shape[1]):
+        rows = np.flatnonzero(valid[:, j])
+        order = np.argsort(Y[rows, j])
+        ordered = Y[rows, j][order]
+        starts = np.r_[0, np.flatnonzero(np.diff(ordered)) + 1]
+        runs = np.diff(np.r_[starts, len(ordered)])
+        # Tied values share the mean of the positions their run covers
+        ranks[rows[order], j] = np.repeat(starts + (runs + 1) / 2, runs)
+        ties[j] = float((runs.astype("float64") ** 3 - runs).sum())
+    return valid.astype("float64"), centered, ranks, ties, offset
+
+
+def _group_moments(codes: np.ndarray, k: int, prepared: tuple) -> tuple:
+    """
+    Per-group counts, sums, sums of squares and rank sums of every outcome
+    for one grouping, as group x outcome arrays from one sparse indicator
+    product each.
+    """
+    valid, centered, ranks, _, _ = prepared
+    present = np.flatnonzero(codes >= 0)
+    indicator = sparse.csr_matrix(
+        (np.ones(len(present)), (codes[present], present)),
+        shape=(k, len(codes)),
+    )
+    return indicator @ valid, indicator @ centered, indicator @ centered ** 2, indicator @ ranks
+
+
+@tool
+def group_comparison(
+    data: list[dict] | dict | str,
+    outcomes: list[str] | None = None,
+    groups: list[str] | None = None
+) -> dict:
+    """
+    Compare numeric outcomes across the levels of grouping columns, for every
+    (outcome, grouping) pair at once.
+
+    Parameters:
+    - data: dataset handle, list of records, dict, or CSV/Excel file path
+    - outcomes: numeric columns to compare (default: all numeric columns)
+    - groups: grouping columns (default: categorical columns with 2 to
+      MAX_COMPARISON_GROUPS levels)
+
+    Returns:
+    - comparisons: per pair, group n/mean/sd, Welch's t-test (two groups) or
+      one-way ANOVA (more) with effect size, Kruskal-Wallis H, and
+      Benjamini-Hochberg adjusted p-values; significant pairs first
+    - skipped: columns left out and why
+    """
+    wanted = None if outcomes is None or groups is None else list(outcomes) + list(groups)
+    df = load_dataframe(data, columns=wanted)
+    missing = [col for col in (outcomes or []) + (groups or []) if col not in df.columns]
+    if missing:
+        raise ValueError(f"Columns not found in dataset: {missing}")
+
+    skipped = {}
+    if outcomes is None:
+        outcomes = [col for col in df.columns if _column_kind(df[col]) == "numeric"]
+    numeric = []
+    for col in dict.fromkeys(outcomes):
+        if pd.api.types.is_numeric_dtype(df[col]) and not pd.api.types.is_bool_dtype(df[col]):
+            numeric.append(col)
+        else:
+            skipped[col] = "not numeric"
+    if groups is None:
+        groups = [col for col in df.columns if col not in numeric and _column_kind(df[col]) == "categorical"]
+    if not numeric:
+        raise ValueError("Group comparison needs at least one numeric outcome column")
+
+    Y = np.column_stack([df[col].to_numpy(dtype="float64", na_value=np.nan) for col in numeric])
+    # Shared by every grouping without missing values
+    prepared_all = _prepare_outcomes(Y)
+    comparisons = []
+    for group in dict.fromkeys(groups):
+        if group in numeric:
+            continue
+        codes, levels = pd.factorize(df[group], use_na_sentinel=True)
+        k = len(levels)
+        if k < 2:
+            skipped[group] = "fewer than two groups"
+            continue
+        if k > MAX_COMPARISON_GROUPS:
+            skipped[group] = f"more than {MAX_COMPARISON_GROUPS} groups"
+            continue
+
+        # Rows with a missing group drop out of the ranks and means as well
+        prepared = prepared_all if (codes >= 0).all() else _prepare_outcomes(np.where((codes >= 0)[:, None], Y, np.nan))
+        n, sums, sumsq, rank_sums = _group_moments(codes, k, prepared)
+        tie_terms, offset = prepared[3], prepared[4]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            means = sums / n
+            var = (sumsq - sums * means) / (n - 1)
+            N = n.sum(axis=0)
+            k_eff = (n > 0).sum(axis=0)
+            grand = sums.sum(axis=0) / N
+
+            # One-way ANOVA
+            ss_between = np.nansum(n * (means - grand) ** 2, axis=0)
+            ss_within = sumsq.sum(axis=0) - np.nansum(sums * means, axis=0)
+            df_between, df_within = k_eff - 1, N - k_eff
+            f_stat = (ss_between / df_between) / (ss_within / df_within)
+            eta_sq = ss_between / (ss_between + ss_within)
+
+            # Kruskal-Wallis with tie correction
+            h = 12.0 / (N * (N + 1)) * np.nansum(rank_sums ** 2 / n, axis=0) - 3 * (N + 1)
+            h = h / (1 - tie_terms / (N ** 3 - N))
+
+        for j, outcome in enumerate(numeric):
+            used = np.flatnonzero(n[:, j] > 0)
+            if len(used) < 2 or df_within[j] < 1:
+                continue
+            entry = {
+                "outcome": outcome,
+                "group": group,
+                "n": int(N[j]),
+                "groups": [
+                    {
+                        "level": str(levels[g]),
+                        "n": int(n[g, j]),
+                        "mean": _r(means[g, j] + offset[j]),
+                        "sd": _r(np.sqrt(var[g, j])) if n[g, j] > 1 else None,
+                    }
+                    for g in used
+                ],
+            }
+            if len(used) == 2:
+                a, b = used
+                se2 = var[a, j] / n[a, j] + var[b, j] / n[b, j]
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    t_stat = (means[a, j] - means[b, j]) / np.sqrt(se2)
+                    welch_df = se2 ** 2 / (
+                        (var[a, j] / n[a, j]) ** 2 / (n[a, j] - 1) + (var[b, j] / n[b, j]) ** 2 / (n[b, j] - 1)
+                    )
+                    pooled = np.sqrt(((n[a, j] - 1) * var[a, j] + (n[b, j] - 1) * var[b, j]) / (N[j] - 2))
+                    cohens_d = (means[a, j] - means[b, j]) / pooled
+                p = float(2 * t_dist.sf(abs(t_stat), welch_df)) if np.isfinite(t_stat) else None
+                entry.update({
+                    "test": "Welch t-test",
+                    "statistic": _r(t_stat),
+                    "degrees_of_freedom": _r(welch_df),
+                    "p_value": p,
+                    "effect_size": {"cohens_d": _r(cohens_d)},
+                })
+            else:
+                p = float(f_dist.sf(f_stat[j], df_between[j], df_within[j])) if np.isfinite(f_stat[j]) else None
+                entry.update({
+                    "test": "one-way ANOVA",
+                    "statistic": _r(f_stat[j]),
+                    "degrees_of_freedom": [int(df_between[j]), int(df_within[j])],
+                    "p_value": p,
+                    "effect_size": {"eta_squared": _r(eta_sq[j])},
+                })
+            entry["kruskal_wallis"] = {
+                "h": _r(h[j]),
+                "p_value": float(chi2.sf(h[j], k_eff[j] - 1)) if np.isfinite(h[j]) else None,
+            }
+            comparisons.append(entry)
+
+    tested = [c for c in comparisons if c["p_value"] is not None]
+    if tested:
+        adjusted = false_discovery_control([c["p_value"] for c in tested], method="bh")
+        for c, p_adj in zip(tested, adjusted):
+            c["p_adjusted"] = round(float(p_adj), 6)
+            c["significant"] = bool(p_adj < FDR_ALPHA)
+    for c in comparisons:
+        c.setdefault("p_adjusted", None)
+        c.setdefault("significant", False)
+        c["p_value"] = None if c["p_value"] is None else round(c["p_value"], 6)
+        kw_p = c["kruskal_wallis"]["p_value"]
+        c["kruskal_wallis"]["p_value"] = None if kw_p is None else round(kw_p, 6)
+    comparisons.sort(key=lambda c: (not c["significant"], c["p_adjusted"] if c["p_adjusted"] is not None else 1.0))
+
+    return {
+        "outcomes_tested": len(numeric),
+        "n_comparisons": len(comparisons),
+        "n_significant": sum(c["significant"] for c in comparisons),
+        "correction": f"Benjamini-Hochberg FDR at {FDR_ALPHA}",
+        "comparisons": comparisons,
+        "skipped": skipped,
+    }
+
+
+# Levels seen fewer times than this are pooled into one "Other" level
+MIN_LEVEL_COUNT = 10
+# Categorical predictors with more levels than this (after pooling) are skipped
+MAX_PREDICTOR_LEVELS = 50
+# Outcome labels treated as the event when the outcome is not 0/1
+EVENT_LABELS = {"yes", "true", "1", "positive", "present", "agree", "success"}
+LOGIT_MAX_ITER = 100
+LOGIT_TOL = 1e-8
+
+
+def _event_codes(s: pd.Series) -> tuple[np.ndarray, str, str]:
+    """0/1 outcome vector plus the labels of the modelled event and the reference."""
+    codes, uniques = pd.factorize(s)
+    if len(uniques) != 2:
+        raise ValueError(f"Logistic regression needs a binary outcome; '{s.name}' has {len(uniques)} values")
+    labels = [_normalize_label(u) for u in uniques]
+    event = next((i for i, label in enumerate(labels) if label in EVENT_LABELS), None)
+    if event is None:
+        # Otherwise model the later label in sorted order (1 over 0, "b" over "a")
+        first, second = (uniques[0], uniques[1]) if pd.api.types.is_numeric_dtype(s) else (str(uniques[0]), str(uniques[1]))
+        event = int(second > first)
+    return (codes == event).astype("float64"), str(uniques[event]), str(uniques[1 - event])
+
+
+def _sparse_design(df: pd.DataFrame, predictors: list[str]) -> tuple:
+    """
+    CSR design matrix with an intercept column: numeric predictors as-is,
+    categorical predictors one-hot against their most frequent level. The
+    matrix is assembled column by column straight into CSC arrays (one
+    stable sort per predictor gives every level's rows), so no dense block
+    or coordinate triplets are ever built. Returns (X, terms, reference
+    levels, skipped), where each term describes one column.
+    """
+    n = len(df)
+    all_rows = np.arange(n, dtype="int32")
+    row_blocks, column_sizes, numeric_values = [all_rows], [n], {}
+    terms = [{"term": "Intercept", "predictor": None, "level": None}]
+    references, skipped = {}, {}
+
+    for col in predictors:
+        s = df[col]
+        if _column_kind(s) == "numeric":
+            numeric_values[len(terms)] = s.to_numpy(dtype="float64")
+            row_blocks.append(all_rows)
+            column_sizes.append(n)
+            terms.append({"term": col, "predictor": col, "level": None})
+            continue
+
+        codes, uniques = pd.factorize(s)
+        counts = np.bincount(codes, minlength=len(uniques))
+        labels = np.asarray([str(u) for u in uniques], dtype=object)
+        rare = counts < MIN_LEVEL_COUNT
+        if rare.sum() > 1:
+            # Pool rare levels so each column has enough rows to be estimable
+            labels[rare] = "Other"
+            codes, uniques = pd.factorize(labels[codes])
+            counts = np.bincount(codes, minlength=len(uniques))
+            labels = np.asarray(uniques, dtype=object)
+        if len(labels) < 2:
+            skipped[col] = "fewer than two levels"
+            continue
+        if len(labels) > MAX_PREDICTOR_LEVELS:
+            skipped[col] = f"more than {MAX_PREDICTOR_LEVELS} levels"
+            continue
+
+        reference = int(np.argmax(counts))
+        references[col] = str(labels[reference])
+        order = np.argsort(codes, kind="stable").astype("int32")
+        row_blocks.append(order[codes[order] != reference])
+        for level in range(len(labels)):
+            if level != reference:
+                column_sizes.append(int(counts[level]))
+                terms.append({"term": f"{col}[{labels[level]}]", "predictor": col, "level": str(labels[level])})
+
+    indptr = np.concatenate([[0], np.cumsum(column_sizes)])
+    data = np.ones(indptr[-1])
+    for j, values in numeric_values.items():
+        data[indptr[j]:indptr[j + 1]] = values
+    X = sparse.csc_matrix((data, np.concatenate(row_blocks), indptr), shape=(n, len(terms)))
+    return X.tocsr(), terms, references, skipped
+
+
+@tool
+def logistic_regression(
+    data: list[dict] | dict | str,
+    outcome: str,
+    predictors: list[str] | None = None
+) -> dict:
+    """
+    Binary logistic regression of `outcome` on survey predictors, fitted
+    without a penalty on a sparse one-hot design matrix.
+
+    Parameters:
+    - data: dataset handle, list of records, dict, or CSV/Excel file path
+    - outcome: binary outcome column (yes/no, 0/1, any two labels)
+    - predictors: explanatory columns (default: every other column)
+
+    Returns:
+    - coefficients: per term, log-odds, standard error, z, p-value, odds
+      ratio and 95% confidence interval; categorical levels are compared
+      with the most frequent level
+    - fit: log-likelihood, likelihood-ratio test against the intercept-only
+      model, McFadden pseudo R-squared, AIC, BIC, convergence
+    """
+    from sklearn.linear_model import LogisticRegression
+
+    columns = None if predictors is None else list(dict.fromkeys([outcome, *predictors]))
+    df = load_dataframe(data, columns=columns)
+    if predictors is None:
+        predictors = [col for col in df.columns if col != outcome]
+    missing = [col for col in [outcome, *predictors] if col not in df.columns]
+    if missing:
+        raise ValueError(f"Columns not found in dataset: {missing}")
+    predictors = [col for col in dict.fromkeys(predictors) if col != outcome]
+
+    subset = df[[outcome, *predictors]].dropna()
+    excluded = len(df) - len(subset)
+    y, event, non_event = _event_codes(subset[outcome])
+    X, terms, references, skipped = _sparse_design(subset, predictors)
+    n, k = X.shape
+    if k < 2:
+        raise ValueError("Logistic regression needs at least one usable predictor")
+    if n <= k:
+        raise ValueError("Not enough complete responses for the number of model terms")
+
+    # C=inf is the unpenalized fit; newton-cholesky works on the sparse matrix directly
+    model = LogisticRegression(
+        C=np.inf, solver="newton-cholesky", fit_intercept=False, max_iter=LOGIT_MAX_ITER, tol=LOGIT_TOL,
+    )
+    model.fit(X, y)
+    beta = model.coef_.ravel()
+
+    p = np.clip(1 / (1 + np.exp(-(X @ beta))), 1e-12, 1 - 1e-12)
+    # Observed information X' W X, built sparse and densified at k x k only
+    weighted = X.copy()
+    weighted.data *= np.repeat(p * (1 - p), np.diff(X.indptr))
+    hessian = (X.T @ weighted).toarray()
+    try:
+        cov = np.linalg.inv(hessian)
+        singular = False
+    except np.linalg.LinAlgError:
+        cov = np.linalg.pinv(hessian)
+        singular = True
+    se = np.sqrt(np.clip(np.diag(cov), 0, None))
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        z = beta / se
+        p_values = 2 * norm.sf(np.abs(z))
+        margin = norm.ppf(0.975) * se
+        odds, lower, upper = np.exp(beta), np.exp(beta - margin), np.exp(beta + margin)
+
+    log_lik = float(np.sum(y * np.log(p) + (1 - y) * np.log(1 - p)))
+    rate = y.mean()
+    null_log_lik = float(n * (rate * np.log(rate) + (1 - rate) * np.log(1 - rate)))
+    lr_stat = max(2 * (log_lik - null_log_lik), 0.0)
+    iterations = int(np.max(model.n_iter_))
+
+    return {
+        "outcome": outcome,
+        "event": event,
+        "reference_outcome": non_event,
+        "n": int(n),
+        "excluded_incomplete_rows": int(excluded),
+        "coefficients": [
+            {
+                **term,
+                "coef": _r(beta[j]),
+                "std_error": _r(se[j]),
+                "z": _r(z[j]),
+                "p_value": None if not np.isfinite(p_values[j]) else round(float(p_values[j]), 6),
+                "odds_ratio": _r(odds[j]),
+                "ci_95": [_r(lower[j]), _r(upper[j])],
+            }
+            for j, term in enumerate(terms)
+        ],
+        "reference_levels": references,
+        "fit": {
+            "log_likelihood": _r(log_lik),
+            "null_log_likelihood": _r(null_log_lik),
+            "lr_chi_square": _r(lr_stat),
+            "lr_df": k - 1,
+            "lr_p_value": round(float(chi2.sf(lr_stat, k - 1)), 6),
+            "pseudo_r2_mcfadden": _r(1 - log_lik / null_log_lik) if null_log_lik else None,
+            "aic": _r(2 * k - 2 * log_lik),
+            "bic": _r(k * np.log(n) - 2 * log_lik),
+            "converged": iterations < LOGIT_MAX_ITER,
+            "iterations": iterations,
+            "singular_information": singular,
+        },
+        "design": {
+            "rows": int(n),
+            "columns": int(k),
+            "nonzeros": int(X.nnz),
+            "density": round(X.nnz / (n * k), 4),
+        },
+        "skipped": skipped,
+    }
+
+
+def _option_chi_square(table: pd.DataFrame, sizes: pd.Series) -> tuple:
+    """
+    Chi-square of "picked the option" against the groups for every option at
+    once: each option's row of `table` and the unpicked remainder form a 2 x k
+    table. Options picked by everyone or no one get NaN.
+    """
+    present = sizes.to_numpy() > 0
+    picked = table.to_numpy(dtype="float64")[:, present]
+    sizes = sizes.to_numpy(dtype="float64")[present]
+    n = sizes.sum()
+    not_picked = sizes - picked
+    expected_picked = np.outer(picked.sum(axis=1), sizes) / n
+    expected_not = np.outer(not_picked.sum(axis=1), sizes) / n
+    with np.errstate(divide="ignore", invalid="ignore"):
+        stat = (
+            ((picked - expected_picked) ** 2 / expected_picked).sum(axis=1)
+            + ((not_picked - expected_not) ** 2 / expected_not).sum(axis=1)
+        )
+    stat[(expected_picked.sum(axis=1) == 0) | (expected_not.sum(axis=1) == 0)] = np.nan
+    low_expected = ((expected_picked < MIN_EXPECTED_COUNT) | (expected_not < MIN_EXPECTED_COUNT)).sum(axis=1)
+    return stat, int(present.sum()) - 1, n, low_expected
+
+
+@tool
+def multi_select_analysis(
+    data: list[dict] | dict | str,
+    columns: list[str] | None = None,
+    by: list[str] | None = None,
+    delimiter: str | None = None
+) -> dict:
+    """
+    Expand multi-select survey columns ("Mobile money; Bank; Cash") into one
+    indicator per option and summarise the options rather than the
+    combinations.
+
+    Parameters:
+    - data: dataset handle, list of records, dict, or CSV/Excel file path
+    - columns: columns named as multi-select; these may be separated by
+      ; | , or / (default: columns detected automatically, which must use
+      ; or | with a consistent set of options)
+    - by: columns to crosstab each option against (default: none)
+    - delimiter: separator of the named columns (default: detected)
+
+    Returns:
+    - columns: per multi-select column, its delimiter, respondents, number of
+      options and mean options picked per respondent
+    - options: per option, count and percentage of respondents and of responses
+    - crosstabs: per (option, by column), counts per level with a chi-square
+      test of picking the option against the levels, Cramér's V and
+      Benjamini-Hochberg adjusted p-values; significant rows first
+    - skipped: columns left out and why
+    """
+    wanted = None if columns is None else list(columns) + list(by or [])
+    df = load_dataframe(data, columns=wanted)
+    missing = [col for col in (columns or []) + (by or []) if col not in df.columns]
+    if missing:
+        raise ValueError(f"Columns not found in dataset: {missing}")
+
+    skipped = {}
+    expanded = []
+    for col in dict.fromkeys(columns if columns is not None else df.columns):
+        multi = multi_select_indicators(data, df, col, named=columns is not None, delimiter=delimiter)
+        if multi is None:
+            if columns is not None:
+                skipped[col] = "no delimiter-separated options detected"
+        else:
+            expanded.append(multi)
+    if not expanded:
+        raise ValueError("No multi-select columns found; name the column (answers separated by ; | , or /)")
+
+    summaries, options, crosstabs, stats = [], [], [], []
+    for multi in expanded:
+        counts = multi.counts()
+        respondents = int(multi.answered.sum())
+        responses = int(counts.sum())
+        summaries.append({
+            "column": multi.column,
+            "delimiter": multi.delimiter,
+            "respondents": respondents,
+            "missing": int(len(multi.answered) - respondents),
+            "n_options": len(counts),
+            "mean_selections": _r(responses / respondents),
+        })
+        options += [
+            {
+                "column": multi.column,
+                "option": option,
+                "count": int(count),
+                "percent_of_respondents": round(count / respondents * 100, 2),
+                "percent_of_responses": round(count / responses * 100, 2),
+            }
+            for option, count in counts.items()
+        ]
+
+        for group in dict.fromkeys(by or []):
+            if group == multi.column:
+                continue
+            table, sizes = multi.crosstab(df[group])
+            if not 2 <= (sizes > 0).sum() <= MAX_COMPARISON_GROUPS:
+                skipped[group] = f"needs 2 to {MAX_COMPARISON_GROUPS} groups"
+                continue
+            stat, dof, n, low_expected = _option_chi_square(table, sizes)
+            for j, option in enumerate(table.index):
+                if not np.isfinite(stat[j]):
+                    continue
+                stats.append((stat[j], dof))
+                row = {
+                    "column": multi.column,
+                    "option": option,
+                    "by": group,
+                    "n": int(n),
+                    "counts": {str(level): int(c) for level, c in table.loc[option].items() if sizes[level]},
+                    "chi_square": round(float(stat[j]), 4),
+                    "degrees_of_freedom": dof,
+                    "cramers_v": round(float(np.sqrt(stat[j] / n)), 4),
+                }
+                if low_expected[j]:
+                    row["low_expected_cells"] = int(low_expected[j])
+                crosstabs.append(row)
+
+    if crosstabs:
+        p_values = chi2.sf([s for s, _ in stats], [d for _, d in stats])
+        adjusted = false_discovery_control(p_values, method="bh")
+        for row, p, p_adj in zip(crosstabs, p_values, adjusted):
+            row["p_value"] = round(float(p), 6)
+            row["p_adjusted"] = round(float(p_adj), 6)
+            row["significant"] = bool(p_adj < FDR_ALPHA)
+        crosstabs.sort(key=lambda row: (not row["significant"], -row["cramers_v"]))
+
     return {
-        "raw_alpha": round(raw_alpha, 4),
-        "standardized_alpha": round(standardized_alpha, 4),
-        "items": k
+        "columns": summaries,
+        "options": options,
+        "crosstabs": crosstabs,
+        "n_tests": len(crosstabs),
+        "n_significant": sum(row["significant"] for row in crosstabs),
+        "correction": f"Benjamini-Hochberg FDR at {FDR_ALPHA}",
+        "skipped": skipped,
     }
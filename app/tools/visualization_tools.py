@@ -1,43 +1,79 @@
 import os
-import matplotlib.pyplot as plt
 import seaborn as sns
+from matplotlib.figure import Figure
 import pandas as pd
 from crewai.tools import tool
 from io import BytesIO
+from app.services.dataset_store import load_dataframe
+from app.tools.analysis_tools import multi_select_indicators
+from app.utils.sketches import Reservoir
 
-def _load_dataframe(data):
-    if isinstance(data, str):
-        if data.endswith(".csv"):
-            return pd.read_csv(data)
-        else:
-            return pd.read_excel(data)
-    elif isinstance(data, (list, dict)):
-        # Handle list of dicts from records
+def _load_dataframe(data, columns=None):
+    if isinstance(data, dict):
+        # A dict here is column -> values, not a single record
         return pd.DataFrame(data)
-    return pd.DataFrame(data)
+    return load_dataframe(data, columns=columns)
 
-def _save_or_buffer_plot(filename: str = None) -> dict:
+def _new_axes(figsize: tuple[int, int]):
+    """
+    Create a standalone Figure rather than using pyplot's global state, so
+    plots can be rendered from several worker threads at once.
+    """
+    fig = Figure(figsize=figsize)
+    return fig, fig.subplots()
+
+def _rotate_xticks(ax) -> None:
+    for label in ax.get_xticklabels():
+        label.set_rotation(45)
+        label.set_horizontalalignment("right")
+
+def _sample_for_plot(df: pd.DataFrame, approximate: bool | None):
+    """
+    The rows to plot: all of them, or in approximate mode a uniform
+    reservoir sample plus how far its category shares can be off.
+    """
+    if not approximate:
+        return df, None
+    reservoir = Reservoir.from_frame(df)
+    info = {
+        "approximate": True,
+        "sample_rows": len(reservoir.rows),
+        "population_rows": len(df),
+        "proportion_margin_95": round(reservoir.proportion_margin(), 4),
+    }
+    return reservoir.rows, info
+
+def _sample_note(info: dict | None) -> str | None:
+    return f"sample of {info['sample_rows']:,} rows" if info else None
+
+def _save_or_buffer_plot(fig: Figure, filename: str = None) -> dict:
     """Return metadata and in-memory file if needed."""
     buffer = None
     if not filename:
         buffer = BytesIO()
-        plt.savefig(buffer, format="png")
+        fig.savefig(buffer, format="png")
         buffer.seek(0)
     else:
         out_dir = os.path.dirname(filename)
         if out_dir:
             os.makedirs(out_dir, exist_ok=True)
-        plt.savefig(filename)
-    plt.close()
+        fig.savefig(filename)
     return buffer
 
 @tool
 def countplot(data: list[dict] | dict | str,
               x: str,
               hue: str | None = None,
-              filename: str | None = "outputs/plots/countplot.png"):
-    """Generate a countplot for a categorical variable. Supports 'hue' for comparison."""
-    df = _load_dataframe(data)
+              filename: str | None = "outputs/plots/countplot.png",
+              approximate: bool | None = None,
+              multi_select: bool = False):
+    """
+    Generate a countplot for a categorical variable. Supports 'hue' for comparison.
+    approximate: plot counts estimated from a row sample (off unless requested).
+    multi_select: x is a multi-select question; count each option rather than
+    each combination of answers (off unless requested).
+    """
+    df = _load_dataframe(data, columns=[c.strip() for c in (x, hue) if c])
     
     # Cleaning inputs to match our cleaned dataframe columns
     x = x.strip() if x else x
@@ -49,18 +85,35 @@ def countplot(data: list[dict] | dict | str,
     if x not in df.columns:
         raise ValueError(f"Column '{x}' not found in dataset. Available: {list(df.columns)}")
     
-    plt.figure(figsize=(10, 6))
+    fig, ax = _new_axes((10, 6))
     
     # Ensure we don't pass hue if it's identical to x (prevents Seaborn errors)
     actual_hue = hue if (hue and hue in df.columns and hue != x) else None
+
+    # Named multi-select answers are counted per option, not per combination
+    multi = multi_select_indicators(data, df, x, named=True) if multi_select else None
+    if multi is not None:
+        counts = multi.crosstab(df[actual_hue])[0] if actual_hue else multi.counts()
+        result = countplot_from_counts(counts, x, actual_hue, filename, note="each option counted")
+        result["multi_select"] = {"delimiter": multi.delimiter, "options": len(multi.options)}
+        return result
+
+    sample, info = _sample_for_plot(df, approximate)
+    if info:
+        # Sample counts scaled back up to the full dataset
+        counts = pd.crosstab(sample[x], sample[actual_hue]) if actual_hue else sample[x].value_counts()
+        scale = info["population_rows"] / info["sample_rows"]
+        result = countplot_from_counts((counts * scale).round(), x, actual_hue, filename, note=_sample_note(info))
+        result["approximate"] = info
+        return result
+
+    sns.countplot(data=df, x=x, hue=actual_hue, ax=ax)
     
-    sns.countplot(data=df, x=x, hue=actual_hue)
-    
-    plt.title(f"Distribution of {x}" + (f" by {actual_hue}" if actual_hue else ""))
-    plt.xticks(rotation=45, ha="right")
-    plt.tight_layout()
+    ax.set_title(f"Distribution of {x}" + (f" by {actual_hue}" if actual_hue else ""))
+    _rotate_xticks(ax)
+    fig.tight_layout()
     
-    buffer = _save_or_buffer_plot(filename)
+    buffer = _save_or_buffer_plot(fig, filename)
     result = {"type": "countplot", "x": x, "hue": actual_hue}
     if filename: result["file"] = filename
     return result
@@ -70,9 +123,13 @@ def barplot(data: list[dict] | dict | str,
             x: str,
             y: str | None = None,
             hue: str | None = None,
-            filename: str | None = "outputs/plots/barplot.png"):
-    """Generate a barplot for categorical vs. numerical variable. Supports 'hue'."""
-    df = _load_dataframe(data)
+            filename: str | None = "outputs/plots/barplot.png",
+            approximate: bool | None = None):
+    """
+    Generate a barplot for categorical vs. numerical variable. Supports 'hue'.
+    approximate: plot from a row sample (off unless requested).
+    """
+    df = _load_dataframe(data, columns=[c.strip() for c in (x, y, hue) if c])
     
     x = x.strip() if x else x
     y = y.strip() if y else None
@@ -83,41 +140,91 @@ def barplot(data: list[dict] | dict | str,
     if x not in df.columns:
         raise ValueError(f"X column '{x}' not found.")
     
-    plt.figure(figsize=(10, 6))
+    fig, ax = _new_axes((10, 6))
     
     actual_hue = hue if (hue and hue in df.columns and hue != x) else None
     
+    df, info = _sample_for_plot(df, approximate)
+
     # If no Y is provided, Seaborn barplot needs an estimator or it defaults to count-like behavior
-    sns.barplot(data=df, x=x, y=y, hue=actual_hue)
+    sns.barplot(data=df, x=x, y=y, hue=actual_hue, ax=ax)
     
-    plt.title(f"{y if y else 'Count'} by {x}" + (f" and {actual_hue}" if actual_hue else ""))
-    plt.xticks(rotation=45, ha="right")
-    plt.tight_layout()
+    ax.set_title(
+        f"{y if y else 'Count'} by {x}" + (f" and {actual_hue}" if actual_hue else "")
+        + (f" ({_sample_note(info)})" if info else "")
+    )
+    _rotate_xticks(ax)
+    fig.tight_layout()
     
-    buffer = _save_or_buffer_plot(filename)
+    buffer = _save_or_buffer_plot(fig, filename)
     result = {"type": "barplot", "x": x, "y": y, "hue": actual_hue}
     if filename: result["file"] = filename
+    if info: result["approximate"] = info
     return result
 
 @tool
 def piechart(data: list[dict] | dict | str,
              column: str,
-             filename: str | None = "outputs/plots/piechart.png"):
-    """Generate a pie chart for a categorical variable."""
-    df = _load_dataframe(data)
+             filename: str | None = "outputs/plots/piechart.png",
+             approximate: bool | None = None):
+    """
+    Generate a pie chart for a categorical variable.
+    approximate: shares estimated from a row sample (off unless requested).
+    """
+    df = _load_dataframe(data, columns=[column.strip()])
     column = column.strip()
 
     if column not in df.columns:
         raise ValueError(f"Column '{column}' not found.")
 
-    counts = df[column].value_counts()
-    plt.figure(figsize=(8, 8))
-    plt.pie(counts, labels=counts.index, autopct="%1.1f%%", startangle=90)
-    plt.title(f"Proportion of {column}")
-    plt.axis("equal")
-    plt.tight_layout()
+    sample, info = _sample_for_plot(df, approximate)
+    result = piechart_from_counts(sample[column].value_counts(), column, filename, note=_sample_note(info))
+    if info: result["approximate"] = info
+    return result
+
+
+def piechart_from_counts(counts: pd.Series,
+                         column: str,
+                         filename: str | None = "outputs/plots/piechart.png",
+                         note: str | None = None) -> dict:
+    """Render a pie chart from precomputed category counts; `note` is appended to the title."""
+    counts = counts[counts > 0]
+    fig, ax = _new_axes((8, 8))
+    ax.pie(counts, labels=counts.index, autopct="%1.1f%%", startangle=90)
+    ax.set_title(f"Proportion of {column}" + (f" ({note})" if note else ""))
+    ax.axis("equal")
+    fig.tight_layout()
     
-    buffer = _save_or_buffer_plot(filename)
+    buffer = _save_or_buffer_plot(fig, filename)
     result = {"type": "piechart", "column": column}
     if filename: result["file"] = filename
+    return result
+
+
+def countplot_from_counts(counts: pd.Series | pd.DataFrame,
+                          x: str,
+                          hue: str | None = None,
+                          filename: str | None = "outputs/plots/countplot.png",
+                          note: str | None = None) -> dict:
+    """
+    Render a countplot from precomputed counts: a Series indexed by the `x`
+    categories, or a crosstab with `x` as rows and `hue` as columns.
+    `note` is appended to the title.
+    """
+    if isinstance(counts, pd.DataFrame):
+        long = counts.rename_axis(index=x, columns=hue).stack().rename("count").reset_index()
+    else:
+        long = counts.rename_axis(x).rename("count").reset_index()
+        hue = None
+    long[x] = long[x].astype(str)
+
+    fig, ax = _new_axes((10, 6))
+    sns.barplot(data=long, x=x, y="count", hue=hue, ax=ax)
+    ax.set_title(f"Distribution of {x}" + (f" by {hue}" if hue else "") + (f" ({note})" if note else ""))
+    _rotate_xticks(ax)
+    fig.tight_layout()
+
+    buffer = _save_or_buffer_plot(fig, filename)
+    result = {"type": "countplot", "x": x, "hue": hue}
+    if filename: result["file"] = filename
     return result
\ No newline at end of file
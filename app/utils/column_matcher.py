@@ -1,14 +1,145 @@
+import os
 import re
 import json
+import time
+import sqlite3
+import hashlib
 import logging
+import threading
+from collections import OrderedDict
+from functools import lru_cache
 from typing import List, Optional, Tuple
-from app.core.llm import get_llm
+import numpy as np
+from app.core.llm import get_llm, get_embeddings
 
 logger = logging.getLogger(__name__)
 llm = get_llm()
+_embeddings = None
 
 # Confidence threshold for matching
 CONFIDENCE_THRESHOLD = 0.65
+# Cosine similarity a header embedding needs before it is trusted without the LLM
+EMBEDDING_THRESHOLD = 0.55
+# Best and runner-up closer than this count as ambiguous and lose confidence
+AMBIGUITY_MARGIN = 0.1
+# Schemas whose header embeddings are kept in memory
+MAX_CACHED_SCHEMAS = 64
+# Roles a plan step may leave unbound; all others must resolve to a column
+OPTIONAL_ROLES = {"hue"}
+STOPWORDS = {"a", "an", "and", "the", "of", "in", "on", "for", "to", "by", "vs", "your", "you", "is", "are", "what", "do"}
+
+# Resolved phrase -> column cache: in-memory LRU in front of a SQLite file.
+# Kept outside outputs/ so it is never served by /download
+RESOLUTION_CACHE_SIZE = 2048
+RESOLUTION_CACHE_DB = "cache/column_resolution.sqlite3"
+# Cached binding of an optional role the LLM left empty ("no hue")
+NO_COLUMN = ""
+
+_header_vectors: OrderedDict[str, np.ndarray] = OrderedDict()
+
+
+class ResolutionCache:
+    """
+    Remembers which column a phrase resolved to for a given schema.
+
+    Keys are (schema fingerprint, normalized phrase), so a dataset with
+    different cleaned headers never sees another schema's entries, and a
+    cached column is re-checked against the live header list on every hit.
+    Lookups try the LRU first, then SQLite (promoting the row into the LRU).
+    The disk tier is disabled for the process if the database cannot be used.
+    NO_COLUMN is a valid cached value, recording that a role has no column.
+    """
+
+    def __init__(self, max_entries: int = RESOLUTION_CACHE_SIZE, db_path: str | None = RESOLUTION_CACHE_DB):
+        self.max_entries = max_entries
+        self.db_path = db_path
+        self._memory: OrderedDict[tuple[str, str], str] = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+        self.hits = {"memory": 0, "disk": 0}
+        self.misses = 0
+
+    def _db(self) -> sqlite3.Connection | None:
+        if self._conn is None and self.db_path:
+            try:
+                if os.path.dirname(self.db_path):
+                    os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+                conn = sqlite3.connect(self.db_path, check_same_thread=False)
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS column_resolution ("
+                    "fingerprint TEXT NOT NULL, phrase TEXT NOT NULL, column_name TEXT NOT NULL, "
+                    "updated_at REAL NOT NULL, PRIMARY KEY (fingerprint, phrase))"
+                )
+                conn.commit()
+                self._conn = conn
+            except sqlite3.Error as e:
+                logger.warning(f"Column resolution disk cache disabled: {e}")
+                self.db_path = None
+        return self._conn
+
+    def _remember(self, key: tuple[str, str], column: str) -> None:
+        self._memory[key] = column
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, fingerprint: str, phrase: str, columns: List[str]) -> Optional[str]:
+        key = (fingerprint, phrase)
+        with self._lock:
+            column = self._memory.get(key)
+            if column is not None and (column == NO_COLUMN or column in columns):
+                self._memory.move_to_end(key)
+                self.hits["memory"] += 1
+                return column
+
+            conn = self._db()
+            if conn is not None:
+                try:
+                    row = conn.execute(
+                        "SELECT column_name FROM column_resolution WHERE fingerprint = ? AND phrase = ?",
+                        key,
+                    ).fetchone()
+                except sqlite3.Error as e:
+                    logger.warning(f"Column resolution cache read failed: {e}")
+                    row = None
+                if row and (row[0] == NO_COLUMN or row[0] in columns):
+                    self._remember(key, row[0])
+                    self.hits["disk"] += 1
+                    return row[0]
+
+            self.misses += 1
+            return None
+
+    def put(self, fingerprint: str, phrase: str, column: str) -> None:
+        key = (fingerprint, phrase)
+        with self._lock:
+            self._remember(key, column)
+            conn = self._db()
+            if conn is None:
+                return
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO column_resolution VALUES (?, ?, ?, ?)",
+                    (*key, column, time.time()),
+                )
+                conn.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"Column resolution cache write failed: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = sum(self.hits.values())
+            total = hits + self.misses
+            return {
+                "memory_entries": len(self._memory),
+                "memory_hits": self.hits["memory"],
+                "disk_hits": self.hits["disk"],
+                "misses": self.misses,
+                "hit_rate": round(hits / total, 4) if total else None,
+            }
+
+
+resolution_cache = ResolutionCache()
 
 def aggressive_clean(text: str) -> str:
     """Removes standard spaces, non-breaking spaces (\xa0), and newlines."""
@@ -85,13 +216,14 @@ async def resolve_column(
     if not phrase:
         return None
 
-    # 1. Direct match (case-insensitive)
-    phrase_clean = phrase.strip().lower()
-    for col in columns:
-        if phrase_clean == col.strip().lower():
-            return col
+    # 1-3. Direct match, earlier resolutions, local index and embeddings
+    fingerprint = schema_fingerprint([aggressive_clean(col) for col in columns])
+    phrase_key = _normalize(phrase)
+    local = await _resolve_locally(phrase, columns, fingerprint, threshold)
+    if local is not None:
+        return local
 
-    # 2. Semantic Match
+    # 4. Semantic Match
     prompt = f"""
     Target Concept: "{phrase}"
     Available Columns: {columns}
@@ -117,8 +249,302 @@ async def resolve_column(
         confidence = parsed.get("confidence", 0.0)
         
         if best_col in columns and confidence >= threshold:
+            resolution_cache.put(fingerprint, phrase_key, best_col)
             return best_col
     except Exception as e:
         logger.error(f"Semantic Column Match failed: {e}")
     
-    return None
\ No newline at end of file
+    return None
+
+async def _resolve_locally(
+    phrase: str,
+    columns: List[str],
+    fingerprint: str,
+    threshold: float = CONFIDENCE_THRESHOLD,
+) -> Optional[str]:
+    """
+    Resolve a phrase without the chat LLM: direct (case-insensitive) match,
+    then an earlier resolution against the same schema, then the local
+    trigram/token index and cached header embeddings. None when no step is
+    confident.
+    """
+    phrase_clean = phrase.strip().lower()
+    for col in columns:
+        if phrase_clean == col.strip().lower():
+            return col
+
+    phrase_key = _normalize(phrase)
+    cached = resolution_cache.get(fingerprint, phrase_key, columns)
+    if cached:
+        return cached
+
+    best_col, score = await match_column(phrase, columns)
+    if best_col is not None and score >= threshold:
+        resolution_cache.put(fingerprint, phrase_key, best_col)
+        return best_col
+    return None
+
+def _load_json(content: str) -> dict:
+    """Parse an LLM reply that may wrap its JSON in a markdown fence."""
+    if "```json" in content:
+        content = content.split("```json")[1].split("```")[0].strip()
+    elif "```" in content:
+        content = content.split("```")[1].split("```")[0].strip()
+    return json.loads(content)
+
+def _match_listed_column(name, columns: List[str]) -> Optional[str]:
+    """Map a column name echoed back by the LLM onto the real header, or None."""
+    if not isinstance(name, str):
+        return None
+    name_clean = aggressive_clean(name).lower()
+    for col in columns:
+        if name_clean == aggressive_clean(col).lower():
+            return col
+    return None
+
+async def resolve_plan_columns(
+    steps: List[dict],
+    user_message: str,
+    columns: List[str],
+) -> List[dict]:
+    """
+    Resolves the column bindings of every plan step, calling the LLM at most
+    once.
+
+    `steps` holds one dict per step with its `tool`, the column `roles` it
+    needs (e.g. ["x", "hue"]), an optional `reason` and optional `phrases`
+    (role -> column phrase named by the plan). Phrases are matched locally
+    first (`_resolve_locally`). An optional role with no phrase is only
+    asked for when the step's required roles are too, since the plan names
+    a comparison column whenever it wants one. Roles still unbound are
+    looked up in `resolution_cache` by tool, role and phrase (or the request
+    itself, see `_binding_key`); only the misses go into one batched LLM
+    call, whose bindings are cached for the next identical request.
+
+    Returns one dict per step mapping role -> column name or None. Names the
+    LLM returns that are not in `columns` come back as None, so callers can
+    fall back to per-step resolution for anything left unbound.
+    """
+    bindings = [{role: None for role in step["roles"]} for step in steps]
+    if not steps:
+        return bindings
+
+    fingerprint = schema_fingerprint([aggressive_clean(col) for col in columns])
+    pending = {}
+    for i, step in enumerate(steps):
+        phrases = step.get("phrases") or {}
+        for role in step["roles"]:
+            if phrases.get(role):
+                bindings[i][role] = await _resolve_locally(phrases[role], columns, fingerprint)
+        required_missing = any(
+            bindings[i][role] is None for role in step["roles"] if role not in OPTIONAL_ROLES
+        )
+        roles = [
+            role for role in step["roles"]
+            if bindings[i][role] is None
+            and (role not in OPTIONAL_ROLES or phrases.get(role) or required_missing)
+        ]
+        unresolved = []
+        for role in roles:
+            cached = resolution_cache.get(fingerprint, _binding_key(step, role, user_message), columns)
+            if cached is None:
+                unresolved.append(role)
+            else:
+                bindings[i][role] = cached or None
+        if unresolved:
+            pending[i] = unresolved
+    if not pending:
+        return bindings
+
+    step_lines = "\n".join(
+        f'{i}. tool={steps[i]["tool"]}, roles={roles}'
+        + (f', reason="{steps[i]["reason"]}"' if steps[i].get("reason") else "")
+        for i, roles in pending.items()
+    )
+    prompt = f"""
+    Research request: "{user_message}"
+    Available Columns: {columns}
+
+    The analysis plan has these steps, each needing columns for the listed roles:
+    {step_lines}
+
+    Rules:
+    1. Use ONLY exact names from the column list.
+    2. Roles "x", "outcome" and "predictor" are required; "hue" is optional.
+    3. Set "hue" only if the request compares variables ("by", "vs", "relationship"); otherwise null.
+    4. If no column clearly fits a role, use null.
+
+    Return ONLY a JSON object:
+    {{"steps": [{{"step": 0, "columns": {{"role": "column name or null"}}}}]}}
+    """
+
+    try:
+        response = await llm.ainvoke(prompt)
+        parsed = _load_json(response.content)
+    except Exception as e:
+        logger.error(f"Batched column resolution failed: {e}")
+        return bindings
+
+    for item in parsed.get("steps") or []:
+        if not isinstance(item, dict):
+            continue
+        index = item.get("step")
+        if not isinstance(index, int) or index not in pending:
+            continue
+        chosen = item.get("columns") or {}
+        for role in pending[index]:
+            column = _match_listed_column(chosen.get(role), columns)
+            bindings[index][role] = column
+            # An empty optional role is an answer too; an empty required one is retried
+            if column is not None or role in OPTIONAL_ROLES:
+                key = _binding_key(steps[index], role, user_message)
+                resolution_cache.put(fingerprint, key, column or NO_COLUMN)
+    return bindings
+
+
+def _binding_key(step: dict, role: str, user_message: str) -> str:
+    """Resolution-cache key of a step role: its plan phrase, else the request itself."""
+    phrase = (step.get("phrases") or {}).get(role)
+    if phrase:
+        return f"{step['tool']}.{role}|{_normalize(phrase)}"
+    return f"{step['tool']}.{role}|{_normalize(user_message or '')}"
+
+
+def schema_fingerprint(columns: List[str]) -> str:
+    """Stable identifier for a header list, used to key per-schema caches."""
+    return hashlib.sha1("\x1f".join(columns).encode("utf-8")).hexdigest()
+
+def _normalize(text: str) -> str:
+    return " ".join(re.findall(r"[a-z0-9]+", aggressive_clean(str(text)).lower()))
+
+def _trigrams(text: str) -> set:
+    padded = f" {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def _tokens(text: str) -> set:
+    tokens = set(text.split())
+    return (tokens - STOPWORDS) or tokens
+
+@lru_cache(maxsize=MAX_CACHED_SCHEMAS)
+def _header_index(columns: Tuple[str, ...]) -> tuple:
+    """Trigram and token sets per header plus an inverted trigram -> headers index."""
+    trigrams, tokens, inverted = [], [], {}
+    for i, col in enumerate(columns):
+        norm = _normalize(col)
+        grams = _trigrams(norm)
+        trigrams.append(grams)
+        tokens.append(_tokens(norm))
+        for gram in grams:
+            inverted.setdefault(gram, []).append(i)
+    return trigrams, tokens, inverted
+
+def _token_hits(phrase_tokens: set, header_tokens: set) -> int:
+    """Phrase tokens found in the header, allowing shared stems (gender/genders)."""
+    hits = 0
+    for token in phrase_tokens:
+        if token in header_tokens:
+            hits += 1
+            continue
+        for other in header_tokens:
+            shorter = min(len(token), len(other))
+            prefix = len(os.path.commonprefix([token, other]))
+            if shorter >= 4 and prefix >= max(4, 0.6 * shorter):
+                hits += 1
+                break
+    return hits
+
+def _confidence(scores: List[Tuple[float, int]]) -> Tuple[Optional[int], float]:
+    """
+    Best candidate and its score. When the runner-up is within
+    AMBIGUITY_MARGIN the score is scaled down, to half on an exact tie.
+    """
+    if not scores:
+        return None, 0.0
+    scores.sort(reverse=True)
+    best, index = scores[0]
+    gap = best - (scores[1][0] if len(scores) > 1 else 0.0)
+    if gap < AMBIGUITY_MARGIN:
+        best *= 0.5 + 0.5 * gap / AMBIGUITY_MARGIN
+    return index, best
+
+def match_column_lexical(phrase: str, columns: List[str]) -> Tuple[Optional[str], float]:
+    """
+    Scores headers by how much of the phrase they contain: character
+    trigrams (robust to typos and plurals) and content tokens, weighted
+    equally. Containment rather than overlap, because user phrases are
+    usually fragments of long question-style headers.
+    """
+    norm = _normalize(phrase)
+    if not norm or not columns:
+        return None, 0.0
+
+    trigrams, tokens, inverted = _header_index(tuple(columns))
+    phrase_grams = _trigrams(norm)
+    phrase_tokens = _tokens(norm)
+
+    shared = {}
+    for gram in phrase_grams:
+        for i in inverted.get(gram, ()):
+            shared[i] = shared.get(i, 0) + 1
+
+    scores = []
+    for i, n_shared in shared.items():
+        tri = n_shared / len(phrase_grams)
+        tok = _token_hits(phrase_tokens, tokens[i]) / len(phrase_tokens)
+        # Small tie-break towards shorter headers with the same containment
+        tightness = n_shared / len(trigrams[i] | phrase_grams)
+        scores.append((0.5 * tri + 0.5 * tok + 0.01 * tightness, i))
+
+    index, score = _confidence(scores)
+    return (columns[index] if index is not None else None), min(score, 1.0)
+
+async def _header_embeddings(columns: List[str]) -> np.ndarray:
+    """Unit-normalized header embeddings, computed once per schema."""
+    global _embeddings
+    key = schema_fingerprint(columns)
+    vectors = _header_vectors.get(key)
+    if vectors is not None:
+        _header_vectors.move_to_end(key)
+        return vectors
+
+    if _embeddings is None:
+        _embeddings = get_embeddings()
+    raw = np.asarray(await _embeddings.aembed_documents([aggressive_clean(c) for c in columns]), dtype="float32")
+    vectors = raw / np.maximum(np.linalg.norm(raw, axis=1, keepdims=True), 1e-12)
+    _header_vectors[key] = vectors
+    while len(_header_vectors) > MAX_CACHED_SCHEMAS:
+        _header_vectors.popitem(last=False)
+    return vectors
+
+async def match_column_semantic(phrase: str, columns: List[str]) -> Tuple[Optional[str], float]:
+    """Cosine similarity of the phrase against the cached header embeddings."""
+    if not phrase or not columns:
+        return None, 0.0
+    vectors = await _header_embeddings(columns)
+    query = np.asarray(await _embeddings.aembed_query(aggressive_clean(phrase)), dtype="float32")
+    sims = vectors @ (query / max(float(np.linalg.norm(query)), 1e-12))
+    index, score = _confidence([(float(sim), i) for i, sim in enumerate(sims)])
+    return (columns[index] if index is not None else None), score
+
+async def match_column(phrase: str, columns: List[str]) -> Tuple[Optional[str], float]:
+    """
+    Local hybrid matcher: returns the best header and a confidence in [0, 1]
+    without calling the chat LLM. The trigram/token index answers most
+    fragments; embeddings are only consulted when it is not confident.
+    Embedding similarities are rescaled so that EMBEDDING_THRESHOLD maps onto
+    CONFIDENCE_THRESHOLD and both scores are comparable.
+    """
+    best_col, score = match_column_lexical(phrase, columns)
+    if best_col is not None and score >= CONFIDENCE_THRESHOLD:
+        return best_col, score
+
+    try:
+        sem_col, sim = await match_column_semantic(phrase, columns)
+    except Exception as e:
+        logger.warning(f"Embedding column match unavailable: {e}")
+        return best_col, score
+
+    sem_score = min(1.0, sim * CONFIDENCE_THRESHOLD / EMBEDDING_THRESHOLD)
+    if sem_col is not None and sem_score > score:
+        return sem_col, sem_score
+    return best_col, score
@@ -0,0 +1,350 @@
+import math
+from typing import Callable
+import numpy as np
+import pandas as pd
+
+
+# Estimated row count above which chunked descriptive statistics switch to sketches
+APPROX_ROW_THRESHOLD = 1_000_000
+# HyperLogLog uses 2**HLL_PRECISION registers (4096: about 1.6% standard error)
+HLL_PRECISION = 12
+# KLL accuracy parameter; larger k means smaller rank error and more memory
+KLL_K = 200
+# Misra-Gries counters kept per categorical column
+MG_CAPACITY = 256
+# Rows kept for plotting in approximate mode
+RESERVOIR_SIZE = 20_000
+SKETCH_SEED = 2024
+# Rows fed to the sketches at a time when summarising an in-memory frame
+SKETCH_BATCH_ROWS = 100_000
+
+
+def _hash64(values: np.ndarray) -> np.ndarray:
+    return pd.util.hash_array(np.asarray(values), categorize=False)
+
+
+def _bit_length(x: np.ndarray) -> np.ndarray:
+    """Exact bit length of uint64 values (float64 is exact per 32-bit half)."""
+    hi = (x >> np.uint64(32)).astype("float64")
+    lo = (x & np.uint64(0xFFFFFFFF)).astype("float64")
+    return np.where(hi > 0, 32 + np.frexp(hi)[1], np.frexp(lo)[1])
+
+
+class HyperLogLog:
+    """Distinct-count estimate in 2**p one-byte registers. Merge is a register-wise max."""
+
+    def __init__(self, precision: int = HLL_PRECISION):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype="uint8")
+
+    def update(self, values: np.ndarray) -> None:
+        if not len(values):
+            return
+        hashes = _hash64(values)
+        p = self.precision
+        index = (hashes >> np.uint64(64 - p)).astype("int64")
+        rest = hashes & np.uint64((1 << (64 - p)) - 1)
+        rank = ((64 - p) - _bit_length(rest) + 1).astype("uint8")
+        np.maximum.at(self.registers, index, rank)
+
+    def merge(self, other: "HyperLogLog") -> None:
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def estimate(self) -> int:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype("int64")))
+        zeros = int((self.registers == 0).sum())
+        if raw <= 2.5 * m and zeros:
+            # Small-range correction (linear counting)
+            return int(round(m * math.log(m / zeros)))
+        return int(round(raw))
+
+    @property
+    def relative_error(self) -> float:
+        """One standard error of the estimate, relative to the true count."""
+        return 1.04 / math.sqrt(len(self.registers))
+
+
+class KLLSketch:
+    """
+    KLL quantile sketch: a stack of compactors where level h holds items of
+    weight 2**h. A level over its capacity is sorted and every other item
+    (random offset) is promoted, so memory stays O(k log(n/k)) for any n.
+    Merge concatenates the levels and compacts again.
+    """
+
+    def __init__(self, k: int = KLL_K, seed: int = SKETCH_SEED):
+        self.k = k
+        self.n = 0
+        self.levels: list[np.ndarray] = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self.levels) - 1 - level
+        return max(2, int(math.ceil(self.k * (2 / 3) ** depth)))
+
+    def _compress(self) -> None:
+        # Compact lazily: only once the stack as a whole is over capacity,
+        # and then the lowest level that is over its own capacity
+        while sum(len(lvl) for lvl in self.levels) > sum(self._capacity(h) for h in range(len(self.levels))):
+            level = next(h for h, lvl in enumerate(self.levels) if len(lvl) > self._capacity(h))
+            if level + 1 == len(self.levels):
+                self.levels.append(np.empty(0))
+            items = np.sort(self.levels[level])
+            keep = items[-1:] if len(items) % 2 else items[:0]
+            items = items[:len(items) - len(keep)]
+            promoted = items[int(self._rng.integers(2))::2]
+            self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+            self.levels[level] = keep
+
+    def update(self, values: np.ndarray) -> None:
+        values = np.asarray(values, dtype="float64")
+        if not len(values):
+            return
+        self.n += len(values)
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+
+    def merge(self, other: "KLLSketch") -> None:
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.n += other.n
+        self._compress()
+
+    def _weighted(self) -> tuple[np.ndarray, np.ndarray]:
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(lvl), 2.0 ** h) for h, lvl in enumerate(self.levels)])
+        order = np.argsort(items, kind="stable")
+        return items[order], np.cumsum(weights[order])
+
+    def quantiles(self, qs) -> np.ndarray:
+        items, cumulative = self._weighted()
+        if not len(items):
+            return np.full(len(qs), np.nan)
+        targets = np.asarray(qs, dtype="float64") * cumulative[-1]
+        return items[np.minimum(np.searchsorted(cumulative, targets), len(items) - 1)]
+
+    def cdf(self, points) -> np.ndarray:
+        """Estimated fraction of values <= each point."""
+        items, cumulative = self._weighted()
+        if not len(items):
+            return np.full(len(points), np.nan)
+        at = np.searchsorted(items, np.asarray(points, dtype="float64"), side="right")
+        return np.where(at > 0, cumulative[np.maximum(at - 1, 0)], 0.0) / cumulative[-1]
+
+    @property
+    def rank_error(self) -> float:
+        """Normalized rank error at 99% confidence (the KLL constants used by Apache DataSketches)."""
+        return 2.296 / self.k ** 0.9723
+
+
+class MisraGries:
+    """
+    Heavy-hitter counts with at most `capacity` counters. Every reported
+    count is a lower bound that undercounts by at most `error`, and any value
+    more frequent than `error` is guaranteed to be kept. Chunks are folded
+    in as exact value counts; merge adds counters and trims them back.
+    """
+
+    def __init__(self, capacity: int = MG_CAPACITY):
+        self.capacity = capacity
+        self.n = 0
+        self.error = 0
+        self.counts = pd.Series(dtype="int64")
+
+    def _merge_counts(self, counts: pd.Series, error: int = 0) -> None:
+        merged = self.counts.add(counts, fill_value=0)
+        self.error += error
+        if len(merged) > self.capacity:
+            cut = np.sort(merged.to_numpy())[-(self.capacity + 1)]
+            merged = merged[merged > cut] - cut
+            self.error += int(cut)
+        self.counts = merged.astype("int64")
+
+    def update(self, values: pd.Series) -> None:
+        if not len(values):
+            return
+        self.n += len(values)
+        self._merge_counts(values.value_counts())
+
+    def merge(self, other: "MisraGries") -> None:
+        self.n += other.n
+        self._merge_counts(other.counts, other.error)
+
+    def top(self, k: int) -> pd.Series:
+        return self.counts.sort_values(ascending=False, kind="stable").iloc[:k]
+
+
+class Reservoir:
+    """
+    Uniform row sample of fixed size. Each row gets a random key and the
+    rows with the smallest keys are kept (bottom-k), which makes the sample
+    mergeable: the union of two reservoirs trimmed to the smallest keys is a
+    reservoir of the combined stream. Reservoirs built independently and
+    merged later need different seeds so their keys are independent.
+    """
+
+    def __init__(self, size: int = RESERVOIR_SIZE, seed: int = SKETCH_SEED):
+        self.size = size
+        self.n = 0
+        self.rows: pd.DataFrame | None = None
+        self._keys = np.empty(0)
+        self._rng = np.random.default_rng(seed)
+
+    def _keep(self, rows: pd.DataFrame, keys: np.ndarray) -> None:
+        if len(keys) > self.size:
+            chosen = np.argpartition(keys, self.size - 1)[:self.size]
+            rows, keys = rows.iloc[chosen], keys[chosen]
+        self.rows, self._keys = rows.reset_index(drop=True), keys
+
+    def update(self, chunk: pd.DataFrame) -> None:
+        if not len(chunk):
+            return
+        self.n += len(chunk)
+        keys = self._rng.random(len(chunk))
+        if self.rows is None:
+            self._keep(chunk, keys)
+            return
+        self._keep(pd.concat([self.rows, chunk], ignore_index=True), np.concatenate([self._keys, keys]))
+
+    def merge(self, other: "Reservoir") -> None:
+        if other.rows is None:
+            return
+        self.n += other.n
+        if self.rows is None:
+            self._keep(other.rows, other._keys)
+            return
+        self._keep(pd.concat([self.rows, other.rows], ignore_index=True), np.concatenate([self._keys, other._keys]))
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, size: int = RESERVOIR_SIZE, batch_rows: int = SKETCH_BATCH_ROWS):
+        reservoir = cls(size)
+        for start in range(0, len(df), batch_rows):
+            reservoir.update(df.iloc[start:start + batch_rows])
+        return reservoir
+
+    def proportion_margin(self) -> float:
+        """95% margin of error for any category share estimated from the sample."""
+        taken = 0 if self.rows is None else len(self.rows)
+        if not taken or taken >= self.n:
+            return 0.0
+        # Worst case p = 0.5, with the finite-population correction
+        return 1.96 * math.sqrt(0.25 / taken * (self.n - taken) / (self.n - 1))
+
+
+class ColumnSketch:
+    """
+    Mergeable summary of one column. Counts, moments, min and max are exact;
+    distinct counts (HyperLogLog), quantiles (KLL) and category frequencies
+    (Misra-Gries) are approximate with known error bounds.
+    """
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.count = 0
+        self.missing = 0
+        self.min = None
+        self.max = None
+        self.distinct = HyperLogLog()
+        self.mean = 0.0
+        # Sum of squared deviations from the running mean (Chan et al. merge)
+        self.m2 = 0.0
+        self.quantiles = KLLSketch() if kind == "numeric" else None
+        self.frequent = MisraGries() if kind == "categorical" else None
+
+    def _add_moments(self, n: int, mean: float, m2: float) -> None:
+        total = self.count + n
+        delta = mean - self.mean
+        self.m2 += m2 + delta * delta * self.count * n / total
+        self.mean += delta * n / total
+        self.count = total
+
+    def update(self, s: pd.Series) -> None:
+        present = s.dropna()
+        self.missing += len(s) - len(present)
+        if not len(present):
+            return
+        if self.kind == "numeric":
+            # Chunks of one column can parse differently; stray text counts as missing
+            values = pd.to_numeric(present, errors="coerce").to_numpy(dtype="float64")
+            self.missing += int(np.isnan(values).sum())
+            values = values[~np.isnan(values)]
+            if not len(values):
+                return
+            self._add_moments(len(values), float(values.mean()), float(((values - values.mean()) ** 2).sum()))
+            self.quantiles.update(values)
+            self.distinct.update(values)
+            low, high = values.min(), values.max()
+        else:
+            self.count += len(present)
+            if self.kind == "categorical":
+                # Labels may mix types, so categorical columns keep no min/max
+                self.frequent.update(present)
+                self.distinct.update(present.astype(str).to_numpy(dtype=object))
+                return
+            low, high = present.min(), present.max()
+        self.min = low if self.min is None else min(self.min, low)
+        self.max = high if self.max is None else max(self.max, high)
+
+    def merge(self, other: "ColumnSketch") -> None:
+        self.missing += other.missing
+        if other.count:
+            if self.kind == "numeric":
+                self._add_moments(other.count, other.mean, other.m2)
+                self.quantiles.merge(other.quantiles)
+            else:
+                self.count += other.count
+                if self.frequent is not None:
+                    self.frequent.merge(other.frequent)
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+        self.distinct.merge(other.distinct)
+
+    @property
+    def sd(self) -> float | None:
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else None
+
+
+class FrameSketch:
+    """
+    Column sketches for a whole table plus a row reservoir for plots. Column
+    kinds are decided by `kind_of` on the first non-empty chunk, so the same
+    object can be fed an in-memory frame batch by batch or a file chunk by
+    chunk, and two sketches of parts of a table merge into one of the whole.
+    """
+
+    def __init__(self, kind_of: Callable[[pd.Series], str], reservoir_size: int = RESERVOIR_SIZE):
+        self.kind_of = kind_of
+        self.rows = 0
+        self.columns: dict[str, ColumnSketch] = {}
+        self.reservoir = Reservoir(reservoir_size)
+
+    def update(self, chunk: pd.DataFrame) -> None:
+        if not len(chunk):
+            return
+        self.rows += len(chunk)
+        for col in chunk.columns:
+            if col not in self.columns:
+                self.columns[col] = ColumnSketch(self.kind_of(chunk[col]))
+            self.columns[col].update(chunk[col])
+        self.reservoir.update(chunk)
+
+    def merge(self, other: "FrameSketch") -> None:
+        self.rows += other.rows
+        for col, sketch in other.columns.items():
+            if col in self.columns:
+                self.columns[col].merge(sketch)
+            else:
+                self.columns[col] = sketch
+        self.reservoir.merge(other.reservoir)
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, kind_of: Callable[[pd.Series], str], batch_rows: int = SKETCH_BATCH_ROWS):
+        sketch = cls(kind_of)
+        for start in range(0, len(df), batch_rows):
+            sketch.update(df.iloc[start:start + batch_rows])
+        return sketch
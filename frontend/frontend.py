@@ -32,7 +32,7 @@ st.markdown(f"""
     [data-testid="stFileUploader"] section {{ background-color: #0F172A !important; border: 2px dashed #60A5FA !important; }}
     
     /* Download Buttons */
-    .stDownloadButton button {{
+    .stDownloadButton button, .stLinkButton a {{
         background-color: #60A5FA !important; color: #0F172A !important;
         font-weight: bold; width: 100%; border-radius: 8px;
     }}
@@ -79,8 +79,8 @@ st.title("🧠 AIRA")
 st.caption("Integrated AI Research Assistant | Literature • Analysis • Narrative Discussion")
 
 # --- UTILITY: RENDERER FOR VISUALS & FILES ---
-def render_research_outputs(visuals, exports, msg_idx):
-    """Displays images and download buttons using cached data and unique keys."""
+def render_research_outputs(visuals, exports, export_formats=None):
+    """Displays images from cached data and download links for every export format."""
     if visuals:
         st.markdown("### 📊 Statistical Visualizations")
         cols = st.columns(min(len(visuals), 2))
@@ -91,35 +91,30 @@ def render_research_outputs(visuals, exports, msg_idx):
                 if img_content:
                     st.image(img_content, caption=name, use_container_width=True)
 
-    if exports:
+    # Export files are built by the backend on first download, so only links
+    # are rendered here; nothing is fetched until the user clicks
+    downloads = dict(export_formats or {}) or {"excel": (exports or {}).get("excel")}
+    plots = (exports or {}).get("plots")
+    if plots:
+        downloads["plots"] = plots[0] if isinstance(plots, list) else plots
+    downloads = {key: path for key, path in downloads.items() if path}
+
+    if downloads:
         st.markdown("### 📁 Downloadable Research Assets")
-        exp_cols = st.columns(len(exports))
-        for idx, (key, path) in enumerate(exports.items()):
-            if not path: continue
-            
-            final_path = path[0] if isinstance(path, list) else path
-            file_name = os.path.basename(final_path)
-            file_url = f"{DOWNLOAD_URL}/{final_path}"
-            
+        exp_cols = st.columns(len(downloads))
+        for idx, (key, path) in enumerate(downloads.items()):
             with exp_cols[idx]:
-                # Use cached content for the download button
-                file_bytes = get_file_content(file_url)
-                if file_bytes:
-                    st.download_button(
-                        label=f"💾 Download {key.upper()}",
-                        data=file_bytes,
-                        file_name=file_name,
-                        # Unique key using message index and file name hash to prevent duplicates
-                        key=f"btn_{msg_idx}_{idx}_{hash(final_path)}"
-                    )
-                else:
-                    st.error("Failed to load asset.")
+                st.link_button(
+                    f"💾 Download {key.upper()}",
+                    f"{DOWNLOAD_URL}/{path}",
+                    use_container_width=True,
+                )
 
 # --- MAIN CHAT INTERFACE ---
-for i, msg in enumerate(st.session_state.messages):
+for msg in st.session_state.messages:
     with st.chat_message(msg["role"]):
         st.markdown(msg.get("content", ""))
-        render_research_outputs(msg.get("visuals"), msg.get("exports"), i)
+        render_research_outputs(msg.get("visuals"), msg.get("exports"), msg.get("export_formats"))
 
 # --- INPUT AREA ---
 if user_prompt := st.chat_input("How can I help with your research today?"):
@@ -140,16 +135,18 @@ if user_prompt := st.chat_input("How can I help with your research today?"):
                 content = res_data.get("content", "Analysis complete.")
                 visuals = res_data.get("visuals", {})
                 exports = res_data.get("exports", {})
+                export_formats = res_data.get("export_formats", {})
 
                 with st.chat_message("assistant"):
                     st.markdown(content)
-                    render_research_outputs(visuals, exports, len(st.session_state.messages))
+                    render_research_outputs(visuals, exports, export_formats)
 
                 st.session_state.messages.append({
                     "role": "assistant",
                     "content": content,
                     "visuals": visuals,
-                    "exports": exports
+                    "exports": exports,
+                    "export_formats": export_formats
                 })
             else:
                 st.error(f"⚠️ Backend Error: {response.text}")
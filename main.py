@@ -1,6 +1,9 @@
 from fastapi import FastAPI
 from app.api.research import router as research_router
 from app.api.download import router as download_router
+from app.services.file_service import shutdown_parse_pool
+from app.services.plan_scheduler import shutdown_cpu_pool
+from app.services import lifecycle_service
 
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -29,6 +32,16 @@ async def root():
 async def health_check():
     return {"service": "AIRA", "status": "healthy"}
 
+@app.on_event("startup")
+async def startup():
+    lifecycle_service.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await lifecycle_service.stop()
+    shutdown_parse_pool()
+    shutdown_cpu_pool()
+
 
 app.include_router(research_router)
 app.include_router(download_router)